@@ -0,0 +1,198 @@
+"""
+LanZouCloud 接口基准测试，在本地的蓝奏云替身服务器(mock_server.py)上运行，不需要网络和账号
+
+测试项目:
+    listing     获取文件列表、子文件夹列表、整个目录树
+    resolve     解析分享链接的直链(无提取码/有提取码)
+    upload      上传单个文件，使用内容索引重复上传同一个文件
+    download    单连接下载和分段下载单个文件，下载整个分享文件夹
+    session     登录、用保存的会话启动、会话过期后自动重新登录
+
+用法: python benchmark/bench_api.py [-n 次数] [--latency 毫秒] [--bandwidth MB/s] [--json 结果文件] [项目 ...]
+--fail-rate/--throttle-rate/--drop-rate 按概率注入接口 503、分页限流、下载断流，检验重试逻辑的开销
+--json 把结果保存为 json 文件，方便在 CI 中和上一次的结果比较
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from shutil import rmtree
+from time import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lanzou.api import LanZouCloud
+from lanzou.utils import dump_json
+from mock_server import MockLanZou, attach
+
+
+class Bench(object):
+    """在替身服务器上准备测试数据并记录每个测试项目的耗时"""
+
+    def __init__(self, server, args):
+        self.server = server
+        self.args = args
+        self.results = []
+        self.data = os.urandom(int(args.size * 1048576))
+        self.work_dir = tempfile.mkdtemp(prefix='lanzou_bench_')
+        self.src_path = os.path.join(self.work_dir, 'bench.bin')
+        with open(self.src_path, 'wb') as f:
+            f.write(self.data)
+
+        # 目录树: 根目录下 folders 个文件夹，每个文件夹 files 个文件
+        self.big_id = server.add_file('bench.zip', self.data)
+        self.pwd_id = server.add_file('bench_pwd.zip', self.data, pwd='ab12')
+        self.folder_ids = [server.add_folder(f'dir{i}', desc=f'folder {i}') for i in range(args.folders)]
+        for folder_id in self.folder_ids:
+            for i in range(args.files):
+                server.add_file(f'file{i}.zip', os.urandom(1024), folder_id)
+        self.small_dir = server.add_folder('small')
+        for i in range(args.files):
+            server.add_file(f'small{i}.zip', os.urandom(32 * 1024), self.small_dir)
+        self.upload_dir = server.add_folder('upload')
+
+    def client(self):
+        """新建一个指向替身服务器的客户端，不使用任何缓存"""
+        lzy = self.server.attach(LanZouCloud())
+        lzy.set_url_cache(ttl=0)
+        lzy.set_list_cache(ttl=0)
+        lzy.set_max_workers(self.args.workers)
+        if self.args.fail_rate:
+            lzy.set_transport(max_retries=5, backoff_factor=0)  # 注入 503 时由 urllib3 自动重试
+        lzy.login('bench', 'bench')
+        return lzy
+
+    def run(self, name, func, size=0):
+        """运行 func 若干次，记录平均/最短耗时、吞吐量、每次运行发出的请求数和失败次数"""
+        times = []
+        errors = 0
+        requests = self._requests()
+        for i in range(self.args.n):
+            start = time()
+            try:
+                result = func(i)
+            except Exception as e:  # 注入故障时接口可能抛出异常，记为失败继续测试
+                result = repr(e)
+            times.append(time() - start)
+            if result != LanZouCloud.SUCCESS:
+                errors += 1
+                print(f'{name}: unexpected result {result}', file=sys.stderr)
+        requests = self._requests() - requests
+        mean = sum(times) / len(times)
+        result = {'name': name, 'runs': len(times), 'mean_ms': mean * 1000, 'min_ms': min(times) * 1000,
+                  'mbps': size / 1048576 / mean if size else 0, 'requests': requests / len(times), 'errors': errors}
+        self.results.append(result)
+        mbps = f'{result["mbps"]:.1f}' if size else '-'
+        print(f'{name:<22}{result["mean_ms"]:>10.1f}{result["min_ms"]:>10.1f}{mbps:>10}{result["requests"]:>10.1f}'
+              f'{errors:>8}')
+
+    def bench_listing(self):
+        lzy = self.client()
+        folder_id = self.folder_ids[0]
+        self.run('get_file_list', lambda _: LanZouCloud.SUCCESS if lzy.get_file_list(folder_id) else -1)
+        self.run('get_dir_list', lambda _: LanZouCloud.SUCCESS if lzy.get_dir_list() else -1)
+        self.run('get_tree', lambda _: LanZouCloud.SUCCESS if len(lzy.get_tree()) > 1 else -1)
+
+    def bench_resolve(self):
+        lzy = self.client()
+        url, pwd_url = self.server.share_url(self.big_id), self.server.share_url(self.pwd_id)
+        self.run('get_direct_url', lambda _: lzy.get_direct_url(url)['code'])
+        self.run('get_direct_url(pwd)', lambda _: lzy.get_direct_url(pwd_url, 'ab12')['code'])
+
+    def bench_upload(self):
+        lzy = self.client()
+        self.run('upload_file', lambda _: lzy.upload_file(self.src_path, self.upload_dir), len(self.data))
+        lzy.set_upload_index(os.path.join(self.work_dir, 'upload_index.json'))  # 内容没变时跳过重复上传
+        self.run('upload_file(index)', lambda _: lzy.upload_file(self.src_path, self.upload_dir), len(self.data))
+        lzy.set_upload_index(None)
+
+    def bench_download(self):
+        lzy = self.client()
+        url = self.server.share_url(self.big_id)
+        self.run('download_file', lambda i: lzy.download_file(url, save_path=self._save_path('single', i)),
+                 len(self.data))
+        lzy.set_download_segments(self.args.segments)
+        self.run(f'download_file(x{self.args.segments})',
+                 lambda i: lzy.download_file(url, save_path=self._save_path('segmented', i)), len(self.data))
+        lzy.set_download_segments(1)
+        dir_url = self.server.share_url(self.small_dir, is_file=False)
+        self.run('download_dir', lambda i: lzy.download_dir(dir_url, save_path=self._save_path('dir', i)),
+                 self.args.files * 32 * 1024)
+
+    def bench_session(self):
+        store = os.path.join(self.work_dir, 'session.json')
+        self.run('login', lambda _: self.server.attach(LanZouCloud()).login('bench', 'bench'))
+        lzy = self.server.attach(LanZouCloud())
+        lzy.set_session_store(store)
+        lzy.login('bench', 'bench')
+
+        def _warm_start(_):  # 新进程用保存的会话启动
+            client = self.server.attach(LanZouCloud())
+            client.set_session_store(store)
+            return client.login('bench', 'bench')
+
+        def _expired(_):  # 会话过期后第一次获取列表
+            self.server.expire_sessions()
+            return LanZouCloud.SUCCESS if lzy.get_dir_list() else -1
+
+        self.run('login(session store)', _warm_start)
+        lzy.set_list_cache(ttl=0)
+        self.run('relogin + get_dir_list', _expired)
+
+    def check(self):
+        """检查请求出错后仍能导出指标"""
+        lzy = self.client()
+        metrics = lzy.enable_metrics()
+        assert lzy.get_dir_list()
+        attach(lzy, 'http://127.0.0.1:1')  # 连接被拒绝，status 记为 'error'
+        lzy.set_list_cache(ttl=0)
+        assert lzy.get_dir_list() == {}
+        statuses = {i['labels']['status'] for i in metrics.to_dict()['counters']['requests_total']}
+        assert statuses == {'200', 'error'}, statuses
+        assert 'status="error"' in metrics.to_prometheus()
+        assert metrics.dump_json(os.path.join(self.work_dir, 'metrics.json'))
+
+    def _requests(self):
+        """服务器收到的请求总数(不含故障计数)"""
+        return sum(v for k, v in self.server.stats.items() if k not in ('failed', 'throttled', 'dropped'))
+
+    def _save_path(self, name, index):
+        return os.path.join(self.work_dir, f'{name}{index}')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('benches', nargs='*', default=['listing', 'resolve', 'upload', 'download', 'session'],
+                            help='测试项目: listing resolve upload download session')
+    arg_parser.add_argument('-n', type=int, default=5, help='每个项目运行的次数')
+    arg_parser.add_argument('--latency', type=float, default=20, help='每个请求的延迟 ms')
+    arg_parser.add_argument('--bandwidth', type=float, default=0, help='每个连接的带宽上限 MB/s，0 表示不限速')
+    arg_parser.add_argument('--fail-rate', type=float, default=0, help='接口返回 503 的概率')
+    arg_parser.add_argument('--throttle-rate', type=float, default=0, help='分页接口要求重试的概率')
+    arg_parser.add_argument('--drop-rate', type=float, default=0, help='下载中途断开连接的概率')
+    arg_parser.add_argument('--size', type=float, default=8, help='上传/下载的文件大小 MB')
+    arg_parser.add_argument('--files', type=int, default=90, help='每个文件夹中的文件数')
+    arg_parser.add_argument('--folders', type=int, default=5, help='根目录下的文件夹数')
+    arg_parser.add_argument('--segments', type=int, default=4, help='分段下载的连接数')
+    arg_parser.add_argument('--workers', type=int, default=4, help='批量下载的线程数')
+    arg_parser.add_argument('--json', help='保存结果的 json 文件')
+    args = arg_parser.parse_args()
+
+    server = MockLanZou(latency=args.latency / 1000, bandwidth=args.bandwidth * 1048576, fail_rate=args.fail_rate,
+                        throttle_rate=args.throttle_rate, drop_rate=args.drop_rate)
+    with server:
+        bench = Bench(server, args)
+        try:
+            bench.check()
+            print(f'{"bench":<22}{"mean ms":>10}{"min ms":>10}{"MB/s":>10}{"req/op":>10}{"errors":>8}')
+            for name in args.benches:
+                getattr(bench, 'bench_' + name)()
+        finally:
+            rmtree(bench.work_dir, ignore_errors=True)
+    if args.json:
+        dump_json(args.json, {'config': vars(args), 'results': bench.results, 'server_stats': dict(server.stats)})
+
+
+if __name__ == '__main__':
+    main()
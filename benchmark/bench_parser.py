@@ -0,0 +1,156 @@
+"""
+网页解析微基准测试: 对比旧的解析方式(先删除注释再逐个 re.findall)和 lanzou.parser
+
+用法: python benchmark/bench_parser.py [-n 次数] [--pad 填充倍数]
+--pad 在网页头部插入若干段常见的 css/js 代码，使网页大小接近蓝奏云的真实页面
+"""
+
+import argparse
+import os
+import re
+import sys
+from timeit import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lanzou import parser
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+PADDING = '''<style type="text/css">
+body{font-family:"Microsoft YaHei",Arial;margin:0;padding:0;background:#f5f5f5;}
+.d{width:960px;margin:0 auto;}.d2{padding:20px;}.p7{color:#999;}
+</style>
+<!--<script type="text/javascript" src="https://pc.woozooo.com/js/old.js"></script>-->
+<script type="text/javascript">
+// 统计代码
+var _hmt = _hmt || [];
+(function() {
+  var hm = document.createElement("script");
+  hm.src = "https://hm.baidu.com/hm.js?0000000000";
+  var s = document.getElementsByTagName("script")[0];
+  s.parentNode.insertBefore(hm, s);
+})();
+</script>
+'''
+
+
+def load(name, pad=0):
+    with open(os.path.join(FIXTURES, name), encoding='utf8') as f:
+        html = f.read()
+    return html.replace('</head>', PADDING * pad + '</head>', 1)
+
+
+# ---- 旧的解析方式 ----
+
+def remove_notes(html):
+    return re.sub(r'<!--.*?-->|//.*?\n', '', html)
+
+
+def legacy_file_page(html):
+    html = remove_notes(html)
+    para = re.findall(r'<iframe.*?src="(.*?)"', html)[0]
+    file_name = re.findall(r"<div style.+>([^<]+)</div>\n<div class=\"d2\">|filename = '(.*?)';", html)[0]
+    f_size = re.findall(r'文件大小：</span>([\.0-9 MKBmkbGg]+)<br', html)[0]
+    f_time = re.findall(r'上传时间：</span>([-0-9 月天小时分钟秒前]+)<br', html)[0]
+    f_desc = re.findall(r'文件描述：</span><br>([^<]+)</td>', html)[0].strip()
+    return para, file_name[0] or file_name[1], f_size, f_time, f_desc
+
+
+def legacy_pwd_page(html):
+    html = remove_notes(html)
+    post_str = re.findall(r"[^/]data\s:\s'(.*)'", html)[0]
+    f_size = re.findall(r'class="n_filesize">[^<]*([\.0-9 MKBmkbGg]+)<div', html)[0]
+    f_time = re.findall(r'class="n_file_infos">([-0-9]+)<div', html)[0]
+    f_desc = re.findall(r'class="n_box_des">(.*)<div', html)[0]
+    return post_str, f_size, f_time, f_desc
+
+
+def legacy_sign_page(html):
+    html = remove_notes(html)
+    post_data = re.findall(r'data\s:\s(.*),', html)[0]
+    try:
+        return eval(post_data)
+    except NameError:
+        var_sg = re.search(r"var sg\s*=\s*'(.*)'", html).group(1)
+        return eval(post_data.replace('sg', f"'{var_sg}'"))
+
+
+def legacy_folder_page(html):
+    html = remove_notes(html)
+    lx = re.findall(r"'lx':'?(\d)'?,", html)[0]
+    t = re.findall(r"var [0-9a-z]{6} = '(\d{10})';", html)[0]
+    k = re.findall(r"var [0-9a-z]{6} = '([0-9a-z]{15,})';", html)[0]
+    fid = re.findall(r"'fid':'?(\d+)'?,", html)[0]
+    desc = re.findall(r'id="filename">([^<]+)</span', html)
+    return {'lx': lx, 'k': k, 't': t, 'fid': fid}, desc[0] if desc else ''
+
+
+def legacy_dir_list(html):
+    info = re.findall(r'&nbsp;(.+?)</a>&nbsp;.+"folk(\d+)"(.*?)>.+#BBBBBB">\[?(.*?)\.+\]?</font>', html)
+    return {name: {'id': int(fid), 'name': name.replace('&amp;', '&'), 'has_pwd': True if pwd_flag else False,
+                   'desc': desc} for name, fid, pwd_flag, desc in info}
+
+
+CASES = [
+    ('file_page.html', legacy_file_page, parser.parse_file_page),
+    ('file_pwd_page.html', legacy_pwd_page, parser.parse_pwd_page),
+    ('sign_page.html', legacy_sign_page, parser.parse_sign_form),
+    ('sign_page_sg.html', legacy_sign_page, parser.parse_sign_form),
+    ('folder_page.html', legacy_folder_page, parser.parse_folder_page),
+    ('mydisk_page.html', legacy_dir_list, parser.parse_dir_list),
+]
+
+
+def check():
+    """检查新的解析结果是否正确"""
+    page = parser.parse_file_page(load('file_page.html'))
+    assert page == {'para': '/fn?AGYAPQ5mV2RTWwBiUGUBcAFnBTVSbQ', 'name': 'demo.zip', 'size': '12.3 M',
+                    'time': '3 天前', 'desc': '演示文件'}, page
+    page = parser.parse_pwd_page(load('file_pwd_page.html'), '1234')
+    assert page == {'post_data': {'action': 'downprocess', 'sign': 'AGYAPQ5mV2RTWwBiUGUBcAFnBTVSbQ_c_c', 'p': '1234'},
+                    'size': '2.5 M', 'time': '2020-02-02', 'desc': '演示描述'}, page
+    form = parser.parse_sign_form(load('sign_page.html'))
+    assert form == {'action': 'downprocess', 'sign': 'AGYAPQ5mV2RTWwBiUGUBcAFnBTVSbQ_c_c', 'ves': 1}, form
+    form = parser.parse_sign_form(load('sign_page_sg.html'))
+    assert form == {'action': 'downprocess', 'sign': 'UDZRaQ9nVmVXXwdlBjMCcwo8BTdTagFnBzE_c', 'ves': 1}, form
+    form = parser.parse_sign_form(load('sign_page_vars.html'))
+    assert form == {'action': 'downprocess', 'sign': 'BmQHPwk_bUmdTXAJhAzQAcQ08BDQEPwJkBzM_c', 'ves': 2,
+                    'websign': '', 'websignkey': 'ZdFt', 'p': 1.5, 'ismob': False}, form
+    try:
+        parser.parse_sign_form(load('sign_page_evil.html'))  # 网页中的代码不能被执行
+        raise AssertionError('malicious payload should be rejected')
+    except (ValueError, IndexError):
+        pass
+    assert parser.parse_js_object("{'a': 1, b: x}", "var x = 'y';") == {'a': 1, 'b': 'y'}
+    assert parser.parse_js_object('{}') == {}
+    form = parser.parse_folder_page(load('folder_page.html'))
+    assert form == ({'lx': '2', 'k': '0c1fc1a5fe5db8d4c4b5f8a6ea9d13c3', 't': '1583000000', 'fid': '1234567'},
+                    '演示文件夹的描述'), form
+    html = load('mydisk_page.html')
+    dirs = parser.parse_dir_list(html)
+    assert len(dirs) == 60 and dirs['文件夹0']['has_pwd'] and dirs['文件夹1']['id'] == 2000001, dirs
+    path = parser.parse_full_path(html, 1)
+    assert path == {'LanZouCloud': -1, '上级': 1999998, '父文件夹': 1999999, '当前文件夹': 1}, path
+    dirs, files = parser.parse_recycle(load('recycle_page.html'))
+    assert len(dirs) == 30 and len(files) == 30 and files['demo1.zip'] == 3000001, (dirs, files)
+    assert parser.parse_formhash(load('recycle_page.html')) == 'a1b2c3d4'
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-n', type=int, default=2000, help='每个网页解析的次数')
+    arg_parser.add_argument('--pad', type=int, default=20, help='网页头部填充的代码段数')
+    args = arg_parser.parse_args()
+
+    check()
+    print(f'{"page":<20}{"size":>10}{"legacy us":>12}{"parser us":>12}{"speedup":>10}')
+    for name, legacy, new in CASES:
+        html = load(name, args.pad)
+        old_time = timeit(lambda: legacy(html), number=args.n) / args.n * 1e6
+        new_time = timeit(lambda: new(html), number=args.n) / args.n * 1e6
+        print(f'{name:<20}{len(html):>10}{old_time:>12.1f}{new_time:>12.1f}{old_time / new_time:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
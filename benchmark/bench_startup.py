@@ -0,0 +1,86 @@
+"""
+lanzou 的启动开销基准测试，每次运行都启动一个新的解释器，测量冷启动的耗时
+
+测试项目:
+    import          import lanzou.api 的耗时和新加载的模块数
+    construct       创建 LanZouCloud 对象
+    first_request   第一次获取直链(在本地的蓝奏云替身服务器上，包括建立连接和请求中才导入的模块)
+    total           从开始导入到拿到直链的总耗时
+
+用法: python benchmark/bench_startup.py [-n 次数] [--latency 毫秒] [--json 结果文件]
+--json 把结果保存为 json 文件，方便在 CI 中和上一次的结果比较
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lanzou.utils import dump_json
+from mock_server import MockLanZou
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 在子进程中运行，结果以 json 输出到 stdout
+CHILD = '''
+import json
+import sys
+from time import perf_counter
+
+modules = len(sys.modules)
+start = perf_counter()
+from lanzou.api import LanZouCloud
+imported = perf_counter()
+modules = len(sys.modules) - modules
+lzy = LanZouCloud()
+constructed = perf_counter()
+
+sys.path.insert(0, sys.argv[1])
+from mock_server import attach
+attach(lzy, sys.argv[2])
+ready = perf_counter()
+code = lzy.get_direct_url(sys.argv[3])['code']
+done = perf_counter()
+print(json.dumps({'import': imported - start, 'construct': constructed - imported, 'first_request': done - ready,
+                  'total': done - ready + constructed - start, 'modules': modules, 'code': code}))
+'''
+
+
+def run_child(server, url):
+    """在新的解释器中运行一次，返回各阶段的耗时"""
+    output = subprocess.check_output([sys.executable, '-c', CHILD, os.path.join(ROOT, 'benchmark'), server.url, url],
+                                     cwd=ROOT)
+    return json.loads(output.decode())
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('-n', type=int, default=10, help='启动的次数')
+    arg_parser.add_argument('--latency', type=float, default=0, help='每个请求的延迟 ms')
+    arg_parser.add_argument('--json', help='保存结果的 json 文件')
+    args = arg_parser.parse_args()
+
+    with MockLanZou(latency=args.latency / 1000) as server:
+        url = server.share_url(server.add_file('startup.zip', os.urandom(1024)))
+        runs = [run_child(server, url) for _ in range(args.n)]
+
+    errors = sum(1 for r in runs if r['code'] != 0)
+    results = []
+    print(f'{"bench":<16}{"mean ms":>10}{"min ms":>10}')
+    for name in ('import', 'construct', 'first_request', 'total'):
+        times = [r[name] for r in runs]
+        result = {'name': name, 'runs': len(times), 'mean_ms': sum(times) / len(times) * 1000,
+                  'min_ms': min(times) * 1000}
+        results.append(result)
+        print(f'{name:<16}{result["mean_ms"]:>10.1f}{result["min_ms"]:>10.1f}')
+    print(f'modules loaded by import: {runs[0]["modules"]}, errors: {errors}')
+    if args.json:
+        dump_json(args.json, {'config': vars(args), 'results': results, 'modules': runs[0]['modules'],
+                              'errors': errors})
+
+
+if __name__ == '__main__':
+    main()
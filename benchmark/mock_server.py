@@ -0,0 +1,474 @@
+"""
+本地的蓝奏云替身服务器，用于离线测试和基准测试
+
+模拟了 account.php、doupload.php、fileup.php、mydisk.php、ajaxm.php、filemoreajax.php、
+文件(夹)分享页面、下载页面(iframe)和直链的 302 跳转，返回的网页和 json 与蓝奏云的格式一致
+可以设置每个请求的延迟、每个连接的带宽上限，以及按概率注入的故障:
+    fail_rate       接口返回 503
+    throttle_rate   分页接口返回 "请刷新，重试"
+    drop_rate       下载到一半时断开连接
+控制台接口(doupload.php、fileup.php、mydisk.php)需要登录后的会话 cookie，expire_sessions() 模拟会话过期
+
+用法:
+    with MockLanZou(latency=0.02, bandwidth=10 * 1048576) as server:
+        lzy = LanZouCloud()
+        server.attach(lzy)  # 把 lzy 的接口地址指向本地服务器
+        fid = server.add_file('demo.zip', b'data')
+        lzy.download_file(server.share_url(fid))
+"""
+
+import json
+import os
+import random
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+from urllib.parse import parse_qs, urlparse
+
+__all__ = ['MockLanZou', 'attach']
+
+
+def attach(client, url):
+    """把 LanZouCloud 对象的接口地址指向 url 上的替身服务器(可以在另一个进程中)"""
+    client._host_url = url
+    client._doupload_url = url + '/doupload.php'
+    client._account_url = url + '/account.php'
+    client._mydisk_url = url + '/mydisk.php'
+    client._upload_url = url + '/fileup.php'
+    client.is_file_url = lambda share_url: re.fullmatch(re.escape(url) + r'/i[a-z0-9]{6,}/?', share_url) is not None
+    client.is_folder_url = lambda share_url: re.fullmatch(re.escape(url) + r'/b[a-z0-9]{7,}/?', share_url) is not None
+    return client
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 保持连接，和蓝奏云一样可以复用连接
+    disable_nagle_algorithm = True  # 响应头和响应体分开发送，不关闭 Nagle 算法每个响应都会多等待 40ms
+    block_size = 65536  # 限速时每次读写的字节数
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def _send(self, code, body=b'', content_type='text/html; charset=utf-8', headers=()):
+        if isinstance(body, str):
+            body = body.encode('utf8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self._write(body)
+
+    def _json(self, obj):
+        self._send(200, json.dumps(obj, ensure_ascii=False))
+
+    def _write(self, data):
+        """按带宽上限发送数据"""
+        bandwidth = self.mock.bandwidth
+        if not bandwidth:
+            self.wfile.write(data)
+            return
+        start = time()
+        for pos in range(0, len(data), self.block_size):
+            self.wfile.write(data[pos:pos + self.block_size])
+            delay = start + (pos + self.block_size) / bandwidth - time()
+            if delay > 0:
+                sleep(delay)
+
+    def _read(self, size):
+        """按带宽上限读取请求体"""
+        bandwidth = self.mock.bandwidth
+        if not bandwidth:
+            return self.rfile.read(size)
+        start = time()
+        chunks = []
+        received = 0
+        while received < size:
+            chunk = self.rfile.read(min(self.block_size, size - received))
+            if not chunk:
+                break
+            chunks.append(chunk)
+            received += len(chunk)
+            delay = start + received / bandwidth - time()
+            if delay > 0:
+                sleep(delay)
+        return b''.join(chunks)
+
+    def _form(self):
+        """读取 POST 表单，上传的文件为 (文件名, 内容)"""
+        body = self._read(int(self.headers.get('Content-Length', 0)))
+        content_type = self.headers.get('Content-Type', '')
+        match = re.search(r'boundary=(.+)', content_type)
+        if match is None:
+            return {k: v[0] for k, v in parse_qs(body.decode('utf8')).items()}
+        form = {}
+        for part in body.split(b'--' + match.group(1).encode())[1:-1]:
+            head, _, value = part[2:-2].partition(b'\r\n\r\n')  # 去掉首尾的 \r\n
+            head = head.decode('utf8')
+            name = re.search(r'name="(.*?)"', head).group(1)
+            file_name = re.search(r'filename="(.*?)"', head)
+            form[name] = (file_name.group(1), value) if file_name else value.decode('utf8')
+        return form
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        form = self._form() if method == 'POST' else {k: v[0] for k, v in parse_qs(url.query).items()}
+        endpoint = self.mock.endpoint(url.path)
+        self.mock.count(endpoint)
+        if self.mock.latency:
+            sleep(self.mock.latency)
+        if self.mock.inject('fail_rate'):
+            self.mock.count('failed')
+            return self._send(503, 'Service Unavailable')
+        handler = getattr(self.mock, 'on_' + endpoint, None)
+        if handler is None:
+            return self._send(404, 'Not Found')
+        if endpoint in ('doupload', 'fileup', 'mydisk') and not self.mock.logged_in(self):
+            self.mock.count('login_required')
+            if endpoint == 'mydisk':  # 网页跳转到登录页面，接口返回 zt=9
+                return self._send(302, '', headers=[('Location', self.mock.url + '/account.php')])
+            return self._json({'zt': 9, 'info': '请登录'})
+        return handler(self, method, url, form)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class MockLanZou(object):
+    """本地的蓝奏云替身服务器，网盘内容保存在内存中"""
+    PAGE_SIZE = 18  # 文件列表每页的数量，和蓝奏云一致
+
+    def __init__(self, latency=0, bandwidth=0, fail_rate=0, throttle_rate=0, drop_rate=0, seed=0):
+        self.latency = latency  # 每个请求的延迟 s
+        self.bandwidth = bandwidth  # 每个连接的带宽上限 bytes/s，0 表示不限速
+        self.fail_rate = fail_rate
+        self.throttle_rate = throttle_rate
+        self.drop_rate = drop_rate
+        self.page_size = MockLanZou.PAGE_SIZE
+        self.stats = Counter()  # 各接口收到的请求数，以及注入的故障数
+        self._random = random.Random(seed)  # 固定随机种子，每次运行注入的故障相同
+        self._lock = threading.Lock()
+        self._files = {}  # id: {'name', 'data', 'folder_id', 'pwd', 'desc'}
+        self._folders = {-1: {'name': 'LanZouCloud', 'parent_id': None, 'pwd': '', 'desc': ''}}
+        self._next_id = 10000
+        self._sessions = set()  # 已登录的会话 cookie
+        self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """在后台线程中启动服务器，监听随机端口"""
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self._server.server_port}'
+
+    def attach(self, client):
+        """把 LanZouCloud 对象的接口地址指向本地服务器"""
+        return attach(client, self.url)
+
+    # ---- 网盘内容 ----
+
+    def add_file(self, name, data, folder_id=-1, pwd='', desc=''):
+        """添加文件，返回文件 id"""
+        with self._lock:
+            self._next_id += 1
+            self._files[self._next_id] = {'name': name, 'data': data, 'folder_id': folder_id, 'pwd': pwd,
+                                          'desc': desc}
+            return self._next_id
+
+    def add_folder(self, name, parent_id=-1, pwd='', desc=''):
+        """添加文件夹，返回文件夹 id"""
+        with self._lock:
+            self._next_id += 1
+            self._folders[self._next_id] = {'name': name, 'parent_id': parent_id, 'pwd': pwd, 'desc': desc}
+            return self._next_id
+
+    def get_file(self, file_id):
+        return self._files.get(file_id)
+
+    def list_files(self, folder_id=-1):
+        """文件夹中的文件 [(id, 文件信息)]"""
+        with self._lock:
+            return [(fid, f) for fid, f in sorted(self._files.items()) if f['folder_id'] == folder_id]
+
+    def list_folders(self, folder_id=-1):
+        """文件夹中的子文件夹 [(id, 文件夹信息)]"""
+        with self._lock:
+            return [(fid, f) for fid, f in sorted(self._folders.items()) if f['parent_id'] == folder_id]
+
+    def share_url(self, fid, is_file=True):
+        """文件(夹)的分享链接"""
+        return f'{self.url}/{"i" if is_file else "b"}{fid:08d}'
+
+    # ---- 会话 ----
+
+    def logged_in(self, handler):
+        """请求是否带有已登录的会话 cookie"""
+        match = re.search(r'phpdisk_info=(\w+)', handler.headers.get('Cookie', ''))
+        with self._lock:
+            return match is not None and match.group(1) in self._sessions
+
+    def expire_sessions(self):
+        """让所有会话失效，模拟登录过期"""
+        with self._lock:
+            self._sessions.clear()
+
+    # ---- 请求处理 ----
+
+    def inject(self, kind):
+        """按 fail_rate/throttle_rate/drop_rate 的概率决定是否注入故障"""
+        rate = getattr(self, kind)
+        if not rate:
+            return False
+        with self._lock:
+            return self._random.random() < rate
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    @staticmethod
+    def endpoint(path):
+        """请求路径对应的接口名"""
+        if path.endswith('.php'):
+            return path[1:-4]
+        match = re.fullmatch(r'/(fn|file|data|i|b)[/0-9]*', path)
+        return {'i': 'file_share', 'b': 'folder_share', 'fn': 'sign_page', 'file': 'redirect',
+                'data': 'data'}[match.group(1)] if match else 'unknown'
+
+    def _page(self, items, page):
+        page = int(page)
+        return items[(page - 1) * self.page_size:page * self.page_size]
+
+    def on_account(self, handler, method, url, form):
+        if method == 'POST':
+            if form.get('formhash') != 'a1b2c3d4' or not form.get('username'):
+                return handler._send(200, '<p>登录失败</p>')
+            token = os.urandom(8).hex()
+            with self._lock:
+                self._sessions.add(token)
+            return handler._send(200, '<p>登录成功，欢迎回来</p>',
+                                 headers=[('Set-Cookie', f'phpdisk_info={token}; path=/')])
+        if 'action=logout' in url.query:
+            match = re.search(r'phpdisk_info=(\w+)', handler.headers.get('Cookie', ''))
+            with self._lock:
+                self._sessions.discard(match.group(1) if match else None)
+            return handler._send(200, '<p>退出系统成功</p>')
+        return handler._send(200, '<form method="post"><input type="hidden" name="formhash" value="a1b2c3d4" />')
+
+    def on_mydisk(self, handler, method, url, form):
+        folder_id = int(form.get('folder_id', -1))
+        path = []
+        fid = folder_id
+        while fid is not None and fid in self._folders and fid != -1:
+            path.append((fid, self._folders[fid]['name']))
+            fid = self._folders[fid]['parent_id']
+        lines = ['<div class="mydisk_file_bar">']
+        for fid, name in reversed(path[1:]):
+            lines.append(f'&raquo;&nbsp;<a href="mydisk.php?item=files&action=index&folder_id={fid}">'
+                         f'<img src="/images/folder.gif" />&nbsp;{name}</a>')
+        if path:
+            lines.append(f'&raquo;&nbsp;<span class="current">&nbsp;{path[0][1]} <font color="#BBBBBB">(0)</font></div>')
+        else:
+            lines.append('</div>')
+        for fid, f in self.list_folders(folder_id):
+            lines.append(f'<tr><td><a href="mydisk.php?item=files&action=index&folder_node=1&folder_id={fid}">'
+                         f'<img src="/images/folder.gif" align="absmiddle" border="0" />&nbsp;{f["name"]}</a>&nbsp;'
+                         f'<span class="folk" id="folk{fid}"{" style=display:initial" if f["pwd"] else ""}>[密]</span>'
+                         f'<font color="#BBBBBB">[{f["desc"]}...]</font></td></tr>')
+        return handler._send(200, '\n'.join(lines))
+
+    def on_doupload(self, handler, method, url, form):
+        task = int(form.get('task', 0))
+        if task == 5:  # 文件列表
+            items = self._page(self.list_files(int(form['folder_id'])), form['pg'])
+            return handler._json({'zt': 1, 'info': 1 if items else 0, 'text': [{
+                'id': str(fid), 'name_all': f['name'], 'size': f'{len(f["data"]) / 1024:.1f} K',
+                'time': '2020-03-01', 'downs': '0', 'onof': '1' if f['pwd'] else '0', 'is_des': '1' if f['desc'] else '0'
+            } for fid, f in items]})
+        if task == 6:  # 删除文件
+            with self._lock:
+                self._files.pop(int(form['file_id']), None)
+            return handler._json({'zt': 1, 'info': '已删除'})
+        if task == 3:  # 删除文件夹
+            with self._lock:
+                self._folders.pop(int(form['folder_id']), None)
+            return handler._json({'zt': 1, 'info': '删除成功'})
+        if task == 22:  # 文件分享信息
+            f = self._files.get(int(form['file_id']))
+            if f is None:
+                return handler._json({'zt': 1, 'info': {'pwd': '', 'onof': '0', 'f_id': 'i', 'is_newd': self.url}})
+            return handler._json({'zt': 1, 'info': {'pwd': f['pwd'] or 'ab12', 'onof': '1' if f['pwd'] else '0',
+                                                    'f_id': f'i{int(form["file_id"]):08d}', 'is_newd': self.url}})
+        if task == 18:  # 文件夹分享信息
+            folder_id = int(form['folder_id'])
+            f = self._folders.get(folder_id, {'name': '', 'pwd': ''})
+            return handler._json({'zt': 1, 'info': {'name': f['name'], 'pwd': f['pwd'] or 'ab12',
+                                                    'onof': '1' if f['pwd'] else '0',
+                                                    'new_url': self.share_url(folder_id, is_file=False)}})
+        if task in (23, 16):  # 设置提取码
+            target = self._files if task == 23 else self._folders
+            f = target.get(int(form['file_id' if task == 23 else 'folder_id']))
+            if f is not None:
+                f['pwd'] = form.get('shownames', '') if form.get('shows') == '1' else ''
+            return handler._json({'zt': 1, 'info': '设置成功'})
+        if task == 2:  # 创建文件夹
+            self.add_folder(form['folder_name'], int(form['parent_id']), desc=form.get('folder_description', ''))
+            return handler._json({'zt': 1, 'info': '创建成功', 'text': None})
+        if task == 19:  # 全部文件夹，新建的文件夹在最后
+            return handler._json({'zt': 1, 'info': [{'folder_name': f['name'], 'folder_id': str(fid)}
+                                                    for fid, f in sorted(self._folders.items()) if fid != -1]})
+        if task == 20:  # 移动文件
+            f = self._files.get(int(form['file_id']))
+            if f is None:
+                return handler._json({'zt': 0, 'info': '移动失败'})
+            f['folder_id'] = int(form['folder_id'])
+            return handler._json({'zt': 1, 'info': '移动成功'})
+        if task == 4:  # 修改文件夹
+            f = self._folders.get(int(form['folder_id']))
+            if f is not None:
+                f['name'], f['desc'] = form['folder_name'], form.get('folder_description', '')
+            return handler._json({'zt': 1, 'info': '修改成功'})
+        return handler._json({'zt': 0, 'info': '未知操作'})
+
+    def on_fileup(self, handler, method, url, form):
+        file_name, data = form['upload_file']
+        fid = self.add_file(form['name'], data, int(form['folder_id']))
+        return handler._json({'zt': 1, 'info': '上传成功', 'text': [{
+            'id': str(fid), 'name_all': form['name'], 'size': f'{len(data) / 1024:.1f} K', 'time': '0 秒前'}]})
+
+    def on_file_share(self, handler, method, url, form):
+        f = self._files.get(int(url.path[2:].strip('/')))
+        if f is None:
+            return handler._send(200, '<div class="off"><div class="off0">来晚啦...文件取消分享了</div></div>')
+        fid = int(url.path[2:].strip('/'))
+        size = f'{len(f["data"]) / 1048576:.1f} M'
+        if f['pwd']:
+            return handler._send(200, f'''<html><head><title>{f["name"]}</title></head><body>
+<div class="passwdinput">输入密码</div>
+<div class="n_filesize">大小：{size}<div><span class="n_file_infos">2020-03-01<div>
+<div class="n_box_des">{f["desc"]}<div>
+<script type="text/javascript">
+function down_p(){{
+//data : 'action=downprocess&sign=OLD&p='+pwd,
+$.ajax({{ type : 'post', url : '/ajaxm.php',
+data : 'action=downprocess&sign=S{fid}&p='+pwd,
+}});}}
+</script></body></html>''')
+        return handler._send(200, f'''<html><head><title>{f["name"]}</title></head><body>
+<div style="font-size: 30px;text-align: center;padding: 56px 0px 20px 0px;">{f["name"]}</div>
+<div class="d2"><iframe class="ifr2" name="1" src="/fn?S{fid}" frameborder="0" scrolling="no"></iframe>
+<table><tr><td><span class="p7">文件大小：</span>{size}<br>
+<span class="p7">上传时间：</span>2020-03-01<br>
+<span class="p7">文件描述：</span><br>{f["desc"]} </td></tr></table></div></body></html>''')
+
+    def on_sign_page(self, handler, method, url, form):
+        return handler._send(200, f'''<html><body><script type="text/javascript">
+var sg = '{url.query}';
+//data : {{ 'action':'downprocess','sign':'OLD','ves':1 }},
+$.ajax({{ type : 'post', url : '/ajaxm.php',
+data : {{ 'action':'downprocess','sign':sg,'ves':1 }},
+}});</script></body></html>''')
+
+    def on_ajaxm(self, handler, method, url, form):
+        fid = int(form.get('sign', 'S0')[1:])
+        f = self._files.get(fid)
+        if f is None:
+            return handler._json({'zt': 0, 'inf': '文件取消分享了'})
+        if f['pwd'] and form.get('p') != f['pwd']:
+            return handler._json({'zt': 0, 'inf': '密码不正确'})
+        return handler._json({'zt': 1, 'dom': self.url, 'url': f'?{fid}', 'inf': f['name'] if f['pwd'] else 0})
+
+    def on_redirect(self, handler, method, url, form):
+        return handler._send(302, '', headers=[('Location', f'{self.url}/data/{url.query}')])
+
+    def on_data(self, handler, method, url, form):
+        fid = int(url.path[len('/data/'):])
+        f = self._files.get(fid)
+        if f is None:
+            return handler._send(404, 'Not Found')
+        data = f['data']
+        etag = f'"{fid:x}-{len(data):x}"'
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', handler.headers.get('Range', ''))
+        if match is None:
+            code, start, end, headers = 200, 0, len(data) - 1, []
+        else:
+            start = int(match.group(1))
+            end = min(int(match.group(2)), len(data) - 1) if match.group(2) else len(data) - 1
+            code, headers = 206, [('Content-Range', f'bytes {start}-{end}/{len(data)}')]
+        body = data[start:end + 1]
+        handler.send_response(code)
+        handler.send_header('Content-Type', 'application/octet-stream')
+        handler.send_header('Content-Length', str(len(body)))
+        handler.send_header('Accept-Ranges', 'bytes')
+        handler.send_header('ETag', etag)
+        for key, value in headers:
+            handler.send_header(key, value)
+        handler.end_headers()
+        if len(body) > 1 and self.inject('drop_rate'):  # 只发送一半就断开连接
+            self.count('dropped')
+            handler._write(body[:len(body) // 2])
+            handler.wfile.flush()
+            handler.close_connection = True
+            return
+        handler._write(body)
+
+    def on_folder_share(self, handler, method, url, form):
+        fid = int(url.path[2:].strip('/'))
+        f = self._folders.get(fid)
+        if f is None or fid == -1:
+            return handler._send(200, '<div class="off"><div class="off0">文件不存在，或已删除</div></div>')
+        pwd_box = '<div id="pwdload">请输入密码</div>' if f['pwd'] else ''
+        return handler._send(200, f'''<html><head><title>{f["name"]}</title></head><body>
+{pwd_box}<div class="user-title"><span id="filename">{f["desc"]}</span></div>
+<script type="text/javascript">
+var ib7v0i = '1583000000';
+var h3m0vz = '{fid:032x}';
+function more(){{
+$.ajax({{ type : 'post', url : '/filemoreajax.php',
+data : {{ 'lx':2, 'fid':{fid}, 'uid':'1', 'pg':pgs, 'rep':'0', 't':ib7v0i, 'k':h3m0vz, 'up':1, }},
+}});}}
+</script></body></html>''')
+
+    def on_filemoreajax(self, handler, method, url, form):
+        fid = int(form['fid'])
+        f = self._folders.get(fid)
+        if f is None:
+            return handler._json({'zt': 0, 'info': '文件夹不存在', 'text': None})
+        if f['pwd'] and form.get('pwd') != f['pwd']:
+            return handler._json({'zt': 3, 'info': '密码不正确', 'text': None})
+        if self.inject('throttle_rate'):
+            self.count('throttled')
+            return handler._json({'zt': 4, 'info': '请刷新，重试', 'text': None})
+        items = self._page(self.list_files(fid), form['pg'])
+        if not items:
+            return handler._json({'zt': 2, 'info': '没有了', 'text': None})
+        return handler._json({'zt': 1, 'info': 'sucess', 'text': [{
+            'id': f'i{i:08d}', 'name_all': item['name'], 'size': f'{len(item["data"]) / 1048576:.1f} M',
+            'time': '2020-03-01', 'icon': 'zip'} for i, item in items]})
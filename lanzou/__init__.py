@@ -1 +1 @@
-__all__ = ['api']
+__all__ = ['api', 'aio', 'metrics', 'parser', 'pool', 'tree', 'utils']
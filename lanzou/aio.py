@@ -0,0 +1,516 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import re
+import tempfile
+from random import sample
+
+from lanzou import parser
+from lanzou.api import LanZouCloud, _PageError
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp 是可选依赖, pip install lanzou-api[async]
+    aiohttp = None
+
+__all__ = ['AsyncLanZouCloud']
+
+logger = logging.getLogger('lanzou')
+
+
+class _ProgressReader(io.BufferedReader):
+    """读取文件时报告已读取的字节数"""
+
+    def __init__(self, raw, on_read):
+        super().__init__(raw)
+        self._on_read = on_read
+        self._bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        if data:
+            self._bytes_read += len(data)
+            self._on_read(self._bytes_read)
+        return data
+
+
+class AsyncLanZouCloud(object):
+    """基于 asyncio 的蓝奏云客户端，方法与 LanZouCloud 同名，均为协程"""
+    FAILED = LanZouCloud.FAILED
+    SUCCESS = LanZouCloud.SUCCESS
+    ID_ERROR = LanZouCloud.ID_ERROR
+    PASSWORD_ERROR = LanZouCloud.PASSWORD_ERROR
+    LACK_PASSWORD = LanZouCloud.LACK_PASSWORD
+    ZIP_ERROR = LanZouCloud.ZIP_ERROR
+    MKDIR_ERROR = LanZouCloud.MKDIR_ERROR
+    URL_INVALID = LanZouCloud.URL_INVALID
+    FILE_CANCELLED = LanZouCloud.FILE_CANCELLED
+
+    def __init__(self, max_concurrency=64):
+        if aiohttp is None:
+            raise ImportError('AsyncLanZouCloud requires aiohttp, run: pip install lanzou-api[async]')
+        self._lz = LanZouCloud()  # 复用同步客户端的配置、页面解析和直链缓存，不使用它的网络请求
+        self._max_concurrency = max_concurrency  # 同时进行的请求数上限
+        self._session = None  # 所有请求共用一个连接池，在事件循环中首次请求时创建
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """关闭连接池"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._semaphore = None
+
+    def set_rar_tool(self, bin_path):
+        """设置解压工具路径"""
+        return self._lz.set_rar_tool(bin_path)
+
+    def set_download_buffer(self, chunk_size=1048576, preallocate=True):
+        """设置下载时每次读取的最大字节数和是否预先分配文件的磁盘空间"""
+        return self._lz.set_download_buffer(chunk_size, preallocate)
+
+    def set_progress_interval(self, min_bytes=1048576, interval=0.5):
+        """设置下载进度回调函数的频率"""
+        return self._lz.set_progress_interval(min_bytes, interval)
+
+    def set_max_concurrency(self, num):
+        """设置同时进行的请求数上限(在第一个请求之前设置)"""
+        if isinstance(num, int) and num > 0 and self._session is None:
+            self._max_concurrency = num
+            return LanZouCloud.SUCCESS
+        else:
+            return LanZouCloud.FAILED
+
+    def is_file_url(self, share_url):
+        """判断是否为文件的分享链接"""
+        return self._lz.is_file_url(share_url)
+
+    def is_folder_url(self, share_url):
+        """判断是否为文件夹的分享链接"""
+        return self._lz.is_folder_url(share_url)
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._max_concurrency, ssl=False)
+            policy = self._lz._timeout
+            timeout = aiohttp.ClientTimeout(sock_connect=policy.connect, sock_read=policy.read)
+            self._session = aiohttp.ClientSession(connector=connector, headers=self._lz._headers, timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._session
+
+    def _stream_timeout(self):
+        """上传/下载文件时的超时设置"""
+        policy = self._lz._timeout
+        return aiohttp.ClientTimeout(total=policy.total, sock_connect=policy.connect, sock_read=policy.stall)
+
+    async def _request(self, method, url, **kwargs):
+        """发送请求并读取完整的响应体，和同步客户端共用流量控制"""
+        session = self._get_session()
+        flow = self._lz._flow_for(url)
+        wait_time = flow.try_acquire()
+        while wait_time is None:  # 并发数达到上限，等待其他请求结束
+            await asyncio.sleep(0.05)
+            wait_time = flow.try_acquire()
+        if wait_time > 0:
+            await asyncio.sleep(wait_time)
+        try:
+            async with self._semaphore:
+                async with session.request(method, url, **kwargs) as resp:
+                    await resp.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            flow.release(congested=isinstance(e, asyncio.TimeoutError))
+            raise
+        except BaseException:
+            flow.release()
+            raise
+        flow.release(congested=resp.status == 429 or resp.status >= 500)
+        return resp
+
+    async def _get_text(self, url, **kwargs):
+        resp = await self._request('GET', url, **kwargs)
+        return await resp.text()
+
+    async def _post_json(self, url, data, **kwargs):
+        resp = await self._request('POST', url, data=data, **kwargs)
+        return await resp.json(content_type=None)  # 蓝奏云返回 json 时 Content-Type 是 text/html
+
+    async def login(self, username, passwd):
+        """登录蓝奏云控制台"""
+        login_data = {"action": "login", "task": "login", "username": username, "password": passwd}
+        try:
+            index = await self._get_text(self._lz._account_url)
+            login_data['formhash'] = parser.parse_formhash(index)
+            resp = await self._request('POST', self._lz._account_url, data=login_data)
+            return LanZouCloud.SUCCESS if '登录成功' in await resp.text() else LanZouCloud.FAILED
+        except (aiohttp.ClientError, asyncio.TimeoutError, IndexError):
+            return LanZouCloud.FAILED
+
+    async def delete(self, fid, is_file=True):
+        """把网盘的文件、无子文件夹的文件夹放到回收站"""
+        if is_file:
+            post_data = {'task': 6, 'file_id': fid}
+        else:
+            post_data = {'task': 3, 'folder_id': fid}
+        try:
+            result = await self._post_json(self._lz._doupload_url, post_data)
+            self._lz._url_cache.pop(('share_info', fid, is_file))
+            return LanZouCloud.SUCCESS if int(result['zt']) == 1 else LanZouCloud.FAILED
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return LanZouCloud.FAILED
+
+    async def _iter_pages(self, fetch, url):
+        """按页码顺序逐页返回列表数据(异步生成器)，后面的页面并发预取，遇到空页停止"""
+        # 和同步客户端的 _iter_pages 相同: fetch(page) 协程返回该页的数据列表，空列表表示没有更多页面，
+        # None 表示服务器要求稍后重试该页，这时指数退避并减少预取的页数，请求成功后逐步恢复
+        max_window = self._lz._page_window
+        window = max_window
+        delay = 0
+        page = next_page = 1
+        tasks = {}
+        try:
+            while True:
+                while len(tasks) < window:
+                    tasks[next_page] = asyncio.ensure_future(fetch(next_page))
+                    next_page += 1
+                items = await tasks.pop(page)
+                if items is None:
+                    delay = min(max(delay * 2, 0.5), 8)
+                    window = max(window // 2, 1)
+                    logger.debug(f'Page {page} is throttled, retry after {delay}s, window: {window}')
+                    self._lz._flow_for(url).throttle()  # 只减慢这个接口
+                    await asyncio.sleep(delay)
+                    tasks[page] = asyncio.ensure_future(fetch(page))
+                    continue
+                if not items:
+                    break  # 已经拿到全部页面
+                delay /= 2
+                window = min(window + 1, max_window)
+                yield items
+                page += 1
+        finally:
+            for task in tasks.values():  # 丢弃多余的预取请求
+                if task.done() and not task.cancelled():
+                    task.exception()  # 取出已经失败的预取请求的异常，避免 asyncio 警告异常没有被处理
+                task.cancel()
+
+    async def get_file_list(self, folder_id=-1):
+        """获取文件列表"""
+
+        async def _fetch(page):
+            result = await self._post_json(self._lz._doupload_url, {'task': 5, 'folder_id': folder_id, 'pg': page})
+            return result['text'] if result['info'] == 1 else []  # info 不为 1 时已经拿到全部文件的信息
+
+        file_list = {}
+        async for items in self._iter_pages(_fetch, self._lz._doupload_url):
+            for i in items:
+                info = self._lz._parse_file_item(i)
+                file_list[info['name']] = info
+        return file_list
+
+    async def get_dir_list(self, folder_id=-1):
+        """获取子文件夹信息信息列表"""
+        try:
+            url = self._lz._mydisk_url + '?item=files&action=index&folder_node=1&folder_id=' + str(folder_id)
+            return parser.parse_dir_list(await self._get_text(url))
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return {}
+
+    async def set_share_passwd(self, fid, passwd='', is_file=True):
+        """设置网盘文件的提取码"""
+        passwd_status = 0 if passwd == '' else 1  # 是否开启密码
+        if is_file:
+            post_data = {"task": 23, "file_id": fid, "shows": passwd_status, "shownames": passwd}
+        else:
+            post_data = {"task": 16, "folder_id": fid, "shows": passwd_status, "shownames": passwd}
+        try:
+            result = await self._post_json(self._lz._doupload_url, post_data)
+            self._lz._url_cache.pop(('share_info', fid, is_file))
+            return LanZouCloud.SUCCESS if result['info'] == '设置成功' else LanZouCloud.FAILED
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return LanZouCloud.FAILED
+
+    async def mkdir(self, parent_id, folder_name, description=''):
+        """创建文件夹(同时设置描述)"""
+        folder_name = re.sub(r'\s', '_', folder_name)  # 文件夹不能包含空白字符
+        folder_name = re.sub(r'[#$%^!*<>)(+=`\'\"/:;,?]', '', folder_name)  # 去除非法字符
+        folder_list = await self.get_dir_list(parent_id)
+        if folder_name in folder_list.keys():
+            return folder_list[folder_name]['id']
+        post_data = {"task": 2, "parent_id": parent_id or -1, "folder_name": folder_name,
+                     "folder_description": description}
+        try:
+            logger.debug(f'Mkdir "{folder_name}" in parent folder ID#{parent_id}')
+            result = await self._post_json(self._lz._doupload_url, post_data)  # 创建文件夹
+            if result['zt'] != 1:
+                logger.debug(f'Mkdir failed, info: {result}')
+                return LanZouCloud.MKDIR_ERROR  # 创建失败
+            all_dir = await self._post_json(self._lz._doupload_url, {"task": 19, "file_id": 0})  # 获取ID
+            return int(all_dir['info'][-1]['folder_id'])
+        except (aiohttp.ClientError, asyncio.TimeoutError, IndexError):
+            return LanZouCloud.MKDIR_ERROR
+
+    async def get_direct_url(self, share_url, pwd=''):
+        """获取直链"""
+        if not self.is_file_url(share_url):  # 非文件链接返回错误
+            return {'code': LanZouCloud.URL_INVALID, 'name': '', 'direct_url': ''}
+
+        cache_key = ('direct_url', share_url, pwd)
+        cached = self._lz._url_cache.get(cache_key)
+        if cached is not None:
+            return {'code': LanZouCloud.SUCCESS, 'name': cached['name'], 'direct_url': cached['direct_url']}
+
+        host_url = self._lz._host_url
+        html = await self._get_text(share_url)
+        if '文件取消' in html:
+            return {'code': LanZouCloud.FILE_CANCELLED, 'name': '', 'direct_url': ''}
+        if '输入密码' in html:  # 文件设置了提取码时
+            if len(pwd) == 0:
+                return {'code': LanZouCloud.LACK_PASSWORD, 'name': '', 'direct_url': ''}
+            post_data = parser.parse_pwd_page(html, pwd)['post_data']
+            link_info = await self._post_json(host_url + '/ajaxm.php', post_data)
+        else:  # 无提取码时
+            info = parser.parse_file_page(html)
+            html = await self._get_text(host_url + info['para'])
+            post_data = parser.parse_sign_form(html)
+            link_info = await self._post_json(host_url + '/ajaxm.php', post_data)
+            link_info['inf'] = info['name']  # 无提取码时 inf 字段为 0，有提取码时该字段为文件名
+        if link_info['zt'] != 1:
+            return {'code': LanZouCloud.PASSWORD_ERROR, 'name': '', 'direct_url': ''}
+        fake_url = link_info['dom'] + '/file/' + link_info['url']  # 假直连，存在流量异常检测
+        resp = await self._request('GET', fake_url, allow_redirects=False)
+        direct_url = resp.headers['Location']  # 重定向后的真直链
+        self._lz._url_cache.set(cache_key, {'name': link_info['inf'], 'direct_url': direct_url})
+        return {'code': LanZouCloud.SUCCESS, 'name': link_info['inf'], 'direct_url': direct_url}
+
+    async def download_file(self, share_url, pwd='', save_path='.', call_back=None):
+        """通过分享链接下载文件(需提取码)"""
+        if not self.is_file_url(share_url):
+            return LanZouCloud.URL_INVALID
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)
+        call_back = self._lz._progress(call_back, 'download')
+        for retry in range(self._lz._max_retries + 1):
+            if retry > 0:
+                logger.debug(f'Download interrupted, retry {retry}/{self._lz._max_retries}: {share_url}')
+                self._lz._url_cache.pop(('direct_url', share_url, pwd))  # 缓存的直链可能已经失效
+            try:
+                info = await self.get_direct_url(share_url, pwd)
+            except (aiohttp.ClientError, asyncio.TimeoutError, IndexError, KeyError, ValueError):
+                continue
+            if info['code'] == LanZouCloud.FAILED:  # 网络错误或服务器繁忙，重试
+                continue
+            if info['code'] != LanZouCloud.SUCCESS:
+                return info['code']
+            if info['name'].endswith(self._lz._guise_suffix):  # 删除伪装后缀名
+                info['name'] = info['name'].replace(self._lz._guise_suffix, '')
+            file_path = save_path + os.sep + info['name']
+            if await self._get_file(info['direct_url'], file_path, call_back) == LanZouCloud.SUCCESS:
+                return LanZouCloud.SUCCESS
+        return LanZouCloud.FAILED
+
+    async def _get_file(self, direct_url, file_path, call_back=None):
+        """下载直链指向的文件，断点记录与 LanZouCloud 通用"""
+        file_name = os.path.basename(file_path)
+        part_path = file_path + '.part'
+        record = self._lz._load_part_record(file_path)
+        offset = record.get('offset', 0)
+        session = self._get_session()
+        headers = {'Range': f'bytes={offset}-'} if offset > 0 else {}
+        async with self._semaphore:
+            try:
+                async with session.get(direct_url, headers=headers, timeout=self._stream_timeout()) as resp:
+                    etag = resp.headers.get('ETag', '')
+                    content_range = re.fullmatch(r'bytes (\d+)-\d+/(\d+)', resp.headers.get('Content-Range', ''))
+                    if offset > 0 and (resp.status != 206 or content_range is None
+                                       or int(content_range.group(1)) != offset
+                                       or int(content_range.group(2)) != record.get('size')
+                                       or etag != record.get('etag', '')):
+                        logger.debug(f'Can not resume {file_path} from {offset}, download from the beginning')
+                        if os.path.exists(part_path):
+                            os.remove(part_path)
+                        return LanZouCloud.FAILED  # 由 download_file 重试时从头下载
+                    if resp.status not in (200, 206):
+                        return LanZouCloud.FAILED
+                    total_size = offset + int(resp.headers['Content-Length'])
+                    now_size = offset
+                    try:
+                        with open(file_path, 'r+b' if offset > 0 else 'wb') as f:
+                            f.seek(offset)
+                            f.truncate()
+                            self._lz._allocate(f.fileno(), offset, total_size - offset)
+                            async for chunk in resp.content.iter_chunked(self._lz._chunk_size):
+                                f.write(chunk)
+                                now_size += len(chunk)
+                                if call_back is not None:
+                                    call_back(file_name, total_size, now_size)
+                    finally:
+                        if now_size < total_size:
+                            with open(part_path, 'w') as part:
+                                json.dump({'size': total_size, 'etag': etag, 'offset': now_size}, part)
+            except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, ValueError):
+                return LanZouCloud.FAILED
+        if now_size < total_size:
+            return LanZouCloud.FAILED
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return LanZouCloud.SUCCESS
+
+    async def get_shared_folder_url_info(self, share_url, dir_pwd=""):
+        """获取 文件夹 分享链接的详细信息"""
+        infos = {}
+        if self.is_file_url(share_url):
+            return {"code": LanZouCloud.URL_INVALID, "info": infos}
+        try:
+            html = await self._get_text(share_url)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return {"code": LanZouCloud.FAILED, "info": infos}
+        if "文件不存在" in html:
+            return {"code": LanZouCloud.FILE_CANCELLED, "info": infos}
+        form, desc = parser.parse_folder_page(html)
+        if "请输入密码" in html:
+            if len(dir_pwd) == 0:
+                return {"code": LanZouCloud.LACK_PASSWORD, "info": infos}
+            form["pwd"] = dir_pwd
+        url = self._lz._host_url + "/filemoreajax.php"
+
+        async def _fetch(page):
+            r = await self._post_json(url, {**form, "pg": page})
+            if r["info"] == "没有了": return []  # 已经拿到全部的文件信息
+            if r["info"] == "请刷新，重试": return None  # 也可以使用 r["zt"] == 4, 请求太频繁了
+            if r["zt"] == 3: raise _PageError(LanZouCloud.PASSWORD_ERROR)
+            if r["zt"] != 1: raise _PageError(LanZouCloud.FAILED)
+            return r["text"]
+
+        try:
+            async for items in self._iter_pages(_fetch, url):
+                for f in items:
+                    infos[f["name_all"]] = {
+                        'name': f["name_all"],
+                        'time': f["time"],  # 上传时间
+                        'size': f["size"],  # 文件大小
+                        'pwd': dir_pwd,     # 文件夹的提取码
+                        'des': desc,        # 文件夹的描述
+                        'share_url': self._lz._host_url + "/" + f["id"]
+                    }
+        except _PageError as e:
+            return {"code": e.code, "info": infos}
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return {"code": LanZouCloud.FAILED, "info": infos}
+        return {"code": LanZouCloud.SUCCESS, "info": infos}
+
+    async def download_dir(self, share_url, dir_pwd='', save_path='./down', call_back=None, dir_call_back=None):
+        """通过分享链接下载文件夹"""
+        result = await self.get_shared_folder_url_info(share_url, dir_pwd)
+        if result['code'] != LanZouCloud.SUCCESS:
+            return result['code']
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)
+        file_list = sorted(result['info'].keys())
+        finished = []
+
+        async def _download(name):
+            code = await self.download_file(result['info'][name]['share_url'], '', save_path, call_back)
+            finished.append(name)
+            if dir_call_back is not None:
+                dir_call_back(name, code, len(finished), len(file_list))
+            return code
+
+        codes = await asyncio.gather(*[_download(name) for name in file_list])
+        if any(code != LanZouCloud.SUCCESS for code in codes):
+            return LanZouCloud.FAILED
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, self._lz._restore_file, file_list, save_path)  # 合并分卷、解压都是阻塞操作
+
+    async def _upload_a_file(self, file_path, folder_id=-1, call_back=None):
+        """上传文件到蓝奏云上指定的文件夹(默认根目录)"""
+        if not os.path.exists(file_path):
+            return LanZouCloud.FAILED
+        file_name = re.sub(r'\s', '_', os.path.basename(file_path))  # 从文件路径截取文件名，去除空白字符(Linux文件名限制)
+        file_list, dir_list = await asyncio.gather(self.get_file_list(folder_id), self.get_dir_list(folder_id))
+        tmp_list = {k: v['id'] for k, v in {**file_list, **dir_list}.items()}
+        if file_name in tmp_list.keys():
+            await self.delete(tmp_list[file_name])  # 文件已经存在就删除
+        file_name = self._lz._upload_name(file_name)
+        show_name = file_name.replace(self._lz._guise_suffix, '') if file_name.endswith(self._lz._guise_suffix) \
+            else file_name  # 让回调函数里不显示伪装后缀名
+        logger.debug(f'Upload file {file_path} to folder ID#{folder_id} as "{file_name}"')
+
+        loop = asyncio.get_event_loop()
+        total_size = os.path.getsize(file_path)
+        report = self._lz._progress(call_back, 'upload')
+
+        def _on_read(bytes_read):  # aiohttp 在线程池中读取文件，把进度转交给事件循环中的回调函数
+            if report is not None:
+                loop.call_soon_threadsafe(report, show_name, total_size, bytes_read)
+
+        try:
+            with _ProgressReader(io.FileIO(file_path, 'rb'), _on_read) as f:
+                form = aiohttp.FormData()
+                form.add_field('task', '1')
+                form.add_field('folder_id', str(folder_id))
+                form.add_field('id', 'WU_FILE_0')
+                form.add_field('name', file_name)
+                form.add_field('upload_file', f, filename=file_name, content_type='application/octet-stream')
+                result = await self._post_json(self._lz._upload_url, form, timeout=self._stream_timeout())
+            if result["zt"] == 0: return LanZouCloud.FAILED  # 上传失败
+            file_id = result["text"][0]["id"]
+            if result['text'][0]['name_all'].startswith(self._lz._fake_file_prefix):
+                await self.delete(file_id)  # “假文件”上传后立刻删除
+            else:
+                await self.set_share_passwd(file_id)  # 正常的文件上传后默认关闭提取码
+            return LanZouCloud.SUCCESS
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, IndexError):
+            return LanZouCloud.FAILED
+
+    async def upload_file(self, file_path, folder_id=-1, call_back=None):
+        """分卷压缩上传"""
+        lz = self._lz
+        if os.path.getsize(file_path) <= lz._max_size * 1048576:
+            return await self._upload_a_file(file_path, folder_id, call_back)
+
+        # 超过 100MB 的文件，分卷压缩后上传
+        if lz._rar_path is None: return LanZouCloud.ZIP_ERROR
+        file_name = file_path.split(os.sep)[-1].split('.')  # 文件名去掉无后缀，用作分卷文件的名字
+        file_name = file_name[0] if len(file_name) == 1 else '.'.join(file_name[:-1])  # 处理没有后缀的文件
+        if not os.path.exists('./tmp'): os.mkdir('./tmp')  # 本地保存分卷文件的临时文件夹
+        work_dir = tempfile.mkdtemp(dir='./tmp')  # 每个文件使用单独的文件夹，允许同时上传多个大文件
+        command = [lz._rar_path, 'a', '-m0', f'-v{lz._max_size}m', '-ep', '-y', '-rr5%',
+                   work_dir + os.sep + file_name, file_path]
+        try:
+            logger.debug(f'rar command: {command}')
+            proc = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.DEVNULL,
+                                                        stderr=asyncio.subprocess.DEVNULL)
+            await proc.wait()
+        except OSError:
+            lz._remove_work_dir(work_dir)
+            return LanZouCloud.ZIP_ERROR
+        volume_pattern = re.compile(re.escape(file_name) + r'\.part(\d+)\.rar')
+        file_list = [volume for _, volume in sorted((int(m.group(1)), m.group(0))
+                                                    for m in map(volume_pattern.fullmatch, os.listdir(work_dir)) if m)]
+        if proc.returncode != 0 or len(file_list) == 0:
+            lz._remove_work_dir(work_dir)
+            return LanZouCloud.ZIP_ERROR
+
+        dir_id = await self.mkdir(folder_id, file_name, '分卷压缩文件')
+        if dir_id == LanZouCloud.MKDIR_ERROR:  # 创建文件夹失败就退出
+            lz._remove_work_dir(work_dir)
+            return LanZouCloud.MKDIR_ERROR
+        for f in file_list:
+            # 蓝奏云禁止用户连续上传 100M 的文件，每个分卷之前先上传一个“假文件”
+            temp_file = work_dir + os.sep + lz._fake_file_prefix + ''.join(sample('abcdefg12345', 6)) + '.txt'
+            with open(temp_file, 'w') as t_f:
+                t_f.write('FUCK LanZouCloud')
+            await self._upload_a_file(temp_file, dir_id)
+            if await self._upload_a_file(work_dir + os.sep + f, dir_id, call_back) == LanZouCloud.FAILED:
+                lz._remove_work_dir(work_dir)
+                return LanZouCloud.FAILED
+        lz._remove_work_dir(work_dir)
+        return LanZouCloud.SUCCESS
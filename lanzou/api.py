@@ -1,26 +1,102 @@
+import functools
+import io
+import json
 import logging
 import os
 import re
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from random import sample
-from shutil import rmtree
-from time import sleep
+from shutil import copyfileobj, rmtree
+from time import sleep, time
+from urllib.parse import urlparse
 
-import requests
-from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
-from urllib3 import disable_warnings
-from urllib3.exceptions import InsecureRequestWarning
+from lanzou import parser
+from lanzou.utils import TTLCache, RateLimiter, FlowController, TimeoutPolicy, TransferProgress, FileSlice, HashReader, LazyModule, load_json, dump_json, file_hash
 
-__all__ = ['LanZouCloud']
+# requests 和 urllib3 导入较慢(约 200 个模块)，第一次发送请求时才导入，只用到解析函数时不必等待
+requests = LazyModule('requests')
 
-# 调试日志设置
+__all__ = ['LanZouCloud', 'enable_log']
+
+# 调试日志设置，导入时不添加输出，需要时调用 enable_log 或由使用者自行配置 logging
 logger = logging.getLogger('lanzou')
-logger.setLevel(logging.ERROR)
-formatter = logging.Formatter(
-    fmt="%(asctime)s [line:%(lineno)d] %(funcName)s %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S")
-console = logging.StreamHandler()
-console.setFormatter(formatter)
-logger.addHandler(console)
+logger.addHandler(logging.NullHandler())
+
+def enable_log(level=logging.DEBUG):
+    """在控制台输出 lanzou 的日志"""
+    if not any(isinstance(h, logging.StreamHandler) for h in logger.handlers):
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(
+            fmt="%(asctime)s [line:%(lineno)d] %(funcName)s %(levelname)s - %(message)s",
+            datefmt="%Y-%m-%d %H:%M:%S"))
+        logger.addHandler(console)
+    logger.setLevel(level)
+
+
+class _PageError(Exception):
+    """分页获取列表时服务器返回了错误，code 为对应的状态码"""
+
+    def __init__(self, code):
+        super().__init__(code)
+        self.code = code
+
+
+@functools.lru_cache(maxsize=None)
+def _adapter_class():
+    """创建会话时才定义 HTTPAdapter 的子类，避免导入本模块时就导入 requests"""
+    from requests.adapters import HTTPAdapter
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class _HTTPSPool(HTTPSConnectionPool):
+        """不发出 InsecureRequestWarning 的 HTTPS 连接池"""
+
+        # 本库的请求都不验证证书(verify=False)，警告只在本库的连接池中去掉，不添加全局的 warnings 过滤规则，
+        # 同一进程中其他代码不验证证书的请求照常警告
+        def _validate_conn(self, conn):
+            HTTPConnectionPool._validate_conn(self, conn)  # 跳过 HTTPSConnectionPool 中发出警告的部分
+            if getattr(conn, 'sock', None) is None:  # 和 urllib3 一样提前建立连接
+                conn.connect()
+
+    def _quiet(manager):
+        """让 PoolManager 创建的 HTTPS 连接池(包括跳转后的 CDN 主机)使用 _HTTPSPool，SOCKS 代理等自定义的连接池不变"""
+        if manager.pool_classes_by_scheme.get('https') is HTTPSConnectionPool:
+            manager.pool_classes_by_scheme = dict(manager.pool_classes_by_scheme, https=_HTTPSPool)
+        return manager
+
+    class _Adapter(HTTPAdapter):
+        """发送请求体时每次读取 block_size 字节的 HTTPAdapter"""
+
+        # httplib 默认每次读取 8KB 就发送一次，上传大文件时读取和回调的次数太多，CPU 占用高
+        def __init__(self, block_size=1048576, **kwargs):
+            self._block_size = block_size
+            super().__init__(**kwargs)
+
+        def init_poolmanager(self, *args, **kwargs):
+            kwargs['blocksize'] = self._block_size
+            super().init_poolmanager(*args, **kwargs)
+            _quiet(self.poolmanager)
+
+        def proxy_manager_for(self, proxy, **proxy_kwargs):
+            return _quiet(super().proxy_manager_for(proxy, **proxy_kwargs))
+
+    return _Adapter
+
+
+def _traced(name):
+    """把方法的执行记录为名为 name 的计时区间"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            with self._span(name):
+                return func(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
 
 
 class LanZouCloud(object):
@@ -35,29 +111,218 @@ class LanZouCloud(object):
     FILE_CANCELLED = 7
 
     def __init__(self):
-        self._session = requests.Session()
+        self._http = None  # requests 会话，第一次发送请求时才创建，见 _session
+        self._transport_lock = threading.Lock()
+        self._transport_config = {}  # 连接池设置，见 set_transport
         self._guise_suffix = '.dll'  # 不支持的文件伪装后缀
         self._fake_file_prefix = '__fake__'  # 假文件前缀
         self._rar_part_name = 'wtf'  # rar 分卷文件后缀 *.wtf01.rar
-        self._timeout = 2000  # 每个请求的超时 ms(不包含下载响应体的用时)
+        self._volume_part_name = 'lzv'  # 内置分卷文件后缀 *.lzv001of003
+        self._split_mode = None  # 大文件分卷方式: 'rar' 分卷压缩, 'stream' 直接切分原文件, None 时设置了 rar 工具就用 rar
+        self._manifest_name = '.lanzou_manifest.json'  # 增量同步时保存在本地文件夹中的文件清单
+        self._upload_index = None  # 已上传文件的内容索引，见 set_upload_index
+        self._index_path = None  # 内容索引的保存路径
+        self._index_lock = threading.Lock()  # 修改内容索引时加锁
+        self._session_path = None  # 保存会话 cookie 的文件，见 set_session_store
+        self._credentials = None  # 登录成功的账号密码，会话失效时用来自动重新登录
+        self._login_lock = threading.Lock()
+        self._login_epoch = 0  # 登录成功的次数，多个线程同时发现会话失效时只重新登录一次
+        self._timeout = TimeoutPolicy()  # 网络请求的超时设置
+        self._local = threading.local()  # 线程内临时修改的超时设置和正在执行的计时区间
+        self._hooks = {'request': [], 'response': [], 'span': [], 'transfer': [], 'retry': [],
+                       'progress': []}  # 监控钩子函数
         self._max_size = 100  # 单个文件大小上限 MB
         self._rar_path = None  # 解压工具路径
+        self._max_workers = 1  # 批量上传/下载时的最大线程数
+        self._max_retries = 3  # 下载中断后重新获取直链并断点续传的次数
+        self._download_segments = 1  # 单个文件分段下载的连接数，1 表示不分段
+        self._chunk_size = 1048576  # 下载时每次读取的最大字节数
+        self._preallocate = True  # 下载前预先分配文件的磁盘空间
+        self._progress_bytes = 1048576  # 每传输多少字节调用一次进度回调函数
+        self._progress_interval = 0.5  # 或者每隔多少秒调用一次
+        self._page_window = 4  # 分页获取列表时最多同时预取的页数
+        self._batch_limiter = RateLimiter(10)  # 批量操作每秒最多发出的请求数
+        self._batch_workers = 8  # 批量操作默认的线程数，和批量上传/下载的 _max_workers 分开设置
+        self._flow_config = (0, 32, 1)  # 流量控制的速率上限、并发数上限和速率下限，见 set_flow_control
+        self._flows = {}  # 各主机各接口的自适应流量控制 {'主机/接口': FlowController}
+        self._flow_lock = threading.Lock()
+        self._url_cache = TTLCache(max_size=1024, ttl=600)  # 缓存直链和分享信息，避免重复解析
+        self._list_cache = TTLCache(max_size=256, ttl=300)  # 缓存文件夹的文件和子文件夹列表，上传时避免重复获取
+        self._list_lock = threading.Lock()  # 修改缓存的列表时加锁
         self._host_url = 'https://www.lanzous.com'
         self._doupload_url = 'https://pc.woozooo.com/doupload.php'
         self._account_url = 'https://pc.woozooo.com/account.php'
         self._mydisk_url = 'https://pc.woozooo.com/mydisk.php'
+        self._upload_url = 'http://pc.woozooo.com/fileup.php'
         self._headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/75.0.3770.100 Safari/537.36',
             'Referer': 'https://www.lanzous.com',
             'Accept-Language': 'zh-CN,zh;q=0.9',  # 提取直连必需设置这个，否则拿不到数据
         }
-        disable_warnings(InsecureRequestWarning)  # 全局禁用 SSL 警告
+        self.set_transport()
+
+    @property
+    def _session(self):
+        """所有请求共用的 requests 会话，第一次使用时才导入 requests 并创建"""
+        if self._http is None:
+            with self._transport_lock:
+                if self._http is None:
+                    session = requests.Session()
+                    self._mount(session)
+                    self._http = session
+        return self._http
 
     def _get(self, url, **kwargs):
-        return self._session.get(url, headers=self._headers, verify=False, timeout=self._timeout, **kwargs)
+        return self._request('GET', url, **kwargs)
 
     def _post(self, url, data, **kwargs):
-        return self._session.post(url, data=data, headers=self._headers, verify=False, timeout=self._timeout, **kwargs)
+        return self._request('POST', url, data=data, **kwargs)
+
+    def _request(self, method, url, **kwargs):
+        """发送请求，会话失效时重新登录后再发送一次"""
+        epoch = self._login_epoch
+        resp = self._send(method, url, **kwargs)
+        # 只有请求体可以重新发送的请求才能重试，上传文件的请求体是只能读一遍的流
+        if self._credentials is not None and isinstance(kwargs.get('data'), (dict, type(None))) \
+                and self._auth_failed(url, resp, kwargs.get('stream')) and self._relogin(epoch):
+            self._emit('retry', self._current_span(), 'auth')
+            resp = self._send(method, url, **kwargs)
+        return resp
+
+    def _send(self, method, url, **kwargs):
+        """发送请求，并通知监控钩子"""
+        kwargs.setdefault('headers', self._headers)
+        kwargs.setdefault('timeout', self._get_timeout().request)
+        op = self._current_span()
+        self._emit('request', method, url, op)
+        flow = self._flow_for(url)
+        flow.acquire()  # 流式请求只在收到响应头之前占用并发名额
+        start = time()
+        try:
+            resp = self._session.request(method, url, verify=False, **kwargs)
+        except requests.RequestException as e:
+            flow.release(congested=isinstance(e, requests.Timeout))
+            self._emit('response', method, url, op, None, time() - start, e)
+            raise
+        except BaseException:
+            flow.release()
+            raise
+        retries = getattr(getattr(resp.raw, 'retries', None), 'history', ())  # urllib3 自动重试过说明服务器不稳定
+        flow.release(congested=resp.status_code == 429 or resp.status_code >= 500 or bool(retries))
+        self._emit('response', method, url, op, resp.status_code, time() - start, None)
+        if self._hooks['retry']:
+            for _ in retries:
+                self._emit('retry', op, 'http')  # urllib3 自动重试的次数
+        if self._hooks['transfer'] and not kwargs.get('stream'):
+            self._emit('transfer', op, 'download', len(resp.content))
+        return resp
+
+    def add_hook(self, event, func):
+        """添加监控钩子函数，event 可选值及 func 的参数:
+        'request': func(method, url, op) 发出请求前
+        'response': func(method, url, op, status, elapsed, error) 收到响应或请求出错后，出错时 status 为 None
+        'span': func(name, elapsed, error) 一个操作(如获取直链、上传一个文件)结束后
+        'transfer': func(op, direction, size) 上传/下载 size 字节后，direction 为 'upload' 或 'download'
+        'retry': func(op, reason) 重试一次请求时
+        'progress': func(op, file_name, total_size, now_size, rate, eta) 上传/下载进度，按 set_progress_interval 限制频率，
+                    rate 为速度 bytes/s，eta 为预计剩余时间 s(未知时为 None)
+        op 为发出请求时所在的操作名，不在任何操作中时为 'other'"""
+        if event not in self._hooks or not callable(func):
+            return LanZouCloud.FAILED
+        self._hooks[event].append(func)
+        return LanZouCloud.SUCCESS
+
+    def remove_hook(self, event, func):
+        """删除监控钩子函数"""
+        if func not in self._hooks.get(event, []):
+            return LanZouCloud.FAILED
+        self._hooks[event].remove(func)
+        return LanZouCloud.SUCCESS
+
+    def enable_metrics(self, collector=None):
+        """启用内置的指标收集器，返回 MetricsCollector，可以导出为 json 或 Prometheus 格式"""
+        from lanzou.metrics import MetricsCollector
+        collector = collector or MetricsCollector()
+        self.add_hook('response', collector.on_response)
+        self.add_hook('span', collector.on_span)
+        self.add_hook('transfer', collector.on_transfer)
+        self.add_hook('retry', collector.on_retry)
+        return collector
+
+    def _emit(self, event, *args):
+        """调用监控钩子函数，钩子函数出错不影响正常的操作"""
+        for func in self._hooks[event]:
+            try:
+                func(*args)
+            except Exception as e:
+                logger.debug(f'Hook {func} for {event} failed: {e}')
+
+    def _current_span(self):
+        """当前线程正在执行的操作名"""
+        spans = getattr(self._local, 'spans', None)
+        return spans[-1] if spans else 'other'
+
+    @contextmanager
+    def _span(self, name):
+        """记录一个操作的用时"""
+        if not hasattr(self._local, 'spans'):
+            self._local.spans = []
+        self._local.spans.append(name)
+        start = time()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._local.spans.pop()
+            if self._hooks['span']:
+                self._emit('span', name, time() - start, error)
+
+    def _progress(self, call_back, op):
+        """为一次上传/下载创建进度回调函数，按 set_progress_interval 限制频率，同时通知 'progress' 钩子"""
+        # 每次传输单独记录进度，多个线程可以同时用一个客户端上传/下载
+        if call_back is None and not self._hooks['progress']:
+            return None
+        progress = TransferProgress(self._progress_bytes, self._progress_interval)
+
+        def _report(file_name, total_size, now_size):
+            if not progress.update(total_size, now_size):
+                return
+            if call_back is not None:
+                call_back(file_name, total_size, now_size)
+            if self._hooks['progress']:
+                self._emit('progress', op, file_name, total_size, now_size, progress.rate, progress.eta)
+
+        return _report
+
+    def _get_timeout(self):
+        """获取当前线程生效的超时设置"""
+        return getattr(self._local, 'timeout', None) or self._timeout
+
+    @contextmanager
+    def timeout(self, policy=None, **kwargs):
+        """在 with 语句中临时修改当前线程的超时设置，如 with lzy.timeout(total=600): lzy.upload_file(...)"""
+        # 批量上传/下载等内部使用的线程沿用调用线程的设置
+        old = getattr(self._local, 'timeout', None)
+        self._local.timeout = (policy or self._get_timeout()).replace(**kwargs)
+        try:
+            yield self._local.timeout
+        finally:
+            self._local.timeout = old
+
+    def _with_context(self, func):
+        """让 func 在其他线程中执行时沿用当前线程的超时设置和操作名"""
+        policy = self._get_timeout()
+        span = self._current_span()
+
+        def wrapper(*args, **kwargs):
+            with self.timeout(policy):
+                self._local.spans = [] if span == 'other' else [span]
+                return func(*args, **kwargs)
+
+        return wrapper
 
     def is_file_url(self, share_url):
         """判断是否为文件的分享链接"""
@@ -73,7 +338,7 @@ class LanZouCloud(object):
         """删除网页的注释"""
         # 去掉 html 里面的 // 和 <!-- --> 注释，防止干扰正则匹配提取数据
         # 蓝奏云的前端程序员喜欢改完代码就把原来的代码注释掉,就直接推到生产环境了 =_=
-        return re.sub(r'<!--.*?-->|//.*?\n', '', html)
+        return parser.remove_notes(html)
 
     def set_rar_tool(self, bin_path):
         """设置解压工具路径"""
@@ -83,25 +348,259 @@ class LanZouCloud(object):
         else:
             return LanZouCloud.ZIP_ERROR
 
+    def set_split_mode(self, mode):
+        """设置大文件的分卷方式"""
+        if mode in ('rar', 'stream', None):
+            self._split_mode = mode
+            return LanZouCloud.SUCCESS
+        else:
+            return LanZouCloud.FAILED
+
+    def set_max_workers(self, num):
+        """设置批量上传/下载的最大线程数"""
+        if isinstance(num, int) and num > 0:
+            self._max_workers = num
+            return LanZouCloud.SUCCESS
+        else:
+            return LanZouCloud.FAILED
+
+    def set_download_segments(self, num):
+        """设置单个文件分段下载的连接数"""
+        if isinstance(num, int) and num > 0:
+            self._download_segments = num
+            return LanZouCloud.SUCCESS
+        else:
+            return LanZouCloud.FAILED
+
+    def set_download_buffer(self, chunk_size=1048576, preallocate=True):
+        """设置下载时每次读取的最大字节数(不小于 64KB)和是否预先分配文件的磁盘空间"""
+        # 每次读取的大小从 64KB 开始，根据读取用时在 64KB 到 chunk_size 之间自适应
+        if isinstance(chunk_size, int) and chunk_size >= 65536:
+            self._chunk_size = chunk_size
+            self._preallocate = preallocate
+            return LanZouCloud.SUCCESS
+        else:
+            return LanZouCloud.FAILED
+
+    def set_progress_interval(self, min_bytes=1048576, interval=0.5):
+        """设置上传/下载进度回调函数的频率: 每传输 min_bytes 字节或每隔 interval 秒调用一次，都为 0 时每读写一次数据就调用"""
+        if min_bytes >= 0 and interval >= 0:
+            self._progress_bytes = min_bytes
+            self._progress_interval = interval
+            return LanZouCloud.SUCCESS
+        else:
+            return LanZouCloud.FAILED
+
+    def set_page_window(self, num):
+        """设置分页获取列表时最多同时预取的页数"""
+        if isinstance(num, int) and num > 0:
+            self._page_window = num
+            return LanZouCloud.SUCCESS
+        else:
+            return LanZouCloud.FAILED
+
+    def set_batch_rate(self, rate, workers=8):
+        """设置批量操作每秒最多发出的请求数(rate <= 0 表示不限速)和默认的线程数"""
+        # 批量操作的单个请求很小，耗时主要是网络延迟，需要多个线程同时等待才能达到限速的速率
+        if isinstance(rate, (int, float)) and isinstance(workers, int) and workers > 0:
+            self._batch_limiter = RateLimiter(rate)
+            self._batch_workers = workers
+            return LanZouCloud.SUCCESS
+        else:
+            return LanZouCloud.FAILED
+
+    def set_flow_control(self, max_rate=0, max_concurrency=32, min_rate=1):
+        """设置流量控制: 速率上限(次/s，0 表示不限)、并发数上限和被限流时的速率下限，对每个主机的每个接口分别生效"""
+        # 被限流(HTTP 429/5xx、超时、接口要求重试)时该接口的速率和并发数减半，之后正常响应时逐步恢复
+        if max_rate < 0 or min_rate <= 0 or not isinstance(max_concurrency, int) or max_concurrency < 1:
+            return LanZouCloud.FAILED
+        with self._flow_lock:
+            self._flow_config = (max_rate, max_concurrency, min_rate)
+            self._flows = {}
+        return LanZouCloud.SUCCESS
+
+    def get_flow_stats(self):
+        """获取各主机各接口的流量控制状态 {'主机/接口': 状态}，状态包括当前速率(0 表示不限)、并发数上限、
+        正在进行的请求数和减速的次数"""
+        with self._flow_lock:
+            flows = dict(self._flows)
+        return {key: flow.stats() for key, flow in flows.items()}
+
+    def _flow_for(self, url):
+        """请求所属的流量控制，php 接口各自单独控制，同一主机的其他网页和文件下载共用一个"""
+        # 一个接口被限流不影响其他接口，更不影响 CDN 主机上的直链下载
+        url = urlparse(url)
+        key = url.netloc + '/' + (url.path.rsplit('/', 1)[-1] if url.path.endswith('.php') else '')
+        flow = self._flows.get(key)
+        if flow is None:
+            with self._flow_lock:
+                flow = self._flows.setdefault(key, FlowController(*self._flow_config))
+        return flow
+
+    def set_url_cache(self, max_size=1024, ttl=600, path=None):
+        """设置直链缓存的容量、有效期(s)和持久化文件路径"""
+        # 蓝奏云的直链有时效性，ttl 不宜设置得过长; ttl=0 相当于关闭缓存
+        self._url_cache = TTLCache(max_size, ttl, path)
+        return LanZouCloud.SUCCESS
+
+    def set_timeout(self, connect=5, read=30, total=None, stall=60):
+        """设置超时 s: 建立连接、等待响应、单个文件上传/下载的总用时、传输中连续无数据的时间，None 表示不限制"""
+        self._timeout = TimeoutPolicy(connect, read, total, stall)
+        return LanZouCloud.SUCCESS
+
+    def set_transport(self, pool_connections=10, pool_maxsize=10, max_retries=0, backoff_factor=0.5, keep_alive=True,
+                      block_size=1048576):
+        """设置连接池: 缓存连接池的主机数、每个主机保持的最大连接数、请求失败的重试次数、重试间隔系数、是否保持连接，
+        以及发送请求体(上传文件)时每次读取的字节数"""
+        # 批量上传/下载时 pool_maxsize 应不小于 max_workers，否则多出的连接用完就被关闭，无法复用
+        # 只重试 GET 等幂等请求，第 n 次重试前等待 backoff_factor * 2^(n-1) s
+        # requests 不支持 HTTP/2，这里只能通过复用 HTTP/1.1 连接避免每次请求都重新握手
+        if pool_connections < 1 or pool_maxsize < 1 or max_retries < 0 or block_size < 8192:
+            return LanZouCloud.FAILED
+        with self._transport_lock:
+            self._transport_config = {'pool_connections': pool_connections, 'pool_maxsize': pool_maxsize,
+                                      'max_retries': max_retries, 'backoff_factor': backoff_factor,
+                                      'keep_alive': keep_alive, 'block_size': block_size}
+            if self._http is not None:  # 会话还没创建时，创建时再按设置挂载
+                self._mount(self._http)
+        return LanZouCloud.SUCCESS
+
+    def _mount(self, session):
+        """按 set_transport 的设置给会话挂载连接池"""
+        from urllib3.util.retry import Retry
+        config = self._transport_config
+        retry = Retry(total=config['max_retries'], backoff_factor=config['backoff_factor'],
+                      status_forcelist=(500, 502, 503, 504), raise_on_status=False)
+        adapter = _adapter_class()(pool_connections=config['pool_connections'], pool_maxsize=config['pool_maxsize'],
+                                   max_retries=retry, block_size=config['block_size'])
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers['Connection'] = 'keep-alive' if config['keep_alive'] else 'close'
+
+    def get_transport_stats(self):
+        """获取每个主机的连接池新建的连接数和发出的请求数，请求数远大于连接数说明连接被复用了"""
+        # 只统计还在缓存中的连接池，超过 pool_connections 个主机时最久未使用的连接池连同统计一起被丢弃
+        stats = {}
+        if self._http is None:
+            return stats
+        for adapter in set(self._http.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    stats[f'{pool.scheme}://{pool.host}:{pool.port}'] = {'connections': pool.num_connections,
+                                                                         'requests': pool.num_requests}
+        return stats
+
+    def set_list_cache(self, max_size=256, ttl=300):
+        """设置文件夹列表缓存的容量和有效期(s)"""
+        # 本客户端的上传、删除、移动等操作会同步修改缓存，ttl 只影响其他途径(如网页端)修改网盘后的刷新延迟
+        self._list_cache = TTLCache(max_size, ttl)
+        return LanZouCloud.SUCCESS
+
+    def set_upload_index(self, path=None):
+        """设置上传内容索引的保存路径，上传文件时跳过网盘中已有的相同内容，path 为 None 时不使用索引"""
+        # 索引记录每份上传内容的 md5 及其在网盘中的 id、文件夹、文件名和大小，还有本地文件上次上传时的大小、修改时间和 md5
+        # md5 在上传时边读边算，本地文件没变时直接使用记录的 md5，不需要额外读取文件
+        if path is None:
+            self._upload_index, self._index_path = None, None
+            return LanZouCloud.SUCCESS
+        folder = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(folder):
+            return LanZouCloud.FAILED
+        index = load_json(path, {})
+        if not isinstance(index.get('hashes'), dict) or not isinstance(index.get('paths'), dict):
+            index = {'hashes': {}, 'paths': {}}  # 没有索引文件或者已损坏
+        self._upload_index, self._index_path = index, path
+        return LanZouCloud.SUCCESS
+
+    def set_session_store(self, path=None):
+        """设置保存会话 cookie 的文件，文件中有之前保存的会话时立即恢复，path 为 None 时不保存会话"""
+        # 恢复会话后 login 只需要一个请求检查会话是否有效，不用每次启动都重新登录
+        if path is None:
+            self._session_path = None
+            return LanZouCloud.SUCCESS
+        if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+            return LanZouCloud.FAILED
+        now = time()
+        for c in load_json(path, []):
+            if c.get('expires') is None or c['expires'] > now:
+                self._session.cookies.set(c['name'], c['value'], domain=c['domain'], path=c['path'],
+                                          expires=c['expires'], secure=c['secure'])
+        self._session_path = path
+        return LanZouCloud.SUCCESS
+
+    def _save_session(self):
+        """把会话 cookie 保存到文件，只有当前用户可以读写"""
+        if self._session_path is None:
+            return
+        cookies = [{'name': c.name, 'value': c.value, 'domain': c.domain, 'path': c.path, 'expires': c.expires,
+                    'secure': c.secure} for c in self._session.cookies]
+        dump_json(self._session_path, cookies, mode=0o600)
+
+    @_traced('login')
     def login(self, username, passwd):
-        """登录蓝奏云控制台"""
+        """登录蓝奏云控制台，已经恢复了有效的会话时不重新登录"""
+        if self._session_path is not None and len(self._session.cookies) > 0 and self._session_valid():
+            logger.debug('Restored session is valid, skip login')
+            self._credentials = (username, passwd)
+            return LanZouCloud.SUCCESS
+        return self._login(username, passwd)
+
+    def _login(self, username, passwd):
+        """提交账号密码登录，成功后保存会话"""
         login_data = {"action": "login", "task": "login", "username": username, "password": passwd}
         try:
-            index = self._session.get(self._account_url).text
-            login_data['formhash'] = re.findall(r'name="formhash" value="(.+?)"', index)[0]
-            html = self._session.post(self._account_url, login_data).text
-            return LanZouCloud.SUCCESS if '登录成功' in html else LanZouCloud.FAILED
+            index = self._send('GET', self._account_url).text
+            login_data['formhash'] = parser.parse_formhash(index)
+            html = self._send('POST', self._account_url, data=login_data).text
+            if '登录成功' not in html:
+                return LanZouCloud.FAILED
+            self._credentials = (username, passwd)
+            self._login_epoch += 1
+            self._save_session()
+            return LanZouCloud.SUCCESS
         except (requests.RequestException, IndexError):
             return LanZouCloud.FAILED
 
+    def _session_valid(self):
+        """用一个请求检查当前会话是否已登录"""
+        try:
+            resp = self._send('POST', self._doupload_url, data={'task': 5, 'folder_id': -1, 'pg': 1})
+            return resp.status_code == 200 and not self._auth_failed(self._doupload_url, resp)
+        except requests.RequestException:
+            return False
+
+    def _auth_failed(self, url, resp, stream=False):
+        """控制台接口的响应是否表示会话已失效: 返回 zt=9 或者跳转到了登录页面"""
+        if not url.startswith((self._doupload_url, self._mydisk_url, self._upload_url)):
+            return False  # 分享页面和下载不需要登录
+        if resp.url.startswith(self._account_url):
+            return True
+        return not stream and parser.is_login_required(resp.text)
+
+    def _relogin(self, epoch):
+        """会话失效后重新登录，epoch 为发出请求时的登录次数，其他线程已经重新登录过时不再登录"""
+        with self._login_lock:
+            if self._login_epoch != epoch:
+                return True
+            logger.debug('Session expired, login again')
+            return self._login(*self._credentials) == LanZouCloud.SUCCESS
+
     def logout(self):
-        """注销"""
+        """注销，同时删除保存的会话"""
         try:
             html = self._get(self._account_url + '?action=logout').text
-            return LanZouCloud.SUCCESS if '退出系统成功' in html else LanZouCloud.FAILED
+            if '退出系统成功' not in html:
+                return LanZouCloud.FAILED
+            self._credentials = None
+            self._session.cookies.clear()
+            self._save_session()
+            return LanZouCloud.SUCCESS
         except requests.RequestException:
             return LanZouCloud.FAILED
 
+    @_traced('delete')
     def delete(self, fid, is_file=True):
         """把网盘的文件、无子文件夹的文件夹放到回收站"""
         if is_file:
@@ -110,33 +609,38 @@ class LanZouCloud(object):
             post_data = {'task': 3, 'folder_id': fid}
         try:
             result = self._post(self._doupload_url, post_data).json()
-            return LanZouCloud.SUCCESS if int(result['zt']) == 1 else LanZouCloud.FAILED
+            self._url_cache.pop(('share_info', fid, is_file))
+            if int(result['zt']) != 1:
+                return LanZouCloud.FAILED
+            self._uncache_item(fid, is_file)
+            return LanZouCloud.SUCCESS
         except requests.RequestException:
             return LanZouCloud.FAILED
 
+    @_traced('clean_recycle')
     def clean_recycle(self):
         """清空回收站"""
         post_data = {'action': 'delete_all', 'task': 'delete_all'}
         try:
             index = self._get(self._mydisk_url, params={'item': 'recycle', 'action': 'files'}).text
-            post_data['formhash'] = re.findall(r'name="formhash" value="(.+?)"', index)[0]  # 设置表单 hash
+            post_data['formhash'] = parser.parse_formhash(index)  # 设置表单 hash
             result = self._post(self._mydisk_url + '?item=recycle', post_data).text
             return LanZouCloud.SUCCESS if '清空回收站成功' in result else LanZouCloud.FAILED
         except (requests.RequestException, IndexError):
             return LanZouCloud.FAILED
 
+    @_traced('list_recovery')
     def list_recovery(self):
         """获取回收站文件列表"""
         try:
             html = self._get(self._mydisk_url, params={'item': 'recycle', 'action': 'files'}).text
-            dirs = re.findall(r'folder_id=(\d+).*?images/folder.*?>(?:&nbsp;)?(.*?)</a>', html, re.DOTALL)
-            dirs = {k: int(v) for v, k in dirs}
-            files = re.findall(r'value="(\d+)".*?/images/file.*?>\s(.*?)</a>', html, re.DOTALL)
-            files = {k: int(v) for v, k in files if not k.startswith(self._fake_file_prefix)}  # 不显示假文件
+            dirs, files = parser.parse_recycle(html)
+            files = {k: v for k, v in files.items() if not k.startswith(self._fake_file_prefix)}  # 不显示假文件
             return {'folder_list': dirs, 'file_list': files}
         except (requests.RequestException, re.error):
             return {'folder_list': {}, 'file_list': {}}
 
+    @_traced('recovery')
     def recovery(self, fid, is_file=True):
         """从回收站恢复文件"""
         if is_file:
@@ -147,64 +651,148 @@ class LanZouCloud(object):
             post_data = {'action': 'folder_restore', 'task': 'folder_restore', 'folder_id': fid}
         try:
             index = self._get(self._mydisk_url, params=para).text
-            post_data['formhash'] = re.findall(r'name="formhash" value="(.+?)"', index)[0]  # 设置表单 hash
+            post_data['formhash'] = parser.parse_formhash(index)  # 设置表单 hash
             result = self._post(self._mydisk_url + '?item=recycle', post_data).text
-            return LanZouCloud.SUCCESS if '恢复成功' in result else LanZouCloud.FAILED
+            if '恢复成功' not in result:
+                return LanZouCloud.FAILED
+            self._list_cache.clear()  # 不知道恢复到了哪个文件夹，清空全部列表缓存
+            return LanZouCloud.SUCCESS
         except (IndexError, requests.RequestException):
             return LanZouCloud.FAILED
 
+    def _iter_pages(self, fetch, url):
+        """按页码顺序逐页返回列表数据(生成器)，后面的页面在后台并发预取，遇到空页停止"""
+        # fetch(page) 请求 url 获取该页的数据列表，空列表表示没有更多页面，None 表示服务器要求稍后重试该页
+        # 服务器要求重试时指数退避并减少预取的页数，请求成功后逐步恢复
+        window = self._page_window
+        delay = 0
+        page = next_page = 1
+        futures = {}
+        fetch = self._with_context(fetch)
+        with ThreadPoolExecutor(max_workers=self._page_window) as executor:
+            try:
+                while True:
+                    while len(futures) < window:
+                        futures[next_page] = executor.submit(fetch, next_page)
+                        next_page += 1
+                    items = futures.pop(page).result()
+                    if items is None:
+                        delay = min(max(delay * 2, 0.5), 8)
+                        window = max(window // 2, 1)
+                        logger.debug(f'Page {page} is throttled, retry after {delay}s, window: {window}')
+                        self._flow_for(url).throttle()  # 只减慢这个接口
+                        self._emit('retry', self._current_span(), 'throttled')
+                        sleep(delay)
+                        futures[page] = executor.submit(fetch, page)
+                        continue
+                    if not items:
+                        break  # 已经拿到全部页面
+                    delay /= 2
+                    window = min(window + 1, self._page_window)
+                    yield items
+                    page += 1
+            finally:
+                for future in futures.values():
+                    future.cancel()  # 丢弃多余的预取请求
+
+    def iter_file_list(self, folder_id=-1):
+        """逐个获取文件信息(生成器)，不必等待全部页面获取完成"""
+
+        def _fetch(page):
+            result = self._post(self._doupload_url, {'task': 5, 'folder_id': folder_id, 'pg': page}).json()
+            return result['text'] if result['info'] == 1 else []  # info 不为 1 时已经拿到全部文件的信息
+
+        for items in self._iter_pages(_fetch, self._doupload_url):
+            for item in items:
+                yield self._parse_file_item(item)
+
+    @_traced('get_file_list')
     def get_file_list(self, folder_id=-1):
         """获取文件列表"""
-        page = 1
-        file_list = {}
-        while True:
-            post_data = {'task': 5, 'folder_id': folder_id, 'pg': page}
-            result = self._post(self._doupload_url, post_data).json()
-            if result["info"] != 1: break  # 已经拿到全部文件的信息
-            for i in result["text"]:
-                # 删除文件列表的伪装后缀名
-                if i['name_all'].endswith(self._guise_suffix):
-                    i['name_all'] = i['name_all'].replace(self._guise_suffix, '')
-                file_list[i['name_all']] = {
-                    'id': int(i['id']),
-                    'name': i['name_all'],
-                    'time': i['time'],  # 上传时间
-                    'size': i['size'],  # 文件大小
-                    'downs': int(i['downs']),  # 下载次数
-                    'has_pwd': True if int(i['onof']) == 1 else False,  # 是否存在提取码
-                    'has_des': True if int(i['is_des']) == 1 else False  # 是否存在描述
-                }
-            page += 1
-        return file_list
+        file_list = {info['name']: info for info in self.iter_file_list(folder_id)}
+        self._list_cache.set(('files', folder_id), file_list)
+        return dict(file_list)
+
+    def _parse_file_item(self, item):
+        """转换文件列表接口返回的单个文件信息"""
+        # 删除文件列表的伪装后缀名
+        if item['name_all'].endswith(self._guise_suffix):
+            item['name_all'] = item['name_all'].replace(self._guise_suffix, '')
+        return {
+            'id': int(item['id']),
+            'name': item['name_all'],
+            'time': item['time'],  # 上传时间
+            'size': item['size'],  # 文件大小
+            'downs': int(item['downs']),  # 下载次数
+            'has_pwd': True if int(item['onof']) == 1 else False,  # 是否存在提取码
+            'has_des': True if int(item['is_des']) == 1 else False  # 是否存在描述
+        }
 
     def get_file_list2(self, folder_id=-1):
         """获取文件名-id列表"""
         info = {i['name']: i['id'] for i in self.get_file_list(folder_id).values()}
         return {key: info.get(key) for key in sorted(info.keys())}
 
+    @_traced('get_dir_list')
     def get_dir_list(self, folder_id=-1):
         """获取子文件夹信息信息列表"""
         try:
-            folder_list = {}
-            url = self._mydisk_url + '?item=files&action=index&folder_node=1&folder_id=' + str(folder_id)
-            html = self._session.get(url).text
-            info = re.findall(r'&nbsp;(.+?)</a>&nbsp;.+"folk(\d+)"(.*?)>.+#BBBBBB">\[?(.*?)\.+\]?</font>', html)
-            for folder_name, fid, pwd_flag, desc in info:
-                folder_list[folder_name] = {
-                    "id": int(fid),
-                    "name": folder_name.replace('&amp;', '&'),  # 修复网页中的 &amp; 为 &
-                    "has_pwd": True if pwd_flag else False,      # 有密码时 pwd_flag 值为 style="display:initial"
-                    "desc": desc    # 文件夹描述
-                }
-            return folder_list
+            return self._fetch_dir_list(folder_id)
         except requests.RequestException:
             return {}
 
+    def _fetch_dir_list(self, folder_id):
+        """获取子文件夹列表，请求失败时抛出异常，不会和空文件夹混淆"""
+        url = self._mydisk_url + '?item=files&action=index&folder_node=1&folder_id=' + str(folder_id)
+        resp = self._get(url)
+        resp.raise_for_status()  # 服务器出错时返回的网页里也没有文件夹
+        dir_list = parser.parse_dir_list(resp.text)
+        self._list_cache.set(('dirs', folder_id), dir_list)
+        return dict(dir_list)
+
     def get_dir_list2(self, folder_id=-1):
         """获取文件夹-id列表"""
         info = {i['name']: i['id'] for i in self.get_dir_list(folder_id).values()}
         return {key: info.get(key) for key in sorted(info.keys())}
 
+    def _cached_file_list(self, folder_id):
+        """获取文件列表，优先使用缓存"""
+        file_list = self._list_cache.get(('files', folder_id))
+        return dict(file_list) if file_list is not None else self.get_file_list(folder_id)
+
+    def _cached_dir_list(self, folder_id):
+        """获取子文件夹列表，优先使用缓存"""
+        dir_list = self._list_cache.get(('dirs', folder_id))
+        return dict(dir_list) if dir_list is not None else self.get_dir_list(folder_id)
+
+    def _update_list_cache(self, kind, func):
+        """修改所有缓存的文件('files')或子文件夹('dirs')列表，func(folder_id, 列表) 返回新列表"""
+        # 缓存中的列表可能正被其他线程读取，这里只替换不原地修改
+        with self._list_lock:
+            for key in self._list_cache.keys():
+                if key[0] != kind:
+                    continue
+                old = self._list_cache.get(key)
+                if old is None:
+                    continue
+                new = func(key[1], old)
+                if new is not old:
+                    self._list_cache.replace(key, new)
+
+    def _cache_item(self, folder_id, info, is_file=True):
+        """把新上传的文件或新建的文件夹加入缓存的列表"""
+        self._update_list_cache('files' if is_file else 'dirs',
+                                lambda fid, lst: {**lst, info['name']: info} if fid == folder_id else lst)
+
+    def _uncache_item(self, fid, is_file=True):
+        """从缓存的列表中删除文件或文件夹"""
+        self._update_list_cache('files' if is_file else 'dirs',
+                                lambda _, lst: {k: v for k, v in lst.items() if v['id'] != fid}
+                                if any(v['id'] == fid for v in lst.values()) else lst)
+        if not is_file:  # 文件夹本身的列表也失效了
+            self._list_cache.pop(('files', fid))
+            self._list_cache.pop(('dirs', fid))
+
     def get_all_folders_list(self, file_id=-1):
         """用于移动文件至新的文件夹"""
         try:
@@ -216,30 +804,75 @@ class LanZouCloud(object):
         except requests.RequestException:
             return []
 
+    @_traced('get_full_path')
     def get_full_path(self, folder_id=-1):
         """获取文件夹完整路径"""
         path_list = {'LanZouCloud': -1}
         try:
             html = self._get(self._mydisk_url, params={'item': 'files', 'action': 'index', 'folder_id': folder_id}).text
-            path = re.findall(r'&raquo;&nbsp;.+folder_id=([0-9]+)">.+&nbsp;(.+?)</a>', html)
-            for i in path:
-                path_list[i[1]] = int(i[0])
-            # 获取当前文件夹名称
-            if folder_id != -1:
-                current_folder = re.findall(r'&raquo;&nbsp;.+&nbsp;(.+) <font', html)[0].replace('&amp;', '&')
-                path_list[current_folder] = folder_id
-            return path_list
-        except (requests.RequestException, re.error, IndexError):
+            return parser.parse_full_path(html, folder_id)
+        except (requests.RequestException, IndexError):
             return path_list
 
+    def get_tree(self, folder_id=-1, tree=None, recursive=True):
+        """并发遍历文件夹，返回包含所有子文件夹和文件的目录树(FolderTree)"""
+        # 传入已有的 tree 时只刷新 folder_id 文件夹，recursive=False 时不刷新它的子文件夹
+        if tree is None:
+            from lanzou.tree import FolderTree
+            tree = FolderTree()
+        if folder_id not in tree:  # 先把上级文件夹加入目录树
+            parent_id = -1
+            for name, fid in list(self.get_full_path(folder_id).items())[1:]:
+                tree.add_folder(parent_id, {'id': fid, 'name': name, 'has_pwd': False, 'desc': ''})
+                parent_id = fid
+            if folder_id not in tree:
+                return None  # 获取文件夹路径失败
+
+        @self._with_context
+        def _list(fid):
+            try:
+                return fid, self._fetch_dir_list(fid), self.get_file_list(fid)
+            except (requests.RequestException, IndexError, KeyError, ValueError) as e:
+                logger.debug(f'List folder ID#{fid} failed: {e!r}')
+                return fid, None, None
+
+        # 每个文件夹列出后立即提交其子文件夹，不同层级的文件夹同时获取
+        # 获取列表失败的文件夹保留原有内容(不能当作空文件夹删掉整个子树)，记入 tree.stale，已知的子文件夹照常刷新
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            pending = {executor.submit(_list, folder_id)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    fid, dir_list, file_list = future.result()
+                    if dir_list is None:
+                        tree.stale.add(fid)
+                    else:
+                        tree.update_folder(fid, dir_list, file_list)
+                        tree.stale.discard(fid)
+                    if recursive:
+                        pending.update(executor.submit(_list, child) for child in tree.get_folder(fid)['folders'])
+        return tree
+
+    @_traced('get_direct_url')
     def get_direct_url(self, share_url, pwd=''):
         """获取直链"""
         if not self.is_file_url(share_url):  # 非文件链接返回错误
             return {'code': LanZouCloud.URL_INVALID, 'name': '', 'direct_url': ''}
 
-        html = self._get(share_url).text  # 原始 html
-        html = self._remove_notes(html)
+        cache_key = ('direct_url', share_url, pwd)
+        cached = self._url_cache.get(cache_key)
+        if cached is not None:
+            logger.debug(f'Direct url cache hit: {share_url}')
+            return {'code': LanZouCloud.SUCCESS, 'name': cached['name'], 'direct_url': cached['direct_url']}
+        info = self._parse_direct_url(share_url, pwd)
+        if info['code'] == LanZouCloud.SUCCESS:
+            self._url_cache.set(cache_key, {'name': info['name'], 'direct_url': info['direct_url']})
+        return info
 
+    def _parse_direct_url(self, share_url, pwd=''):
+        """解析分享页面获取直链"""
+        with self._span('direct_url.share_page'):
+            html = self._get(share_url).text  # 原始 html
         if '文件取消' in html:
             return {'code': LanZouCloud.FILE_CANCELLED, 'name': '', 'direct_url': ''}
 
@@ -248,35 +881,24 @@ class LanZouCloud(object):
             if len(pwd) == 0:
                 return {'code': LanZouCloud.LACK_PASSWORD, 'name': '', 'direct_url': ''}
 
-            post_str = re.findall(r'data\s:\s\'(.*)\'', html)[0] + str(pwd)  # action=downprocess&sign=xxxxx&p=
-            post_data = {}
-            for i in post_str.split('&'):  # 转换成 dict
-                k, v = i.split('=')
-                post_data[k] = v
-            link_info = self._post(self._host_url + '/ajaxm.php', post_data).json()
+            post_data = parser.parse_pwd_page(html, pwd)['post_data']
+            with self._span('direct_url.ajaxm'):
+                link_info = self._post(self._host_url + '/ajaxm.php', post_data).json()
         else:  # 无提取码时
-            para = re.findall(r'<iframe.*?src="(.*?)"', html)[0]  # 提取下载页面 URL 的参数
-            # 文件名可能在 <div> 中，可能在变量 filename 后面
-            file_name = re.findall(r"<div style.+>([^<]+)</div>\n<div class=\"d2\">|filename = '(.*?)';", html)[0]
-            file_name = file_name[0] or file_name[1]  # 确保正确获取文件名
-            logger.debug(f'File name: {file_name}')
-
-            html = self._get(self._host_url + para).text
-            html = self._remove_notes(html)  # 去除网页注释
-            # data: {'action': 'downprocess', 'sign': 'xxx', 'ver': 1}
-            # 一般情况 sign 的值就在 data 里，有时放在变量 sg 后面
-            post_data = re.findall(r'data\s:\s(.*),', html)[0]
-            try:
-                post_data = eval(post_data)  # 尝试转化为 dict,失败说明 sign 的值放在变量 sg 里
-            except NameError:
-                var_sg = re.search(r"var sg\s*=\s*'(.*)'", html).group(1)  # 提取 sign 的值 'AmRVaw4_a.....'
-                post_data = eval(post_data.replace('sg', f"'{var_sg}'"))  # 替换 sg 为 'AmRVaw4_a.....', 并转换为 dict
-            link_info = self._post(self._host_url + '/ajaxm.php', post_data).json()
-            link_info['inf'] = file_name  # 无提取码时 inf 字段为 0，有提取码时该字段为文件名
+            info = parser.parse_file_page(html)
+            logger.debug(f'File name: {info["name"]}')
+
+            with self._span('direct_url.iframe'):
+                html = self._get(self._host_url + info['para']).text
+            post_data = parser.parse_sign_form(html)
+            with self._span('direct_url.ajaxm'):
+                link_info = self._post(self._host_url + '/ajaxm.php', post_data).json()
+            link_info['inf'] = info['name']  # 无提取码时 inf 字段为 0，有提取码时该字段为文件名
         # 获取文件直链
         if link_info['zt'] == 1:
             fake_url = link_info['dom'] + '/file/' + link_info['url']  # 假直连，存在流量异常检测
-            direct_url = self._get(fake_url, allow_redirects=False).headers['Location']  # 重定向后的真直链
+            with self._span('direct_url.redirect'):
+                direct_url = self._get(fake_url, allow_redirects=False).headers['Location']  # 重定向后的真直链
             return {'code': LanZouCloud.SUCCESS, 'name': link_info['inf'], 'direct_url': direct_url}
         else:
             return {'code': LanZouCloud.PASSWORD_ERROR, 'name': '', 'direct_url': ''}
@@ -286,8 +908,13 @@ class LanZouCloud(object):
         info = self.get_share_info(fid, is_file=True)  # 能获取直链，一定是文件
         return self.get_direct_url(info['share_url'], info['passwd'])
 
+    @_traced('get_share_info')
     def get_share_info(self, fid, is_file=True):
         """获取文件(夹)提取码、分享链接"""
+        cache_key = ('share_info', fid, is_file)
+        cached = self._url_cache.get(cache_key)
+        if cached is not None:
+            return {'code': LanZouCloud.SUCCESS, 'share_url': cached['share_url'], 'passwd': cached['passwd']}
         if is_file:
             post_data = {'task': 22, 'file_id': fid}
         else:
@@ -304,10 +931,12 @@ class LanZouCloud(object):
                 share_url = f_info['is_newd'] + '/' + f_info['f_id']  # 文件的分享链接需要拼凑
             else:
                 share_url = f_info['new_url']  # 文件夹的分享链接可以直接拿到
+            self._url_cache.set(cache_key, {'share_url': share_url, 'passwd': pwd})
             return {'code': LanZouCloud.SUCCESS, 'share_url': share_url, 'passwd': pwd}
         except requests.RequestException:
             return {'code': LanZouCloud.FAILED, 'share_url': '', 'passwd': ''}  # 网络问题没拿到数据
 
+    @_traced('set_share_passwd')
     def set_share_passwd(self, fid, passwd='', is_file=True):
         """设置网盘文件的提取码"""
         passwd_status = 0 if passwd == '' else 1  # 是否开启密码
@@ -317,17 +946,24 @@ class LanZouCloud(object):
             post_data = {"task": 16, "folder_id": fid, "shows": passwd_status, "shownames": passwd}
         try:
             result = self._post(self._doupload_url, post_data).json()
-            return LanZouCloud.SUCCESS if result['info'] == '设置成功' else LanZouCloud.FAILED
+            self._url_cache.pop(('share_info', fid, is_file))  # 提取码变了，缓存的分享信息失效
+            if result['info'] != '设置成功':
+                return LanZouCloud.FAILED
+            self._update_list_cache('files' if is_file else 'dirs',
+                                    lambda _, lst: {k: {**v, 'has_pwd': passwd != ''} if v['id'] == fid else v
+                                                    for k, v in lst.items()}
+                                    if any(v['id'] == fid for v in lst.values()) else lst)
+            return LanZouCloud.SUCCESS
         except requests.RequestException:
             return LanZouCloud.FAILED
 
+    @_traced('mkdir')
     def mkdir(self, parent_id, folder_name, description=''):
         """创建文件夹(同时设置描述)"""
-        folder_name = re.sub(r'\s', '_', folder_name)  # 文件夹不能包含空白字符
-        folder_name = re.sub(r'[#$%^!*<>)(+=`\'\"/:;,?]', '', folder_name)  # 去除非法字符
-        folder_list = self.get_dir_list(parent_id)
+        folder_name = self._valid_folder_name(folder_name)
+        folder_list = self._cached_dir_list(parent_id)
         if folder_name in folder_list.keys():
-            return folder_list.get(folder_name)
+            return folder_list[folder_name]['id']
         post_data = {"task": 2, "parent_id": parent_id or -1, "folder_name": folder_name,
                      "folder_description": description}
         try:
@@ -337,37 +973,51 @@ class LanZouCloud(object):
                 logger.debug(f'Mkdir failed, info: {result}')
                 return LanZouCloud.MKDIR_ERROR  # 创建失败
             all_dir = self._post(self._doupload_url, data={"task": 19, "file_id": 0}).json()  # 获取ID
-            return int(all_dir['info'][-1]['folder_id'])
+            folder_id = int(all_dir['info'][-1]['folder_id'])
+            self._cache_item(parent_id, {'id': folder_id, 'name': folder_name, 'has_pwd': False, 'desc': description},
+                             is_file=False)
+            return folder_id
         except (requests.Request, IndexError):
             return LanZouCloud.MKDIR_ERROR
 
+    @staticmethod
+    def _valid_folder_name(folder_name):
+        """处理文件夹名中蓝奏云不支持的字符"""
+        folder_name = re.sub(r'\s', '_', folder_name)  # 文件夹不能包含空白字符
+        return re.sub(r'[#$%^!*<>)(+=`\'\"/:;,?]', '', folder_name)  # 去除非法字符
+
+    @_traced('rename_dir')
     def rename_dir(self, folder_id, folder_name, description=''):
         """重命名文件夹(不支持修改文件名)"""
         post_data = {'task': 4, 'folder_id': folder_id, 'folder_name': folder_name, 'folder_description': description}
         try:
             result = self._post(self._doupload_url, post_data).json()
-            return LanZouCloud.SUCCESS if result['info'] == '修改成功' else LanZouCloud.FAILED
+            if result['info'] != '修改成功':
+                return LanZouCloud.FAILED
+            self._update_list_cache('dirs', lambda _, lst: {
+                (folder_name if v['id'] == folder_id else k): ({**v, 'name': folder_name, 'desc': description}
+                                                               if v['id'] == folder_id else v)
+                for k, v in lst.items()} if any(v['id'] == folder_id for v in lst.values()) else lst)
+            return LanZouCloud.SUCCESS
         except requests.RequestException:
             return LanZouCloud.FAILED
 
+    @_traced('move_file')
     def move_file(self, file_id, folder_id=-1):
         """移动文件到指定文件夹"""
         post_data = {'task': 20, 'file_id': file_id, 'folder_id': folder_id}
         try:
             result = self._post(self._doupload_url, post_data).json()
-            return LanZouCloud.SUCCESS if result['info'] == '移动成功' else LanZouCloud.FAILED
+            if result['info'] != '移动成功':
+                return LanZouCloud.FAILED
+            self._uncache_item(file_id)
+            self._list_cache.pop(('files', folder_id))  # 不知道文件的完整信息，目标文件夹的列表下次重新获取
+            return LanZouCloud.SUCCESS
         except requests.RequestException:
             return LanZouCloud.FAILED
 
-    def _upload_a_file(self, file_path, folder_id=-1, call_back=None):
-        """上传文件到蓝奏云上指定的文件夹(默认根目录)"""
-        if not os.path.exists(file_path):
-            return LanZouCloud.FAILED
-        file_name = re.sub(r'\s', '_', os.path.basename(file_path))  # 从文件路径截取文件名，去除空白字符(Linux文件名限制)
-        tmp_list = {**self.get_file_list2(folder_id), **self.get_dir_list(folder_id)}
-        if file_name in tmp_list.keys():
-            self.delete(tmp_list[file_name])  # 文件已经存在就删除
-
+    def _upload_name(self, file_name):
+        """处理上传到蓝奏云的文件名，绕过蓝奏云的格式限制"""
         suffix = file_name.split(".")[-1]
         valid_suffix_list = ['doc', 'docx', 'zip', 'rar', 'apk', 'ipa', 'txt', 'exe', '7z', 'e', 'z', 'ct',
                              'ke', 'cetrainer', 'db', 'tar', 'pdf', 'w3x', 'epub', 'mobi', 'azw', 'azw3',
@@ -381,47 +1031,159 @@ class LanZouCloud(object):
         # .part[0-9]+.rar 改成 .xxx[0-9]+.rar 仍可以解压,以此绕过蓝奏云的检测
         if suffix == 'rar' and 'part' in file_name.split(".")[-2]:
             file_name = file_name.replace('.part', f'.{self._rar_part_name}')
-        logger.debug(f'Upload file {file_path} to folder ID#{folder_id} as "{file_name}"')
+        return file_name
+
+    def _upload_a_file(self, file_path, folder_id=-1, call_back=None, use_index=True):
+        """上传文件到蓝奏云上指定的文件夹(默认根目录)，use_index=False 时不经过内容索引(如 rar 临时分卷)"""
+        if not os.path.exists(file_path):
+            return LanZouCloud.FAILED
+        if self._upload_index is None or not use_index:
+            with open(file_path, 'rb') as f:
+                return self._upload_stream(f, os.path.basename(file_path), folder_id, call_back)
 
-        post_data = {
+        # 使用内容索引: 文件夹中的同名文件就是这份内容上次上传的文件时跳过上传，否则照常上传(替换同名文件)并记录 md5
+        stat = os.stat(file_path)
+        remote_name = self._remote_name(file_path)
+        digest = self._known_hash(file_path, stat)
+        if digest is not None and self._find_uploaded(digest, remote_name, folder_id):
+            logger.debug(f'Skip upload {file_path}: same content exists in folder ID#{folder_id}')
+            self._index_path_record(file_path, stat, digest)
+            if call_back is not None:
+                call_back(remote_name, stat.st_size, stat.st_size)
+            return LanZouCloud.SUCCESS
+        if digest is not None:  # md5 已经算过，上传时不必再计算
+            with open(file_path, 'rb') as f:
+                return self._upload_stream(f, os.path.basename(file_path), folder_id, call_back,
+                                           lambda file_id, name: self._index_upload(file_path, stat, digest,
+                                                                                    file_id, name, folder_id))
+        with open(file_path, 'rb') as f:
+            stream = HashReader(f, stat.st_size)
+            return self._upload_stream(stream, os.path.basename(file_path), folder_id, call_back,
+                                       lambda file_id, name: self._index_upload(file_path, stat, stream.hexdigest(),
+                                                                                file_id, name, folder_id))
+
+    def _known_hash(self, file_path, stat):
+        """不上传就能知道的本地文件 md5，可能与已上传的内容相同时才读取文件计算，否则返回 None"""
+        record = self._upload_index['paths'].get(os.path.abspath(file_path))
+        if record is not None and record['size'] == stat.st_size and record['mtime'] == stat.st_mtime:
+            return record['hash']
+        with self._index_lock:  # 大小不同的内容不可能相同，这时省去计算 md5，直接在上传时计算
+            same_size = any(c['size'] == stat.st_size for copies in self._upload_index['hashes'].values()
+                            for c in copies)
+        return file_hash(file_path) if same_size else None
+
+    def _find_uploaded(self, digest, name, folder_id):
+        """文件夹中名为 name 的文件是否为 digest 这份内容上传后的文件，顺便清理索引中已失效的记录"""
+        item = self._cached_file_list(folder_id).get(name)
+        with self._index_lock:
+            copies = self._upload_index['hashes'].get(digest, [])
+            for c in copies:
+                if item is not None and c['id'] == item['id']:
+                    c['folder_id'] = folder_id  # 文件可能是在其他地方移动到这个文件夹的，重新关联到这个文件夹
+                    return True
+            # 这个文件夹中记录的文件已被删除或替换
+            self._set_copies(digest, [c for c in copies if c['folder_id'] != folder_id or c['name'] != name])
+        return False
+
+    def _index_upload(self, file_path, stat, digest, file_id, name, folder_id):
+        """上传成功后把内容的 md5 和网盘中的文件记入索引"""
+        with self._index_lock:
+            for key, copies in list(self._upload_index['hashes'].items()):  # 同名文件已被替换
+                self._set_copies(key, [c for c in copies if c['folder_id'] != folder_id or c['name'] != name])
+            copies = self._upload_index['hashes'].get(digest, [])
+            copies.append({'id': int(file_id), 'folder_id': folder_id, 'name': name, 'size': stat.st_size})
+            self._set_copies(digest, copies)
+        self._index_path_record(file_path, stat, digest)
+
+    def _set_copies(self, digest, copies):
+        """设置一份内容在网盘中的所有文件，没有文件时删除这份内容的记录"""
+        if copies:
+            self._upload_index['hashes'][digest] = copies
+        else:
+            self._upload_index['hashes'].pop(digest, None)
+
+    def _index_path_record(self, file_path, stat, digest):
+        """记录本地文件的大小、修改时间和 md5，并保存索引"""
+        with self._index_lock:
+            self._upload_index['paths'][os.path.abspath(file_path)] = {'size': stat.st_size, 'mtime': stat.st_mtime,
+                                                                       'hash': digest}
+            dump_json(self._index_path, self._upload_index)
+
+    @_traced('upload')
+    def _upload_stream(self, stream, file_name, folder_id=-1, call_back=None, on_uploaded=None):
+        """把文件对象(或文件片段)上传为蓝奏云上指定文件夹中的 file_name"""
+        # 上传成功后调用 on_uploaded(文件 id, 网盘中显示的文件名)
+        file_name = re.sub(r'\s', '_', file_name)  # 去除文件名中的空白字符(Linux文件名限制)
+        tmp_list = {**self._cached_file_list(folder_id), **self._cached_dir_list(folder_id)}
+        if file_name in tmp_list.keys():
+            self.delete(tmp_list[file_name]['id'])  # 文件已经存在就删除
+
+        file_name = self._upload_name(file_name)
+        logger.debug(f'Upload file to folder ID#{folder_id} as "{file_name}"')
+
+        fields = {
             "task": "1",
             "folder_id": str(folder_id),
             "id": "WU_FILE_0",
             "name": file_name,
-            "upload_file": (file_name, open(file_path, 'rb'), 'application/octet-stream')
+            "upload_file": (file_name, stream, 'application/octet-stream')
         }
 
-        post_data = MultipartEncoder(post_data)
-        tmp_header = self._headers.copy()
-        tmp_header['Content-Type'] = post_data.content_type
+        from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor  # 上传时才导入
         # 让回调函数里不显示伪装后缀名
         if file_name.endswith(self._guise_suffix):
             file_name = file_name.replace(self._guise_suffix, '')
-        # MultipartEncoderMonitor 每上传 8129 bytes数据调用一次回调函数，问题根源是 httplib 库
+        # MultipartEncoderMonitor 每读取一块数据调用一次回调函数，块的大小由 set_transport 的 block_size 决定(httplib 默认 8KB)
         # issue : https://github.com/requests/toolbelt/issues/75
         # 上传完成后，回调函数会被错误的多调用一次(强迫症受不了)。因此，下面重新封装了回调函数，修改了接受的参数，并阻断了多余的一次调用
-        self._upload_finished_flag = False  # 上传完成的标志
+        upload_finished = [False]  # 上传完成的标志，每次上传单独记录，允许多个线程同时上传
+        timeout = self._get_timeout()
+        deadline = timeout.deadline()
+        report = self._progress(call_back, 'upload')
 
         def _call_back(read_monitor):
-            if call_back is not None:
-                if not self._upload_finished_flag:
-                    call_back(file_name, read_monitor.len, read_monitor.bytes_read)
+            if deadline is not None and time() > deadline:
+                raise requests.Timeout(f'Upload {file_name} timed out')  # 中断上传
+            if report is not None:
+                if not upload_finished[0]:
+                    report(file_name, read_monitor.len, read_monitor.bytes_read)
                 if read_monitor.len == read_monitor.bytes_read:
-                    self._upload_finished_flag = True
+                    upload_finished[0] = True
 
+        # 上传的请求体只能读一遍，_request 不会替它重新登录: 会话失效(zt=9)时在这里重新登录，把文件倒回开头再上传一次
+        start = stream.tell() if hasattr(stream, 'seek') and hasattr(stream, 'tell') else None
         try:
-            monitor = MultipartEncoderMonitor(post_data, _call_back)
-            result = self._session.post('http://pc.woozooo.com/fileup.php', data=monitor, headers=tmp_header).json()
-            if result["zt"] == 0: return LanZouCloud.FAILED  # 上传失败
-            file_id = result["text"][0]["id"]
+            for retry in range(2):
+                epoch = self._login_epoch
+                post_data = MultipartEncoder(fields)
+                tmp_header = self._headers.copy()
+                tmp_header['Content-Type'] = post_data.content_type
+                monitor = MultipartEncoderMonitor(post_data, _call_back)
+                result = self._post(self._upload_url, monitor, headers=tmp_header, timeout=timeout.stream).json()
+                self._emit('transfer', 'upload', 'upload', monitor.bytes_read)
+                if result.get('zt') != 9 or retry > 0 or start is None or self._credentials is None \
+                        or not self._relogin(epoch):
+                    break
+                logger.debug(f'Session expired while uploading {file_name}, upload again')
+                self._emit('retry', 'upload', 'auth')
+                stream.seek(start)
+                upload_finished[0] = False
+            if result["zt"] != 1: return LanZouCloud.FAILED  # 上传失败
+            item = result["text"][0]
+            file_id = item["id"]
             # 蓝奏云禁止用户连续上传 100M 的文件，因此需要上传一个 100M 的文件，然后上传一个“假文件”糊弄过去
             # 这里检查上传的文件是否为“假文件”，是的话上传后就立刻删除
-            if result['text'][0]['name_all'].startswith(self._fake_file_prefix):
+            if item['name_all'].startswith(self._fake_file_prefix):
                 self.delete(file_id)
             else:
+                self._cache_item(folder_id, {'id': int(file_id), 'name': file_name, 'time': item.get('time', ''),
+                                             'size': item.get('size', ''), 'downs': 0, 'has_pwd': False,
+                                             'has_des': False})
                 self.set_share_passwd(file_id)  # 正常的文件上传后默认关闭提取码
+                if on_uploaded is not None:
+                    on_uploaded(file_id, file_name)
             return LanZouCloud.SUCCESS
-        except (requests.RequestException, KeyboardInterrupt):
+        except (requests.RequestException, KeyError, IndexError, ValueError, KeyboardInterrupt):
             return LanZouCloud.FAILED
 
     def upload_file(self, file_path, folder_id=-1, call_back=None):
@@ -430,46 +1192,113 @@ class LanZouCloud(object):
         if os.path.getsize(file_path) <= self._max_size * 1048576:
             return self._upload_a_file(file_path, folder_id, call_back)
 
-        # 超过 100MB 的文件，分卷压缩后上传
-        if self._rar_path is None: return LanZouCloud.ZIP_ERROR
-        rar_level = 0  # 压缩等级(0-5)，0 不压缩, 5 最好压缩(耗时长)
-        part_sum = os.path.getsize(file_path) // (self._max_size * 1048576) + 1
-
+        # 超过 100MB 的文件，分卷后上传
+        split_mode = self._split_mode or ('rar' if self._rar_path is not None else 'stream')
+        if split_mode == 'rar' and self._rar_path is None: return LanZouCloud.ZIP_ERROR
         file_name = file_path.split(os.sep)[-1].split('.')  # 文件名去掉无后缀，用作分卷文件的名字
         file_name = file_name[0] if len(file_name) == 1 else '.'.join(file_name[:-1])  # 处理没有后缀的文件
         logger.debug(f'file name: {file_name}')
+        dir_id = self.mkdir(folder_id, file_name, '分卷压缩文件')  # 网盘中新建同名文件夹存放分卷文件
+        if dir_id == LanZouCloud.MKDIR_ERROR: return LanZouCloud.MKDIR_ERROR  # 创建文件夹失败就退出
+        if split_mode == 'rar':
+            return self._upload_rar_volumes(file_path, file_name, dir_id, call_back)
+        else:
+            return self._upload_stream_volumes(file_path, dir_id, call_back)
+
+    def _upload_fake_file(self, folder_id):
+        """上传一个“假文件”"""
+        # 蓝奏云禁止用户连续上传 100M 的文件，因此需要上传一个 100M 的文件，然后上传一个“假文件”糊弄过去
+        fake_name = self._fake_file_prefix + ''.join(sample('abcdefg12345', 6)) + '.txt'
+        return self._upload_stream(io.BytesIO(b'FUCK LanZouCloud'), fake_name, folder_id)
+
+    def _upload_stream_volumes(self, file_path, dir_id, call_back=None):
+        """直接从原文件切分出分卷并上传，不在本地生成分卷文件"""
+        # 分卷命名为 原文件名.lzv001of003, 原文件名.lzv002of003 ... 名字中带有分卷总数，下载后检查分卷齐全再按序号拼接还原
+        volume_size = self._max_size * 1048576
+        file_name = re.sub(r'\s', '_', os.path.basename(file_path))  # 和 _upload_stream 处理后的文件名一致
+        offsets = range(0, os.path.getsize(file_path), volume_size)
+        names = [f'{file_name}.{self._volume_part_name}{index:03d}of{len(offsets):03d}'
+                 for index in range(1, len(offsets) + 1)]
+
+        @self._with_context
+        def _upload_volume(name, offset):
+            self._upload_fake_file(dir_id)
+            with FileSlice(file_path, offset, volume_size) as volume:
+                return self._upload_stream(volume, name, dir_id, call_back)
 
-        file_list = [f"{file_name}.part{i}.rar" for i in range(1, part_sum + 1)]
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = [executor.submit(_upload_volume, name, offset) for name, offset in zip(names, offsets)]
+            codes = [future.result() for future in futures]
+        if any(code != LanZouCloud.SUCCESS for code in codes):
+            return LanZouCloud.FAILED
+        # 文件夹已经存在时(重新上传)，删除上次上传留下的分卷，否则下载时会把旧分卷拼接进来
+        volume_pattern = re.compile(re.escape(file_name) + r'\.' + self._volume_part_name + r'\d+(of\d+)?')
+        for name, item in self._cached_file_list(dir_id).items():
+            if volume_pattern.fullmatch(name) and name not in names:
+                logger.debug(f'Delete stale volume {name} in folder ID#{dir_id}')
+                self.delete(item['id'])
+        return LanZouCloud.SUCCESS
+
+    def _upload_rar_volumes(self, file_path, file_name, dir_id, call_back=None):
+        """调用 rar 分卷压缩后上传"""
+        import subprocess  # 只有 rar 分卷时才用到
+        rar_level = 0  # 压缩等级(0-5)，0 不压缩, 5 最好压缩(耗时长)
+        # 压缩、上传、删除本地分卷同时进行: rar 每写完一个分卷就交给线程池上传，上传成功后立即删除该分卷
         if not os.path.exists('./tmp'): os.mkdir('./tmp')  # 本地保存分卷文件的临时文件夹
-        cmd_args = f'a -m{rar_level} -v{self._max_size}m -ep -y -rr5% "./tmp/{file_name}" "{file_path}"'
-        if os.name == 'nt':
-            command = f"start /b {self._rar_path} {cmd_args}"  # windows 平台调用 rar.exe 实现压缩
-        else:
-            command = f"{self._rar_path} {cmd_args}"  # linux 平台使用 rar 命令压缩
+        work_dir = tempfile.mkdtemp(dir='./tmp')  # 每个文件使用单独的文件夹，允许同时上传多个大文件
+        command = [self._rar_path, 'a', f'-m{rar_level}', f'-v{self._max_size}m', '-ep', '-y', '-rr5%',
+                   work_dir + os.sep + file_name, file_path]
         try:
             logger.debug(f'rar command: {command}')
-            os.popen(command).readlines()
-        except os.error:
+            proc = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except OSError:
+            self._remove_work_dir(work_dir)
             return LanZouCloud.ZIP_ERROR
 
-        # 上传并删除分卷文件
-        folder_name = '.'.join(file_list[0].split('.')[:-2])  # 文件名去除".part**.rar"作为网盘新建的文件夹名
-        dir_id = self.mkdir(folder_id, folder_name, '分卷压缩文件')
-        if dir_id == LanZouCloud.MKDIR_ERROR: return LanZouCloud.MKDIR_ERROR  # 创建文件夹失败就退出
+        @self._with_context
+        def _upload_volume(volume):
+            self._upload_fake_file(dir_id)
+            # 现在上传真正的文件，上传成功后删除本地分卷
+            code = self._upload_a_file(work_dir + os.sep + volume, dir_id, call_back, use_index=False)
+            if code == LanZouCloud.SUCCESS:
+                os.remove(work_dir + os.sep + volume)
+            return code
 
-        for f in file_list:
-            # 蓝奏云禁止用户连续上传 100M 的文件，因此需要上传一个 100M 的文件，然后上传一个“假文件”糊弄过去
-            temp_file = './tmp/' + self._fake_file_prefix + ''.join(sample('abcdefg12345', 6)) + '.txt'
-            with open(temp_file, 'w') as t_f:
-                t_f.write('FUCK LanZouCloud')
-            self._upload_a_file(temp_file, dir_id)
-            # 现在上传真正的文件
-            if self._upload_a_file('./tmp/' + f, dir_id, call_back) == LanZouCloud.FAILED:
-                return LanZouCloud.FAILED
-        rmtree('./tmp')
-        return LanZouCloud.SUCCESS
+        # rar 按顺序生成 name.part1.rar, name.part2.rar...(分卷较多时序号前补 0)
+        # 出现下一个分卷说明上一个分卷已经写完，rar 退出后剩下的分卷都已写完
+        volume_pattern = re.compile(re.escape(file_name) + r'\.part(\d+)\.rar')
+        submitted = set()
+        futures = []
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            while True:
+                finished = proc.poll() is not None
+                volumes = sorted((int(m.group(1)), m.group(0))
+                                 for m in map(volume_pattern.fullmatch, os.listdir(work_dir)) if m)
+                for _, volume in (volumes if finished else volumes[:-1]):
+                    if volume not in submitted:
+                        logger.debug(f'Volume {volume} is ready to upload')
+                        submitted.add(volume)
+                        futures.append(executor.submit(_upload_volume, volume))
+                if finished:
+                    break
+                sleep(0.5)
+            codes = [future.result() for future in futures]
+        self._remove_work_dir(work_dir)
+        if proc.returncode != 0 or len(codes) == 0:
+            return LanZouCloud.ZIP_ERROR
+        return LanZouCloud.SUCCESS if all(code == LanZouCloud.SUCCESS for code in codes) else LanZouCloud.FAILED
 
-    def upload_dir(self, dir_path, folder_id=-1, call_back=None):
+    @staticmethod
+    def _remove_work_dir(work_dir):
+        """删除分卷文件的临时文件夹，./tmp 为空时一并删除"""
+        rmtree(work_dir)
+        try:
+            os.rmdir('./tmp')
+        except OSError:
+            pass  # 还有其他文件正在上传
+
+    @_traced('upload_dir')
+    def upload_dir(self, dir_path, folder_id=-1, call_back=None, dir_call_back=None):
         """批量上传"""
         if not os.path.isdir(dir_path):
             return LanZouCloud.FAILED
@@ -478,41 +1307,402 @@ class LanZouCloud(object):
         if dir_id == LanZouCloud.MKDIR_ERROR:
             return LanZouCloud.MKDIR_ERROR
 
-        for f in os.listdir(dir_path):
-            if os.path.isfile(dir_path + os.sep + f):
-                if self.upload_file(dir_path + os.sep + f, dir_id, call_back) != LanZouCloud.SUCCESS:
-                    return LanZouCloud.FAILED
+        tasks = [(f, lambda cb, path=dir_path + os.sep + f: self.upload_file(path, dir_id, cb))
+                 for f in sorted(os.listdir(dir_path))
+                 if os.path.isfile(dir_path + os.sep + f) and f != self._manifest_name]
+        results = self._run_tasks(tasks, call_back, dir_call_back)
+        if any(code != LanZouCloud.SUCCESS for code in results.values()):
+            return LanZouCloud.FAILED
         return LanZouCloud.SUCCESS
 
+    def _remote_name(self, file_path):
+        """本地文件上传后在网盘中的名字，大文件为存放分卷的文件夹名"""
+        if os.path.getsize(file_path) > self._max_size * 1048576:
+            file_name = file_path.split(os.sep)[-1].split('.')
+            file_name = file_name[0] if len(file_name) == 1 else '.'.join(file_name[:-1])
+            return self._valid_folder_name(file_name)
+        file_name = self._upload_name(re.sub(r'\s', '_', os.path.basename(file_path)))
+        return file_name.replace(self._guise_suffix, '') if file_name.endswith(self._guise_suffix) else file_name
+
+    @staticmethod
+    def _is_modified(file_path, record):
+        """根据清单记录判断本地文件是否被修改过，只改变了修改时间时顺便更新记录"""
+        stat = os.stat(file_path)
+        if stat.st_size == record.get('size') and stat.st_mtime == record.get('mtime'):
+            return False
+        if stat.st_size == record.get('size') and file_hash(file_path) == record.get('hash'):
+            record['mtime'] = stat.st_mtime
+            return False
+        return True
+
+    @staticmethod
+    def _file_record(file_path, fid):
+        """生成清单中的文件记录"""
+        stat = os.stat(file_path)
+        return {'id': fid, 'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': file_hash(file_path)}
+
+    def sync_upload_dir(self, dir_path, folder_id=-1, call_back=None, dir_call_back=None):
+        """增量上传文件夹，只上传新增或修改过的文件"""
+        # 本地清单记录每个文件上次上传时的大小、修改时间、md5 和网盘中的 id
+        # 清单中的 id 和网盘中同名文件的 id 一致，且文件内容没变时跳过上传
+        if not os.path.isdir(dir_path):
+            return LanZouCloud.FAILED
+        dir_name = dir_path.split(os.sep)[-1]
+        dir_id = self.mkdir(folder_id, dir_name, '批量上传')
+        if dir_id == LanZouCloud.MKDIR_ERROR:
+            return LanZouCloud.MKDIR_ERROR
+
+        manifest_path = dir_path + os.sep + self._manifest_name
+        manifest = load_json(manifest_path, {})
+        if manifest.get('folder_id') != dir_id:  # 没有同步过或者网盘文件夹变了
+            manifest = {'folder_id': dir_id, 'files': {}}
+        records = manifest['files']
+        remote = {**self.get_file_list2(dir_id), **self.get_dir_list2(dir_id)}
+
+        tasks = []
+        local_files = [f for f in sorted(os.listdir(dir_path))
+                       if os.path.isfile(dir_path + os.sep + f) and f != self._manifest_name]
+        for f in local_files:
+            path = dir_path + os.sep + f
+            record = records.get(f)
+            if record is not None and remote.get(self._remote_name(path)) == record['id'] \
+                    and not self._is_modified(path, record):
+                continue
+            tasks.append((f, lambda cb, path=path: self.upload_file(path, dir_id, cb)))
+        logger.debug(f'Sync upload {dir_path}: {len(tasks)}/{len(local_files)} files changed')
+
+        results = self._run_tasks(tasks, call_back, dir_call_back)
+        if results:
+            remote = {**self.get_file_list2(dir_id), **self.get_dir_list2(dir_id)}  # 获取新上传文件的 id
+        for f, code in results.items():
+            path = dir_path + os.sep + f
+            if code == LanZouCloud.SUCCESS and self._remote_name(path) in remote:
+                records[f] = self._file_record(path, remote[self._remote_name(path)])
+            else:
+                records.pop(f, None)  # 下次同步时重新上传
+        manifest['files'] = {f: records[f] for f in local_files if f in records}  # 清除已删除文件的记录
+        dump_json(manifest_path, manifest)
+        if any(code != LanZouCloud.SUCCESS for code in results.values()):
+            return LanZouCloud.FAILED
+        return LanZouCloud.SUCCESS
+
+    def sync_download_dir(self, fid, save_path='./down', call_back=None, dir_call_back=None):
+        """登录用户通过id增量下载文件夹，只下载新增或修改过的文件"""
+        # 网盘中的文件被重新上传后 id 会改变，本地文件被修改或删除时也会重新下载
+        file_list = self.get_file_list(fid)
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)
+        manifest_path = save_path + os.sep + self._manifest_name
+        manifest = load_json(manifest_path, {})
+        if manifest.get('folder_id') != fid:
+            manifest = {'folder_id': fid, 'files': {}}
+        records = manifest['files']
+
+        tasks = []
+        for name, info in sorted(file_list.items()):
+            path = save_path + os.sep + name
+            record = records.get(name)
+            if record is not None and record['id'] == info['id'] and os.path.isfile(path) \
+                    and not self._is_modified(path, record):
+                continue
+            tasks.append((name, lambda cb, f_id=info['id']: self.download_file2(f_id, save_path, cb)))
+        logger.debug(f'Sync download folder ID#{fid}: {len(tasks)}/{len(file_list)} files changed')
+
+        results = self._run_tasks(tasks, call_back, dir_call_back)
+        for name, code in results.items():
+            path = save_path + os.sep + name
+            if code == LanZouCloud.SUCCESS and os.path.isfile(path):
+                records[name] = self._file_record(path, file_list[name]['id'])
+            else:
+                records.pop(name, None)
+        manifest['files'] = {name: records[name] for name in file_list if name in records}
+        dump_json(manifest_path, manifest)
+        if any(code != LanZouCloud.SUCCESS for code in results.values()):
+            return LanZouCloud.FAILED
+        return LanZouCloud.SUCCESS
+
+    @_traced('download')
     def download_file(self, share_url, pwd='', save_path='.', call_back=None):
         """通过分享链接下载文件(需提取码)"""
         if not self.is_file_url(share_url):
             return LanZouCloud.URL_INVALID
         if not os.path.exists(save_path):
             os.makedirs(save_path)
-        info = self.get_direct_url(share_url, pwd)
-        logger.debug(f'File direct url info: {info}')
-        if info['code'] != LanZouCloud.SUCCESS:
-            return info['code']
-        # 删除伪装后缀名
-        if info['name'].endswith(self._guise_suffix):
-            info['name'] = info['name'].replace(self._guise_suffix, '')
+        deadline = self._get_timeout().deadline()
+        call_back = self._progress(call_back, 'download')
+        for retry in range(self._max_retries + 1):
+            if deadline is not None and time() > deadline:
+                logger.debug(f'Download timed out: {share_url}')
+                break
+            if retry > 0:
+                logger.debug(f'Download interrupted, retry {retry}/{self._max_retries}: {share_url}')
+                self._emit('retry', 'download', 'interrupted')
+                self._url_cache.pop(('direct_url', share_url, pwd))  # 缓存的直链可能已经失效
+            # 每次(重新)下载前都重新获取直链，中断之后原来的直链可能已经失效
+            try:
+                info = self.get_direct_url(share_url, pwd)
+            except (requests.RequestException, IndexError, KeyError, ValueError) as e:
+                logger.debug(f'Get direct url failed: {e!r}')
+                continue
+            logger.debug(f'File direct url info: {info}')
+            if info['code'] == LanZouCloud.FAILED:  # 网络错误或服务器繁忙，重试
+                continue
+            if info['code'] != LanZouCloud.SUCCESS:
+                return info['code']
+            # 删除伪装后缀名
+            if info['name'].endswith(self._guise_suffix):
+                info['name'] = info['name'].replace(self._guise_suffix, '')
+            file_path = save_path + os.sep + info['name']
+            get_file = self._get_file_segmented if self._download_segments > 1 else self._get_file
+            if get_file(info['direct_url'], file_path, call_back, deadline) == LanZouCloud.SUCCESS:
+                return LanZouCloud.SUCCESS
+        return LanZouCloud.FAILED
+
+    def _iter_body(self, resp, limit=None):
+        """读取响应体(生成器)，最多读取 limit 字节，没有压缩时每次返回同一个缓冲区的 memoryview，下次读取前有效"""
+        # urllib3 的 readinto 只是 read 之后再复制一遍，没有压缩时直接从底层的 http.client 响应 readinto 到缓冲区，
+        # 省去每块数据的 bytes 对象和复制；有压缩(Content-Encoding)时需要 urllib3 解压，直接返回 read 得到的 bytes
+        # 读取得快就加大每次读取的大小以减少循环次数，读取得慢就减小，保证进度和超时检查的及时性
+        import http.client
+        from urllib3.exceptions import HTTPError as Urllib3Error
+        fp = getattr(resp.raw, '_fp', None)
+        direct = 'Content-Encoding' not in resp.headers and hasattr(fp, 'readinto')
+        buffer = memoryview(bytearray(self._chunk_size)) if direct else None
+        size = 65536
+        while limit is None or limit > 0:
+            start = time()
+            amount = size if limit is None else min(size, limit)
+            try:
+                if direct:
+                    n = fp.readinto(buffer[:amount])
+                    chunk = buffer[:n]
+                else:
+                    chunk = resp.raw.read(amount, decode_content=True)
+                    n = len(chunk)
+            except (Urllib3Error, http.client.HTTPException, OSError) as e:
+                raise requests.ConnectionError(e)
+            if not n:
+                # http.client 的 readinto 遇到连接提前关闭时只返回 0，剩余长度不为 0 说明响应体不完整
+                if direct and (getattr(fp, 'length', None) or 0) > 0:
+                    raise requests.ConnectionError(f'Connection closed with {fp.length} bytes left')
+                if direct:
+                    resp.raw.release_conn()  # 绕过了 urllib3 的读取，读完后要自己把连接还给连接池，否则无法复用
+                break
+            if limit is not None:
+                limit -= n
+            elapsed = time() - start
+            if elapsed < 0.05:
+                size = min(size * 2, self._chunk_size)
+            elif elapsed > 0.5:
+                size = max(size // 2, 65536)
+            yield chunk
+
+    def _allocate(self, fd, offset, length):
+        """预先分配文件的磁盘空间，减少磁盘碎片，不支持时忽略"""
+        if self._preallocate and length > 0 and hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, offset, length)
+            except OSError:
+                pass  # 文件系统不支持
+
+    def _get_file(self, direct_url, file_path, call_back=None, deadline=None):
+        """下载直链指向的文件，支持断点续传，超过截止时间 deadline 时中断"""
+        # 未完成的下载在 file_path.part 中记录文件大小、ETag 和已写入的字节数
+        # 再次下载时用 Range 请求从中断处继续，文件大小或 ETag 对不上就从头下载
+        file_name = os.path.basename(file_path)
+        part_path = file_path + '.part'
+        record = self._load_part_record(file_path)
+        offset = record.get('offset', 0)
+        timeout = self._get_timeout().stream
+
+        try:
+            headers = self._headers.copy()
+            if offset > 0:
+                headers['Range'] = f'bytes={offset}-'
+            r = self._get(direct_url, headers=headers, stream=True, timeout=timeout)
+            etag = r.headers.get('ETag', '')
+            if offset > 0:
+                content_range = re.fullmatch(r'bytes (\d+)-\d+/(\d+)', r.headers.get('Content-Range', ''))
+                if r.status_code != 206 or content_range is None or int(content_range.group(1)) != offset \
+                        or int(content_range.group(2)) != record.get('size') or etag != record.get('etag', ''):
+                    logger.debug(f'Can not resume {file_path} from {offset}, download from the beginning')
+                    r.close()
+                    offset = 0
+                    r = self._get(direct_url, stream=True, timeout=timeout)
+                    etag = r.headers.get('ETag', '')
+            if r.status_code not in (200, 206):
+                return LanZouCloud.FAILED
+            total_size = offset + int(r.headers['content-length'])
+        except (requests.RequestException, KeyError, ValueError):
+            return LanZouCloud.FAILED
+
+        logger.debug(f'Save file to {file_path}, start at {offset}/{total_size}')
+        now_size = offset
+        saved_size = offset
+
+        def _save_record():
+            with open(part_path, 'w') as part:
+                json.dump({'size': total_size, 'etag': etag, 'offset': now_size}, part)
+
+        with open(file_path, 'r+b' if offset > 0 else 'wb') as f:
+            f.seek(offset)
+            f.truncate()  # 丢弃上次中断时写入了但没有记录的数据
+            self._allocate(f.fileno(), offset, total_size - offset)
+            try:
+                for chunk in self._iter_body(r):
+                    f.write(chunk)
+                    now_size += len(chunk)
+                    if now_size - saved_size >= 1048576:  # 每写入 1MB 更新一次断点记录
+                        f.flush()
+                        _save_record()
+                        saved_size = now_size
+                    if call_back is not None:
+                        call_back(file_name, total_size, now_size)
+                    if deadline is not None and time() > deadline:
+                        logger.debug(f'Download {file_path} timed out at {now_size}/{total_size}')
+                        break
+            except requests.RequestException:
+                logger.debug(f'Download {file_path} interrupted at {now_size}/{total_size}')
+            finally:
+                f.flush()
+                if now_size < total_size:
+                    _save_record()
+                r.close()
+                self._emit('transfer', self._current_span(), 'download', now_size - offset)
+
+        if now_size < total_size:
+            return LanZouCloud.FAILED
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return LanZouCloud.SUCCESS
+
+    @staticmethod
+    def _load_part_record(file_path):
+        """读取未完成下载的断点记录"""
+        part_path = file_path + '.part'
+        if not os.path.exists(part_path) or not os.path.exists(file_path):
+            return {}
+        try:
+            with open(part_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _get_file_segmented(self, direct_url, file_path, call_back=None, deadline=None):
+        """多连接分段下载直链指向的文件，支持断点续传，超过截止时间 deadline 时中断"""
+        # 先请求第一个字节，确认服务器支持 Range 请求并拿到文件大小，不支持就退回单连接下载
+        file_name = os.path.basename(file_path)
+        part_path = file_path + '.part'
+        timeout = self._get_timeout().stream
         try:
-            r = self._get(info['direct_url'], stream=True)
-            total_size = int(r.headers['content-length'])
-            now_size = 0
-            save_path = save_path + os.sep + info['name']
-            logger.debug(f'Save file to {save_path}')
-            with open(save_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        now_size += len(chunk)
+            headers = self._headers.copy()
+            headers['Range'] = 'bytes=0-0'
+            r = self._get(direct_url, headers=headers, stream=True, timeout=timeout)
+            r.close()
+            content_range = re.fullmatch(r'bytes 0-0/(\d+)', r.headers.get('Content-Range', ''))
+            if r.status_code != 206 or content_range is None:
+                logger.debug(f'Server does not support range requests, download {file_path} in one connection')
+                return self._get_file(direct_url, file_path, call_back, deadline)
+        except requests.RequestException:
+            return LanZouCloud.FAILED
+        direct_url = r.url  # 各分段直接请求重定向后的地址，省去重复的跳转
+        total_size = int(content_range.group(1))
+        etag = r.headers.get('ETag', '')
+
+        # 每个分段记为 [下一个要写入的位置, 结束位置]，断点记录中保存所有分段的进度
+        record = self._load_part_record(file_path)
+        if record.get('size') != total_size or record.get('etag', '') != etag:
+            record = {}
+        if 'segments' in record and not self._valid_segments(record['segments'], total_size):
+            record = {}  # 断点记录已损坏，从头下载
+        if 'segments' in record:
+            segments = record['segments']
+        else:
+            start = record.get('offset', 0)  # 单连接下载留下的断点，只分段下载剩余部分
+            seg_size = max(-(-(total_size - start) // self._download_segments), 1048576)  # 分段不小于 1MB
+            segments = [[pos, min(pos + seg_size, total_size) - 1] for pos in range(start, total_size, seg_size)]
+        logger.debug(f'Save file to {file_path} in {len(segments)} segments, size {total_size}')
+
+        lock = threading.Lock()
+        progress = {'now_size': total_size - sum(end - pos + 1 for pos, end in segments if pos <= end), 'saved_size': 0}
+        start_size = progress['now_size']
+
+        def _save_record():
+            with open(part_path, 'w') as part:
+                json.dump({'size': total_size, 'etag': etag, 'segments': segments}, part)
+
+        fd = os.open(file_path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0))
+        os.ftruncate(fd, total_size)  # 预先设置文件大小，各分段按位置写入
+        self._allocate(fd, 0, total_size)
+
+        def _write(data, pos):
+            if hasattr(os, 'pwrite'):
+                os.pwrite(fd, data, pos)
+            else:  # Windows 没有 pwrite
+                with lock:
+                    os.lseek(fd, pos, os.SEEK_SET)
+                    os.write(fd, data)
+
+        @self._with_context
+        def _worker(segment):
+            if segment[0] > segment[1]:
+                return  # 该分段已经下载完成
+            seg_headers = self._headers.copy()
+            seg_headers['Range'] = f'bytes={segment[0]}-{segment[1]}'
+            try:
+                resp = self._get(direct_url, headers=seg_headers, stream=True, timeout=timeout)
+                # 分段必须从请求的位置开始，且文件总大小不变，否则说明文件已被替换，不能拼接到已下载的部分
+                seg_range = re.fullmatch(r'bytes (\d+)-\d+/(\d+)', resp.headers.get('Content-Range', ''))
+                if resp.status_code != 206 or seg_range is None or int(seg_range.group(1)) != segment[0] \
+                        or int(seg_range.group(2)) != total_size:
+                    logger.debug(f'Bad response for segment {segment} of {file_path}: {resp.status_code} '
+                                 f'{resp.headers.get("Content-Range")}')
+                    resp.close()
+                    return
+                for chunk in self._iter_body(resp, segment[1] - segment[0] + 1):  # 不读取超出分段范围的数据
+                    _write(chunk, segment[0])
+                    with lock:
+                        segment[0] += len(chunk)
+                        progress['now_size'] += len(chunk)
+                        if progress['now_size'] - progress['saved_size'] >= 1048576:  # 每写入 1MB 更新一次断点记录
+                            _save_record()
+                            progress['saved_size'] = progress['now_size']
                         if call_back is not None:
-                            call_back(info['name'], total_size, now_size)
-            return LanZouCloud.SUCCESS
-        except ValueError:
+                            call_back(file_name, total_size, progress['now_size'])
+                    if segment[0] > segment[1] or (deadline is not None and time() > deadline):
+                        break
+                resp.close()
+            except requests.RequestException:
+                logger.debug(f'Segment {segment} of {file_path} interrupted')
+
+        try:
+            with ThreadPoolExecutor(max_workers=self._download_segments) as executor:
+                list(executor.map(_worker, segments))
+        finally:
+            os.close(fd)
+            if any(pos <= end for pos, end in segments):
+                _save_record()
+            self._emit('transfer', self._current_span(), 'download', progress['now_size'] - start_size)
+
+        # 文件大小在下载前已被 ftruncate 设置好，不能说明内容完整，要检查写入的字节数是否正好等于文件大小
+        if any(pos <= end for pos, end in segments) or progress['now_size'] != total_size:
             return LanZouCloud.FAILED
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        return LanZouCloud.SUCCESS
+
+    @staticmethod
+    def _valid_segments(segments, total_size):
+        """断点记录中的分段是否按顺序位于文件范围内"""
+        last_end = -1
+        for segment in segments:
+            if not isinstance(segment, list) or len(segment) != 2 or not all(isinstance(x, int) for x in segment):
+                return False
+            pos, end = segment
+            if pos <= last_end or pos > end + 1 or end >= total_size:
+                return False
+            last_end = end
+        return last_end == total_size - 1
 
     def download_file2(self, fid, save_path='.', call_back=None):
         """登录用户通过id下载文件(无需提取码)"""
@@ -520,6 +1710,36 @@ class LanZouCloud(object):
         logger.debug(f'File share info: {info}')
         return self.download_file(info['share_url'], info['passwd'], save_path, call_back)
 
+    def _restore_file(self, file_list, save_path):
+        """下载的文件是分卷时，还原出原文件"""
+        # 去掉伪装后缀名后判断是否为内置分卷 *.lzv001of003(旧版本为 *.lzv001)，否则交给 rar 解压
+        names = [f.replace(self._guise_suffix, '') if f.endswith(self._guise_suffix) else f for f in file_list]
+        volume_pattern = re.compile(r'(.+)\.' + self._volume_part_name + r'(\d+)(?:of(\d+))?')
+        matches = [volume_pattern.fullmatch(f) for f in names]
+        if not matches or not all(matches) or len({m.group(1) for m in matches}) != 1:
+            return self._unrar(file_list, save_path)
+
+        # 分卷必须齐全且属于同一次上传: 总数一致，序号正好是 1..总数
+        matches = sorted(matches, key=lambda m: int(m.group(2)))
+        counts = {m.group(3) for m in matches}  # 总数不一致说明混有其他次上传的分卷
+        count = len(matches) if counts == {None} else int(counts.pop()) if len(counts) == 1 else 0
+        if count == 0 or [int(m.group(2)) for m in matches] != list(range(1, count + 1)):
+            logger.debug(f'Volumes of {matches[0].group(1)} are incomplete or mixed: {names}')
+            return LanZouCloud.FAILED
+
+        target = save_path + os.sep + matches[0].group(1)
+        try:
+            with open(target, 'wb') as out:
+                for m in matches:
+                    logger.debug(f'Join volume {m.group(0)} to {target}')
+                    with open(save_path + os.sep + m.group(0), 'rb') as volume:
+                        copyfileobj(volume, out, 1048576)
+            for m in matches:
+                os.remove(save_path + os.sep + m.group(0))
+            return LanZouCloud.SUCCESS
+        except OSError:
+            return LanZouCloud.FAILED
+
     def _unrar(self, file_list, save_path):
         # 如果是分卷压缩文件 *.xxx01.rar，下载后需要解压
         for f_name in file_list:
@@ -545,61 +1765,146 @@ class LanZouCloud(object):
         except os.error:
             return LanZouCloud.ZIP_ERROR
 
-    def download_dir(self, share_url, dir_pwd='', save_path='./down', call_back=None):
+    def _run_tasks(self, tasks, call_back=None, dir_call_back=None):
+        """多线程批量上传/下载, tasks 为 [(文件名, 任务函数)] 列表或生成器, 返回 {文件名: 状态码}"""
+        # 任务函数接受进度回调函数 call_back 作为参数, 返回上传/下载结果状态码
+        # call_back(file_name, total_size, now_size) 为单个文件的进度回调
+        # dir_call_back(file_name, code, finished, total) 在每个文件结束后调用, 用于汇总整体进度
+        # tasks 为生成器时可以边生成边执行，此时 total 为已经提交的任务数
+        results = {}
+        lock = threading.Lock()
+        total = len(tasks) if isinstance(tasks, list) else 0
+
+        def _call_back(file_name, total_size, now_size):
+            with lock:  # 多个线程同时回调时串行化，防止调用方输出错乱
+                call_back(file_name, total_size, now_size)
+
+        @self._with_context
+        def _worker(file_name, func):
+            try:
+                code = func(_call_back if call_back is not None else None)
+            except (requests.RequestException, IndexError, KeyError, ValueError):
+                code = LanZouCloud.FAILED
+            logger.debug(f'Task {file_name} result code: {code}')
+            with lock:
+                results[file_name] = code
+                if dir_call_back is not None:
+                    dir_call_back(file_name, code, len(results), total)
+            return code
+
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = []
+            for name, func in tasks:
+                if not isinstance(tasks, list):
+                    with lock:
+                        total += 1
+                futures.append(executor.submit(_worker, name, func))
+            for future in futures:
+                future.result()  # 传递任务线程中未处理的异常
+        return results
+
+    def _run_batch(self, func, ids, default=FAILED, workers=None):
+        """多线程限速执行批量操作，func(id) 返回单个 id 的结果，返回 {id: 结果}，workers 为 None 时使用默认的线程数"""
+
+        @self._with_context
+        def _worker(fid):
+            self._batch_limiter.acquire()
+            try:
+                return func(fid)
+            except (requests.RequestException, IndexError, KeyError, ValueError):
+                return default  # 单个操作出错不影响其他操作
+
+        ids = list(dict.fromkeys(ids))  # 去掉重复的 id，保持原来的顺序
+        if not ids:
+            return {}
+        workers = min(workers or self._batch_workers, len(ids))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(ids, executor.map(_worker, ids)))
+
+    def delete_batch(self, fids, is_file=True, workers=None):
+        """批量把文件(夹)放到回收站，返回 {id: 状态码}"""
+        return self._run_batch(lambda fid: self.delete(fid, is_file), fids, workers=workers)
+
+    def move_file_batch(self, file_ids, folder_id=-1, workers=None):
+        """批量移动文件到指定文件夹，返回 {id: 状态码}"""
+        return self._run_batch(lambda fid: self.move_file(fid, folder_id), file_ids, workers=workers)
+
+    def set_share_passwd_batch(self, fids, passwd='', is_file=True, workers=None):
+        """批量设置文件(夹)的提取码，返回 {id: 状态码}"""
+        return self._run_batch(lambda fid: self.set_share_passwd(fid, passwd, is_file), fids, workers=workers)
+
+    def get_share_info_batch(self, fids, is_file=True, workers=None):
+        """批量获取文件(夹)的提取码、分享链接，返回 {id: 分享信息}"""
+        return self._run_batch(lambda fid: self.get_share_info(fid, is_file), fids,
+                               {'code': LanZouCloud.FAILED, 'share_url': '', 'passwd': ''}, workers)
+
+    @_traced('download_dir')
+    def download_dir(self, share_url, dir_pwd='', save_path='./down', call_back=None, dir_call_back=None):
         """通过分享链接下载文件夹"""
         if self.is_file_url(share_url):
             return LanZouCloud.URL_INVALID
 
-        html = requests.get(share_url, headers=self._headers).text
+        html = self._get(share_url).text
         if '文件不存在' in html:
             return LanZouCloud.FILE_CANCELLED
 
         if '请输入密码' in html:
             if len(dir_pwd) == 0:
                 return LanZouCloud.LACK_PASSWORD
-        page = 1
-        lx = re.findall(r"'lx':'?(\d)'?,", html)[0]
-        t = re.findall(r"var [0-9a-z]{6} = '(\d{10})';", html)[0]
-        k = re.findall(r"var [0-9a-z]{6} = '([0-9a-z]{15,})';", html)[0]
-        fid = re.findall(r"'fid':'?(\d+)'?,", html)[0]
-        post_data = {'lx': lx, 'pg': page, 'k': k, 't': t, 'fid': fid, 'pwd': dir_pwd}
-        info = {}
-        while True:
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)  # 提前创建，避免多个线程同时创建文件夹
+        names = []
+        errors = []
+
+        def _tasks():  # 边获取文件列表边下载
             try:
-                # 这里不用封装好的post函数是为了支持未登录的用户通过 URL 下载
-                r = requests.post(self._host_url + '/filemoreajax.php', data=post_data, headers=self._headers).json()
-            except requests.RequestException:
-                return LanZouCloud.FAILED
-            if r["info"] == "没有了": break  # 已经拿到全部的文件信息
-            if r["info"] == "请刷新，重试":  # 也可以使用 r["zt"] == 4
-                sleep(0.6)  # 间隔大于一秒才能获得下一个页面
-                continue
-            if r['zt'] == 3:
-                return LanZouCloud.PASSWORD_ERROR
-            elif r['zt'] != 1:
-                return LanZouCloud.FAILED
-            # 获取文件信息成功后...
-            page += 1
-            post_data["pg"] = page
-            info.update({f['name_all']: self._host_url + '/' + f['id'] for f in r['text']})
-        file_list = list(info.keys())
-        url_list = [info.get(key) for key in sorted(info.keys())]
-        for url in url_list:
-            self.download_file(url, '', save_path, call_back)
-        return self._unrar(file_list, save_path)
-
-    def download_dir2(self, fid, save_path='./down', call_back=None):
+                for items in self._iter_shared_folder(html, dir_pwd):
+                    for f in items:
+                        names.append(f['name_all'])
+                        yield f['name_all'], lambda cb, url=self._host_url + '/' + f['id']: \
+                            self.download_file(url, '', save_path, cb)
+            except _PageError as e:
+                errors.append(e.code)
+            except (requests.RequestException, IndexError, KeyError, ValueError):
+                errors.append(LanZouCloud.FAILED)
+
+        results = self._run_tasks(_tasks(), call_back, dir_call_back)
+        if errors:
+            return errors[0]
+        if any(code != LanZouCloud.SUCCESS for code in results.values()):
+            return LanZouCloud.FAILED
+        return self._restore_file(names, save_path)
+
+    def _iter_shared_folder(self, html, dir_pwd=''):
+        """逐页获取文件夹分享页面中的文件信息(生成器)，提取码错误等情况抛出 _PageError"""
+        form, _ = parser.parse_folder_page(html)
+        url = self._host_url + '/filemoreajax.php'
+
+        def _fetch(page):
+            r = self._post(url, {**form, 'pg': page, 'pwd': dir_pwd}).json()
+            if r['info'] == '没有了': return []  # 已经拿到全部的文件信息
+            if r['info'] == '请刷新，重试': return None  # 也可以使用 r["zt"] == 4, 请求太频繁了
+            if r['zt'] == 3: raise _PageError(LanZouCloud.PASSWORD_ERROR)
+            if r['zt'] != 1: raise _PageError(LanZouCloud.FAILED)
+            return r['text']
+
+        return self._iter_pages(_fetch, url)
+
+    def download_dir2(self, fid, save_path='./down', call_back=None, dir_call_back=None):
         """登录用户通过id下载文件夹"""
         file_list = self.get_file_list2(fid)
         if len(file_list) == 0: return LanZouCloud.FAILED
 
-        for f_id in file_list.values():
-            code = self.download_file2(f_id, save_path, call_back)
-            logger.debug(f'Download file result code: {code}')
-            if code == LanZouCloud.FAILED:
-                return LanZouCloud.FAILED
-        return self._unrar(list(file_list.keys()), save_path)
+        if not os.path.exists(save_path):
+            os.makedirs(save_path)  # 提前创建，避免多个线程同时创建文件夹
+        tasks = [(name, lambda cb, f_id=f_id: self.download_file2(f_id, save_path, cb))
+                 for name, f_id in file_list.items()]
+        results = self._run_tasks(tasks, call_back, dir_call_back)
+        if any(code != LanZouCloud.SUCCESS for code in results.values()):
+            return LanZouCloud.FAILED
+        return self._restore_file(list(file_list.keys()), save_path)
 
+    @_traced('get_shared_file_url_info')
     def get_shared_file_url_info(self, share_url, pwd=""):
         """获取 文件 分享链接的详细信息"""
         infos = {}
@@ -611,91 +1916,47 @@ class LanZouCloud(object):
         if "输入密码" in html:  # 文件设置了提取码时
             if len(pwd) == 0:
                 return {"code": LanZouCloud.LACK_PASSWORD, "info": infos}
-            html = self._remove_notes(html)  # 如果没有给提取码就先不做无用功
-            post_str = re.findall(r"[^/]data\s:\s'(.*)'", html)[0] + str(pwd)
-            f_size = re.findall(r'class="n_filesize">[^<]*([\.0-9 MKBmkbGg]+)<div', html)[0]
-            f_time = re.findall(r'class="n_file_infos">([-0-9]+)<div', html)[0]
-            f_desc = re.findall(r'class="n_box_des">(.*)<div', html)[0]
-            # action=downprocess&sign=xxxxx&p=pwd
-            post_data = {}
-            for i in post_str.split("&"):  # 转换成 dict
-                k, v = i.split("=")
-                post_data[k] = v
-            link_info = self._post(self._host_url + "/ajaxm.php", post_data).json()
+            page = parser.parse_pwd_page(html, pwd)  # 如果没有给提取码就先不做无用功
+            link_info = self._post(self._host_url + "/ajaxm.php", page['post_data']).json()
             if link_info["zt"] == 1:
                 infos[link_info["inf"]] = {
                     'name': link_info["inf"],
-                    'time': f_time,  # 上传时间
-                    'size': f_size,  # 文件大小
-                    'pwd': pwd,      # 提取码
-                    'des': f_desc,   # 描述
+                    'time': page['time'],  # 上传时间
+                    'size': page['size'],  # 文件大小
+                    'pwd': pwd,            # 提取码
+                    'des': page['desc'],   # 描述
                     'share_url': share_url
                 }
                 return {"code": LanZouCloud.SUCCESS, "info": infos}
             else:
                 return {"code": LanZouCloud.PASSWORD_ERROR, "info": infos}
         else:
-            html = self._remove_notes(html)
-            f_name = re.findall(r'<div style="[^"]+">([^><]*?)</div>', html)
-            if f_name:
-                f_name = f_name[0]
-            else:
-                f_name = re.findall(r"var filename = '(.*)';", html)[0]
-            f_size = re.findall(r'文件大小：</span>([\.0-9 MKBmkbGg]+)<br', html)[0]
-            f_time = re.findall(r'上传时间：</span>([-0-9 月天小时分钟秒前]+)<br', html)[0]
-            f_desc = re.findall(r'文件描述：</span><br>([^<]+)</td>', html)[0].strip()
-            infos[f_name] = {
-                'name': f_name,
-                'time': f_time,  # 上传时间
-                'size': f_size,  # 文件大小
-                'pwd': pwd,      # 提取码
-                'des': f_desc,   # 描述
+            page = parser.parse_file_page(html)
+            infos[page['name']] = {
+                'name': page['name'],
+                'time': page['time'],  # 上传时间
+                'size': page['size'],  # 文件大小
+                'pwd': pwd,            # 提取码
+                'des': page['desc'],   # 描述
                 'share_url': share_url
             }
             return {"code": LanZouCloud.SUCCESS, "info": infos}
 
+    @_traced('get_shared_folder_url_info')
     def get_shared_folder_url_info(self, share_url, dir_pwd=""):
         """获取 文件夹 分享链接的详细信息"""
         infos = {}
         if self.is_file_url(share_url):
             return {"code": LanZouCloud.URL_INVALID, "info": infos}
-        html = requests.get(share_url, headers=self._headers).text
+        html = self._get(share_url).text
         if "文件不存在" in html:
             return {"code": LanZouCloud.FILE_CANCELLED, "info": infos}
-        html = self._remove_notes(html)
-        lx = re.findall(r"'lx':'?(\d)'?,", html)[0]
-        t = re.findall(r"var [0-9a-z]{6} = '(\d{10})';", html)[0]
-        k = re.findall(r"var [0-9a-z]{6} = '([0-9a-z]{15,})';", html)[0]
-        fid = re.findall(r"'fid':'?(\d+)'?,", html)[0]
-        desc = re.findall(r'id="filename">([^<]+)</span', html)
-        if desc:
-            desc = str(desc[0])
-        else:
-            desc = ""
-        page = 1
-        if "请输入密码" in html:
-            if len(dir_pwd) == 0:
-                return {"code": LanZouCloud.LACK_PASSWORD, "info": infos}
-            post_data = {"lx": lx, "pg": page, "k": k, "t": t, "fid": fid, "pwd": dir_pwd}
-        else:
-            post_data = {"lx": lx, "pg": page, "k": k, "t": t, "fid": fid}
-        while True:
-            try:
-                # 不用封装好的post函数以支持未登录的用户通过 URL 获取信息
-                r = requests.post(self._host_url + "/filemoreajax.php", data=post_data, headers=self._headers).json()
-            except requests.RequestException:
-                return {"code": LanZouCloud.FAILED, "info": infos}
-            if r["info"] == "没有了": break  # 已经拿到全部的文件信息
-            if r["info"] == "请刷新，重试":  # 也可以使用 r["zt"] == 4
-                sleep(0.6)  # 间隔大于一秒才能获得下一个页面
-                continue
-            if r["zt"] == 3:
-                return {"code": LanZouCloud.PASSWORD_ERROR, "info": infos}
-            elif r["zt"] == 1:
-                page += 1
-                post_data["pg"] = page
-                # 获取文件信息成功
-                for f in r["text"]:
+        _, desc = parser.parse_folder_page(html)
+        if "请输入密码" in html and len(dir_pwd) == 0:
+            return {"code": LanZouCloud.LACK_PASSWORD, "info": infos}
+        try:
+            for items in self._iter_shared_folder(html, dir_pwd):
+                for f in items:
                     infos[f["name_all"]] = {
                         'name': f["name_all"],
                         'time': f["time"],  # 上传时间
@@ -704,6 +1965,8 @@ class LanZouCloud(object):
                         'des': desc,        # 文件夹的描述
                         'share_url': self._host_url + "/" + f["id"]
                     }
-            else:
-                return {"code": LanZouCloud.FAILED, "info": infos}
+        except _PageError as e:
+            return {"code": e.code, "info": infos}
+        except requests.RequestException:
+            return {"code": LanZouCloud.FAILED, "info": infos}
         return {"code": LanZouCloud.SUCCESS, "info": infos}
@@ -0,0 +1,109 @@
+import threading
+
+from lanzou.utils import dump_json
+
+__all__ = ['MetricsCollector']
+
+
+class MetricsCollector(object):
+    """进程内的指标收集器(线程安全)，包括计数器和直方图，可以导出为 json 或 Prometheus 文本格式"""
+    # 默认的直方图分桶 s，覆盖一次接口请求到一个大文件的上传/下载
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+    def __init__(self, prefix='lanzou', buckets=BUCKETS):
+        self._prefix = prefix  # 指标名前缀
+        self._buckets = tuple(sorted(buckets))
+        self._counters = {}  # (name, labels): value
+        self._histograms = {}  # (name, labels): [各分桶的计数, 总和, 总数]
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """计数器加 value"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """直方图记录一个值"""
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(self._buckets), 0, 0]
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    @staticmethod
+    def _key(name, labels):
+        """指标的键，标签值统一转为字符串(和 Prometheus 一致)，否则 200 和 'error' 这样的值无法排序"""
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def reset(self):
+        """清空所有指标"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_dict(self):
+        """导出所有指标"""
+        with self._lock:
+            counters, histograms = {}, {}
+            for (name, labels), value in sorted(self._counters.items()):
+                counters.setdefault(name, []).append({'labels': dict(labels), 'value': value})
+            for (name, labels), (buckets, total, count) in sorted(self._histograms.items()):
+                histograms.setdefault(name, []).append({
+                    'labels': dict(labels),
+                    'buckets': {str(bound): n for bound, n in zip(self._buckets, buckets)},
+                    'sum': total,
+                    'count': count,
+                })
+            return {'counters': counters, 'histograms': histograms}
+
+    def dump_json(self, path):
+        """把所有指标保存为 json 文件"""
+        return dump_json(path, self.to_dict())
+
+    def to_prometheus(self):
+        """导出为 Prometheus 文本格式"""
+        lines = []
+        data = self.to_dict()
+        for name, items in data['counters'].items():
+            name = f'{self._prefix}_{name}'
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(f'{name}{self._format_labels(i["labels"])} {i["value"]}' for i in items)
+        for name, items in data['histograms'].items():
+            name = f'{self._prefix}_{name}'
+            lines.append(f'# TYPE {name} histogram')
+            for i in items:
+                for bound, n in i['buckets'].items():
+                    lines.append(f'{name}_bucket{self._format_labels({**i["labels"], "le": bound})} {n}')
+                lines.append(f'{name}_bucket{self._format_labels({**i["labels"], "le": "+Inf"})} {i["count"]}')
+                lines.append(f'{name}_sum{self._format_labels(i["labels"])} {i["sum"]}')
+                lines.append(f'{name}_count{self._format_labels(i["labels"])} {i["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _format_labels(labels):
+        if not labels:
+            return ''
+        escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for v in labels.values())
+        return '{' + ','.join(f'{k}="{v}"' for k, v in zip(labels.keys(), escaped)) + '}'
+
+    # 以下方法作为 LanZouCloud 的钩子函数使用，见 LanZouCloud.enable_metrics
+
+    def on_response(self, method, url, op, status, elapsed, error):
+        self.inc('requests_total', op=op, method=method, status=status if error is None else 'error')
+        self.observe('request_seconds', elapsed, op=op, method=method)
+
+    def on_span(self, name, elapsed, error):
+        self.inc('operations_total', op=name, result='ok' if error is None else 'error')
+        self.observe('operation_seconds', elapsed, op=name)
+
+    def on_transfer(self, op, direction, size):
+        self.inc('bytes_total', size, op=op, direction=direction)
+
+    def on_retry(self, op, reason):
+        self.inc('retries_total', op=op, reason=reason)
@@ -0,0 +1,246 @@
+import re
+
+__all__ = ['remove_notes', 'parse_formhash', 'is_login_required', 'parse_dir_list', 'parse_full_path', 'parse_recycle',
+           'parse_pwd_page', 'parse_file_page', 'parse_sign_form', 'parse_folder_page', 'parse_js_object']
+
+# 蓝奏云的网页里有很多被注释掉的旧代码，会干扰正则匹配
+# 这里不再先删除注释(每次都要复制整个网页)再逐个 findall 整个网页，而是每个字段用预编译的正则查找第一个匹配，
+# 找到后检查它是否位于注释中，是的话跳过注释继续查找
+# 每个正则都以固定的字符串开头，re 模块可以快速定位，比把所有字段合并成一个多分支正则逐字符尝试更快
+_NOTES = re.compile(r'<!--.*?-->|//.*?\n')
+_FORMHASH = re.compile(r'name="formhash" value="(.+?)"')
+_LOGIN_REQUIRED = re.compile(r'\s*\{\s*"zt"\s*:\s*"?9\b')  # 会话失效时控制台接口返回 {"zt": 9, "info": "请登录"}
+_DIR_ITEM = re.compile(r'&nbsp;(.+?)</a>&nbsp;.+"folk(\d+)"(.*?)>.+#BBBBBB">\[?(.*?)\.+\]?</font>')
+_PATH_ITEM = re.compile(r'&raquo;&nbsp;.+folder_id=([0-9]+)">.+&nbsp;(.+?)</a>')
+_CURRENT_FOLDER = re.compile(r'&raquo;&nbsp;.+&nbsp;(.+) <font')
+_RECYCLE_DIR = re.compile(r'folder_id=(\d+).*?images/folder.*?>(?:&nbsp;)?(.*?)</a>', re.DOTALL)
+_RECYCLE_FILE = re.compile(r'value="(\d+)".*?/images/file.*?>\s(.*?)</a>', re.DOTALL)
+
+# 有提取码的文件分享页面
+_PWD_PAGE = {
+    'post_str': re.compile(r"data\s:\s'(.*)'"),  # action=downprocess&sign=xxxxx&p=
+    'size': re.compile(r'class="n_filesize">[^<]*?([\.0-9 MKBmkbGg]+)<div'),
+    'time': re.compile(r'class="n_file_infos">([-0-9]+)<div'),
+    'desc': re.compile(r'class="n_box_des">(.*)<div'),
+}
+
+# 无提取码的文件分享页面，文件名可能在 <div> 中，可能在变量 filename 后面
+_FILE_PAGE = {
+    'para': re.compile(r'<iframe.*?src="(.*?)"'),  # 下载页面 URL 的参数
+    'name': re.compile(r"<div style.+>([^<]+)</div>\n<div class=\"d2\">|filename = '(.*?)';"),
+    'size': re.compile(r'文件大小：</span>([\.0-9 MKBmkbGg]+)<br'),
+    'time': re.compile(r'上传时间：</span>([-0-9 月天小时分钟秒前]+)<br'),
+    'desc': re.compile(r'文件描述：</span><br>([^<]+)</td>'),
+}
+
+# 文件下载页面(iframe)
+_SIGN_DATA = re.compile(r'data\s:\s(.*),')  # data : {'action': 'downprocess', 'sign': 'xxx', 'ver': 1},
+# js 对象字面量中的记号: 单引号字符串、双引号字符串、数字、变量名、标点
+_JS_TOKEN = re.compile(r"""\s*(?:'([^'\\]*)'|"([^"\\]*)"|(-?\d+(?:\.\d+)?)|([A-Za-z_$][\w$]*)|([{}:,]))""")
+_JS_CONSTANTS = {'true': True, 'false': False, 'null': None}
+
+# 文件夹分享页面
+_FOLDER_PAGE = {
+    'lx': re.compile(r"'lx':'?(\d)'?,"),
+    't': re.compile(r"var [0-9a-z]{6} = '(\d{10})';"),
+    'k': re.compile(r"var [0-9a-z]{6} = '([0-9a-z]{15,})';"),
+    'fid': re.compile(r"'fid':'?(\d+)'?,"),
+    'desc': re.compile(r'id="filename">([^<]+)</span'),
+}
+
+
+def _search(pattern, html):
+    """查找第一个不在注释中的匹配"""
+    pos = 0
+    while True:
+        match = pattern.search(html, pos)
+        if match is None:
+            return None
+        start = match.start()
+        line_start = html.rfind('\n', 0, start) + 1
+        line_end = html.find('\n', start)
+        if line_end == -1:
+            line_end = len(html)
+        if html.find('//', line_start, start) != -1:  # 在 // 注释中，跳到下一行
+            pos = line_end + 1
+            continue
+        note_start = html.rfind('<!--', line_start, start)
+        if note_start != -1 and html.find('-->', note_start, start) == -1:
+            note_end = html.find('-->', start, line_end)
+            if note_end != -1:  # 在 <!-- --> 注释中(和 remove_notes 一样，只处理单行的注释)
+                pos = note_end + 3
+                continue
+        return match
+
+
+def _scan(patterns, html):
+    """提取网页中的字段 {字段名: 第一个分组的值}，没有匹配的字段不出现在结果中"""
+    fields = {}
+    for name, pattern in patterns.items():
+        match = _search(pattern, html)
+        if match is not None:
+            fields[name] = match.group(match.lastindex or 0)
+    return fields
+
+
+def _parse_query(query):
+    """把 a=1&b=2 格式的字符串转换成 dict"""
+    data = {}
+    for i in query.split('&'):
+        k, v = i.split('=')
+        data[k] = v
+    return data
+
+
+def remove_notes(html):
+    """删除网页的注释"""
+    # 去掉 html 里面的 // 和 <!-- --> 注释，防止干扰正则匹配提取数据
+    return _NOTES.sub('', html)
+
+
+def parse_formhash(html):
+    """提取表单 hash，不存在时抛出 IndexError"""
+    match = _FORMHASH.search(html)
+    if match is None:
+        raise IndexError('formhash not found')
+    return match.group(1)
+
+
+def is_login_required(text):
+    """控制台接口返回的 json 是否表示会话已失效，需要重新登录"""
+    return _LOGIN_REQUIRED.match(text) is not None
+
+
+def parse_dir_list(html):
+    """从 mydisk.php 页面提取子文件夹信息"""
+    folder_list = {}
+    for folder_name, fid, pwd_flag, desc in _DIR_ITEM.findall(html):
+        folder_list[folder_name] = {
+            "id": int(fid),
+            "name": folder_name.replace('&amp;', '&'),  # 修复网页中的 &amp; 为 &
+            "has_pwd": True if pwd_flag else False,  # 有密码时 pwd_flag 值为 style="display:initial"
+            "desc": desc  # 文件夹描述
+        }
+    return folder_list
+
+
+def parse_full_path(html, folder_id=-1):
+    """从 mydisk.php 页面提取文件夹的完整路径 {文件夹名: id}，获取当前文件夹名失败时抛出 IndexError"""
+    path_list = {'LanZouCloud': -1}
+    for match in _PATH_ITEM.finditer(html):
+        path_list[match.group(2)] = int(match.group(1))
+    if folder_id != -1:  # 当前文件夹名称
+        match = _CURRENT_FOLDER.search(html)
+        if match is None:
+            raise IndexError('current folder not found')
+        path_list[match.group(1).replace('&amp;', '&')] = folder_id
+    return path_list
+
+
+def parse_recycle(html):
+    """从回收站页面提取文件夹和文件 {名称: id}"""
+    dirs = {name: int(fid) for fid, name in _RECYCLE_DIR.findall(html)}
+    files = {name: int(fid) for fid, name in _RECYCLE_FILE.findall(html)}
+    return dirs, files
+
+
+def parse_pwd_page(html, pwd=''):
+    """从有提取码的文件分享页面提取 ajaxm.php 的表单和文件信息，表单不存在时抛出 IndexError"""
+    fields = _scan(_PWD_PAGE, html)
+    if 'post_str' not in fields:
+        raise IndexError('post data not found')
+    return {
+        'post_data': _parse_query(fields['post_str'] + str(pwd)),
+        'size': fields.get('size', ''),
+        'time': fields.get('time', ''),
+        'desc': fields.get('desc', ''),
+    }
+
+
+def parse_file_page(html):
+    """从无提取码的文件分享页面提取下载页面 URL 的参数和文件信息，参数不存在时抛出 IndexError"""
+    fields = _scan(_FILE_PAGE, html)
+    if 'para' not in fields:
+        raise IndexError('download page not found')
+    return {
+        'para': fields['para'],
+        'name': fields.get('name', ''),
+        'size': fields.get('size', ''),
+        'time': fields.get('time', ''),
+        'desc': fields.get('desc', '').strip(),
+    }
+
+
+def _js_var(html, name):
+    """获取网页中 js 字符串变量的值，不存在时抛出 IndexError"""
+    match = _search(re.compile(r"var " + re.escape(name) + r"\s*=\s*'(.*?)'"), html)
+    if match is None:
+        raise IndexError(f'var {name} not found')
+    return match.group(1)
+
+
+def _js_tokens(text):
+    """把 js 对象字面量切分成记号 (类型, 值)，类型为 'str', 'num', 'var' 或标点本身"""
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _JS_TOKEN.match(text, pos)
+        if match is None:
+            raise ValueError(f'unexpected character at {pos}: {text[pos:pos + 10]!r}')
+        pos = match.end()
+        single, double, number, name, punct = match.groups()
+        if single is not None or double is not None:
+            yield 'str', single if single is not None else double
+        elif number is not None:
+            yield 'num', float(number) if '.' in number else int(number)
+        elif name is not None:
+            yield 'var', name
+        else:
+            yield punct, punct
+
+
+def parse_js_object(text, html=''):
+    """解析一层的 js 对象字面量 {'key': 值, ...}，值为变量名时从 html 中查找变量的值，格式错误时抛出 ValueError"""
+    # 只认识字符串、数字、true/false/null 和字符串变量，不执行任何代码
+    tokens = _js_tokens(text)
+    result = {}
+    if next(tokens, (None,))[0] != '{':
+        raise ValueError('object literal should start with {')
+    for kind, key in tokens:
+        if kind == '}' and not result:
+            return result  # 空对象
+        if kind not in ('str', 'var'):
+            raise ValueError(f'unexpected key: {key!r}')
+        if next(tokens, (None,))[0] != ':':
+            raise ValueError(f'missing : after {key!r}')
+        kind, value = next(tokens, (None, None))
+        if kind == 'var':
+            value = _JS_CONSTANTS[value] if value in _JS_CONSTANTS else _js_var(html, value)
+        elif kind not in ('str', 'num'):
+            raise ValueError(f'unexpected value for {key!r}: {value!r}')
+        result[key] = value
+        kind = next(tokens, (None,))[0]
+        if kind == '}':
+            return result
+        if kind != ',':
+            raise ValueError(f'missing , after {key!r}')
+    raise ValueError('object literal is not closed')
+
+
+def parse_sign_form(html):
+    """从下载页面提取 ajaxm.php 的表单，不存在时抛出 IndexError，格式错误时抛出 ValueError"""
+    # data: {'action': 'downprocess', 'sign': 'xxx', 'ver': 1}
+    # 一般情况 sign 的值就在 data 里，有时放在变量 sg 后面: {'action': 'downprocess', 'sign': sg, 'ver': 1}
+    match = _search(_SIGN_DATA, html)
+    if match is None:
+        raise IndexError('post data not found')
+    return parse_js_object(match.group(1), html)
+
+
+def parse_folder_page(html):
+    """从文件夹分享页面提取 filemoreajax.php 的表单参数和文件夹描述，参数不存在时抛出 IndexError"""
+    fields = _scan(_FOLDER_PAGE, html)
+    for key in ('lx', 't', 'k', 'fid'):
+        if key not in fields:
+            raise IndexError(f'{key} not found')
+    return {'lx': fields['lx'], 'k': fields['k'], 't': fields['t'], 'fid': fields['fid']}, fields.get('desc', '')
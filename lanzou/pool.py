@@ -0,0 +1,225 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+
+from lanzou.api import LanZouCloud, requests
+
+__all__ = ['ClientPool']
+
+
+class _Account(object):
+    """池中的一个账号及其最近的负载情况"""
+    # 出错率和限流率都是每个请求/操作的指数加权平均，越近的结果权重越大
+    DECAY = 0.8
+
+    def __init__(self, name, client, weight=1):
+        self.name = name
+        self.client = client
+        self.weight = weight  # 权重越大分到的任务越多
+        self.inflight = 0  # 正在执行的操作数
+        self.operations = 0
+        self.errors = 0
+        self.throttled = 0
+        self.error_rate = 0.0
+        self.throttle_rate = 0.0
+        self.cooldown_until = 0  # 被限流后暂停调度到这个时间
+        self.last_used = 0
+
+    def score(self):
+        """负载得分，越小越优先调度"""
+        return (self.inflight + 1) / self.weight * (1 + 4 * self.error_rate + 8 * self.throttle_rate)
+
+    def record(self, error=False, throttled=False):
+        self.error_rate = self.DECAY * self.error_rate + (1 - self.DECAY) * error
+        self.throttle_rate = self.DECAY * self.throttle_rate + (1 - self.DECAY) * throttled
+        self.errors += error
+        self.throttled += throttled
+
+
+class ClientPool(object):
+    """多个账号的 LanZouCloud 客户端池，按各账号的负载和最近的出错、限流情况调度上传、列表和直链解析"""
+    # 蓝奏云按账号限流，一个账号的吞吐量有上限，多个账号分担任务时总吞吐量随账号数增长
+    # 分享链接的解析和下载不依赖账号，由任意账号执行；上传和列表只能在账号自己的网盘中进行
+
+    def __init__(self, max_workers=4, cooldown=30):
+        self._accounts = {}  # name: _Account
+        self._lock = threading.Lock()
+        self._max_workers = max_workers  # 批量操作的最大线程数
+        self._cooldown = cooldown  # 账号被限流后暂停调度的时间 s
+
+    def __len__(self):
+        return len(self._accounts)
+
+    def set_max_workers(self, num):
+        """设置批量操作的最大线程数"""
+        if isinstance(num, int) and num > 0:
+            self._max_workers = num
+            return LanZouCloud.SUCCESS
+        else:
+            return LanZouCloud.FAILED
+
+    def login(self, username, passwd, weight=1):
+        """登录一个账号并加入池中，账号名为 username"""
+        client = LanZouCloud()
+        code = client.login(username, passwd)
+        if code != LanZouCloud.SUCCESS:
+            return code
+        return self.add_client(client, username, weight)
+
+    def add_client(self, client, name=None, weight=1):
+        """把已登录的客户端加入池中，name 默认为 account0, account1..."""
+        name = name or f'account{len(self._accounts)}'
+        if name in self._accounts or weight <= 0:
+            return LanZouCloud.FAILED
+        account = _Account(name, client, weight)
+        # 通过监控钩子观察每个请求: 503/429 视为被限流，其他 5xx 和网络错误视为出错
+        client.add_hook('response', lambda method, url, op, status, elapsed, error:
+                        self._record(account, error is not None or (status >= 500 and status != 503),
+                                     status in (429, 503)))
+        client.add_hook('retry', lambda op, reason: self._record(account, reason != 'throttled',
+                                                                 reason == 'throttled'))
+        with self._lock:
+            self._accounts[name] = account
+        return LanZouCloud.SUCCESS
+
+    def remove_client(self, name):
+        """从池中移除账号，返回它的客户端，不存在时返回 None"""
+        with self._lock:
+            account = self._accounts.pop(name, None)
+        return account.client if account else None
+
+    def get_client(self, name):
+        """获取账号的客户端，不存在时返回 None"""
+        account = self._accounts.get(name)
+        return account.client if account else None
+
+    def get_stats(self):
+        """获取各账号的调度统计"""
+        with self._lock:
+            return {a.name: {'inflight': a.inflight, 'operations': a.operations, 'errors': a.errors,
+                             'throttled': a.throttled, 'error_rate': a.error_rate, 'throttle_rate': a.throttle_rate,
+                             'cooling_down': a.cooldown_until > time(), 'score': a.score()}
+                    for a in self._accounts.values()}
+
+    def _record(self, account, error=False, throttled=False):
+        with self._lock:
+            account.record(error, throttled)
+            if throttled:
+                account.cooldown_until = time() + self._cooldown
+
+    def _acquire(self, names=None):
+        """选出负载得分最低的账号，names 限定候选账号；优先选不在冷却中的账号，池为空时返回 None"""
+        now = time()
+        with self._lock:
+            candidates = [a for name, a in self._accounts.items() if names is None or name in names]
+            if not candidates:
+                return None
+            candidates = [a for a in candidates if a.cooldown_until <= now] or candidates
+            account = min(candidates, key=lambda a: (a.score(), a.last_used))
+            account.inflight += 1
+            account.last_used = now
+            return account
+
+    @staticmethod
+    def _failed(result):
+        """操作结果是否为失败，提取码错误等不是账号的问题，不算失败"""
+        return (result['code'] if isinstance(result, dict) else result) == LanZouCloud.FAILED
+
+    def _call(self, func, names=None, default=LanZouCloud.FAILED, failed=None):
+        """在调度选出的账号上执行 func(client)，返回 (账号名, 结果)，failed(结果) 判断操作是否失败"""
+        account = self._acquire(names)
+        if account is None:
+            return None, default
+        error = True
+        try:
+            result = func(account.client)
+            error = (failed or self._failed)(result)
+            return account.name, result
+        except (requests.RequestException, IndexError, KeyError, ValueError):
+            return account.name, default
+        finally:
+            with self._lock:
+                account.inflight -= 1
+                account.operations += 1
+                account.record(error=error)
+
+    def _map(self, func, items):
+        """多线程执行 func(item)，返回 {item: 结果}"""
+        items = list(dict.fromkeys(items))
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            return dict(zip(items, executor.map(func, items)))
+
+    # ---- 不依赖账号的操作 ----
+
+    def get_direct_url(self, share_url, pwd=''):
+        """获取直链"""
+        default = {'code': LanZouCloud.FAILED, 'name': '', 'direct_url': ''}
+        return self._call(lambda c: c.get_direct_url(share_url, pwd), default=default)[1]
+
+    def get_direct_urls(self, share_urls, pwd=''):
+        """由多个账号并发获取直链，返回 {share_url: 直链信息}"""
+        return self._map(lambda url: self.get_direct_url(url, pwd), share_urls)
+
+    def get_shared_file_url_info(self, share_url, pwd=''):
+        """获取 文件 分享链接的详细信息"""
+        default = {'code': LanZouCloud.FAILED, 'info': {}}
+        return self._call(lambda c: c.get_shared_file_url_info(share_url, pwd), default=default)[1]
+
+    def get_shared_folder_url_info(self, share_url, dir_pwd=''):
+        """获取 文件夹 分享链接的详细信息"""
+        default = {'code': LanZouCloud.FAILED, 'info': {}}
+        return self._call(lambda c: c.get_shared_folder_url_info(share_url, dir_pwd), default=default)[1]
+
+    def download_file(self, share_url, pwd='', save_path='.', call_back=None):
+        """通过分享链接下载文件"""
+        return self._call(lambda c: c.download_file(share_url, pwd, save_path, call_back))[1]
+
+    # ---- 在账号自己的网盘中进行的操作 ----
+
+    def upload_file(self, file_path, folder_id=-1, call_back=None):
+        """上传文件到负载最低的账号，folder_id 可以是 {账号名: 文件夹 id}，这时只上传到其中的账号
+        返回 {'code': 状态码, 'account': 账号名}"""
+        if isinstance(folder_id, dict):
+            folders = {self._accounts[name].client: fid for name, fid in folder_id.items() if name in self._accounts}
+            name, code = self._call(lambda c: c.upload_file(file_path, folders[c], call_back), folder_id.keys())
+        else:
+            name, code = self._call(lambda c: c.upload_file(file_path, folder_id, call_back))
+        return {'code': code, 'account': name}
+
+    def upload_files(self, file_paths, folder_id=-1, call_back=None, dir_call_back=None):
+        """多个账号并发上传文件，返回 {file_path: {'code': 状态码, 'account': 账号名}}"""
+        # dir_call_back(file_path, code, finished, total) 在每个文件上传结束后调用
+        lock = threading.Lock()
+        file_paths = list(dict.fromkeys(file_paths))
+        finished = []
+
+        def _call_back(file_name, total_size, now_size):
+            with lock:  # 多个线程同时回调时串行化，防止调用方输出错乱
+                call_back(file_name, total_size, now_size)
+
+        def _upload(file_path):
+            result = self.upload_file(file_path, folder_id, _call_back if call_back is not None else None)
+            with lock:
+                finished.append(file_path)
+                if dir_call_back is not None:
+                    dir_call_back(file_path, result['code'], len(finished), len(file_paths))
+            return result
+
+        return self._map(_upload, file_paths)
+
+    def get_file_lists(self, folder_id=-1):
+        """并发获取各账号的文件列表，folder_id 可以是 {账号名: 文件夹 id}，返回 {账号名: 文件列表}"""
+        return self._list(lambda c, fid: c.get_file_list(fid), folder_id)
+
+    def get_dir_lists(self, folder_id=-1):
+        """并发获取各账号的子文件夹列表，folder_id 可以是 {账号名: 文件夹 id}，返回 {账号名: 文件夹列表}"""
+        return self._list(lambda c, fid: c.get_dir_list(fid), folder_id)
+
+    def _list(self, func, folder_id):
+        """在每个账号上执行 func(client, 文件夹 id)，返回 {账号名: 结果}"""
+        folders = folder_id if isinstance(folder_id, dict) else {name: folder_id for name in self._accounts}
+
+        def _list_one(name):  # 列表为空不一定是失败，只通过监控钩子统计请求的错误
+            return self._call(lambda c: func(c, folders[name]), [name], {}, lambda _: False)[1]
+
+        return self._map(_list_one, folders.keys())
@@ -0,0 +1,154 @@
+from lanzou.utils import load_json, dump_json
+
+__all__ = ['FolderTree']
+
+
+class FolderTree(object):
+    """网盘目录树，支持按 id 和路径查找文件(夹)"""
+    # 根目录 id 为 -1，路径为 /，子文件夹路径形如 /a/b，文件路径形如 /a/b/c.zip
+
+    def __init__(self):
+        self._folders = {-1: {'id': -1, 'name': 'LanZouCloud', 'parent_id': None, 'has_pwd': False, 'desc': '',
+                              'folders': [], 'files': []}}
+        self._files = {}
+        self._paths = {'/': ('folder', -1)}  # 路径索引 path: (类型, id)
+        self.stale = set()  # 最近一次刷新时获取列表失败、内容可能已过时的文件夹 id
+
+    def __len__(self):
+        return len(self._folders) + len(self._files)
+
+    def __contains__(self, folder_id):
+        return folder_id in self._folders
+
+    def get_folder(self, folder_id):
+        """通过 id 获取文件夹信息，'folders' 和 'files' 为子文件夹和文件的 id 列表"""
+        return self._folders.get(folder_id)
+
+    def get_file(self, file_id):
+        """通过 id 获取文件信息"""
+        return self._files.get(file_id)
+
+    def find(self, path):
+        """通过路径获取文件(夹)信息，不存在时返回 None"""
+        path = '/' + path.strip('/')
+        kind, fid = self._paths.get(path, (None, None))
+        if kind == 'folder':
+            return self._folders[fid]
+        elif kind == 'file':
+            return self._files[fid]
+        return None
+
+    def get_path(self, fid, is_file=False):
+        """获取文件(夹)的完整路径"""
+        names = []
+        if is_file:
+            info = self._files[fid]
+            names.append(info['name'])
+            fid = info['folder_id']
+        while fid != -1:
+            names.append(self._folders[fid]['name'])
+            fid = self._folders[fid]['parent_id']
+        return '/' + '/'.join(reversed(names))
+
+    def walk(self, folder_id=-1):
+        """遍历文件夹，类似 os.walk，返回 (路径, 子文件夹列表, 文件列表)"""
+        stack = [folder_id]
+        while stack:
+            folder = self._folders[stack.pop()]
+            yield (self.get_path(folder['id']), [self._folders[i] for i in folder['folders']],
+                   [self._files[i] for i in folder['files']])
+            stack.extend(reversed(folder['folders']))
+
+    def add_folder(self, parent_id, info):
+        """添加(或更新)子文件夹，info 为 get_dir_list 返回的文件夹信息"""
+        old = self._folders.get(info['id'])
+        if old is not None and old['parent_id'] != parent_id:
+            self.remove_folder(info['id'])  # 文件夹被移动了
+            old = None
+        folder = {'id': info['id'], 'name': info['name'], 'parent_id': parent_id, 'has_pwd': info['has_pwd'],
+                  'desc': info['desc'], 'folders': old['folders'] if old else [], 'files': old['files'] if old else []}
+        if old is not None and old['name'] != folder['name']:
+            self._reindex(info['id'], old['name'], folder['name'])  # 文件夹改名了
+        self._folders[info['id']] = folder
+        if info['id'] not in self._folders[parent_id]['folders']:
+            self._folders[parent_id]['folders'].append(info['id'])
+        self._paths[self.get_path(info['id'])] = ('folder', info['id'])
+        return folder
+
+    def add_file(self, folder_id, info):
+        """添加(或更新)文件，info 为 get_file_list 返回的文件信息"""
+        old = self._files.get(info['id'])
+        if old is not None:
+            self.remove_file(info['id'])
+        self._files[info['id']] = {**info, 'folder_id': folder_id}
+        self._folders[folder_id]['files'].append(info['id'])
+        self._paths[self.get_path(info['id'], is_file=True)] = ('file', info['id'])
+
+    def remove_file(self, file_id):
+        """删除文件"""
+        info = self._files.get(file_id)
+        if info is None:
+            return
+        self._paths.pop(self.get_path(file_id, is_file=True), None)
+        self._folders[info['folder_id']]['files'].remove(file_id)
+        del self._files[file_id]
+
+    def remove_folder(self, folder_id):
+        """删除文件夹及其中的所有内容"""
+        folder = self._folders.get(folder_id)
+        if folder is None or folder_id == -1:
+            return
+        for fid in list(folder['files']):
+            self.remove_file(fid)
+        for fid in list(folder['folders']):
+            self.remove_folder(fid)
+        self._paths.pop(self.get_path(folder_id), None)
+        self._folders[folder['parent_id']]['folders'].remove(folder_id)
+        del self._folders[folder_id]
+        self.stale.discard(folder_id)
+
+    def update_folder(self, folder_id, dir_list, file_list):
+        """用最新的列表替换文件夹的内容，返回新增的子文件夹 id"""
+        folder = self._folders[folder_id]
+        dir_ids = {info['id'] for info in dir_list.values()}
+        file_ids = {info['id'] for info in file_list.values()}
+        for fid in [i for i in folder['folders'] if i not in dir_ids]:
+            self.remove_folder(fid)
+        for fid in [i for i in folder['files'] if i not in file_ids]:
+            self.remove_file(fid)
+        new_folders = [info['id'] for info in dir_list.values() if info['id'] not in self._folders]
+        for info in dir_list.values():
+            self.add_folder(folder_id, info)
+        for info in file_list.values():
+            self.add_file(folder_id, info)
+        return new_folders
+
+    def _reindex(self, folder_id, old_name, new_name):
+        """文件夹改名后更新其下所有路径的索引"""
+        parent_path = self.get_path(self._folders[folder_id]['parent_id'])
+        old_prefix = parent_path.rstrip('/') + '/' + old_name
+        new_prefix = parent_path.rstrip('/') + '/' + new_name
+        for path in [p for p in self._paths if p == old_prefix or p.startswith(old_prefix + '/')]:
+            self._paths[new_prefix + path[len(old_prefix):]] = self._paths.pop(path)
+
+    def to_dict(self):
+        return {'folders': list(self._folders.values()), 'files': list(self._files.values())}
+
+    @classmethod
+    def from_dict(cls, data):
+        tree = cls()
+        tree._folders = {f['id']: f for f in data['folders']}
+        tree._files = {f['id']: f for f in data['files']}
+        tree._paths = {tree.get_path(fid): ('folder', fid) for fid in tree._folders}
+        tree._paths.update({tree.get_path(fid, is_file=True): ('file', fid) for fid in tree._files})
+        return tree
+
+    def save(self, path):
+        """保存到文件"""
+        return dump_json(path, self.to_dict())
+
+    @classmethod
+    def load(cls, path):
+        """从文件读取，文件不存在时返回 None"""
+        data = load_json(path)
+        return cls.from_dict(data) if data else None
@@ -0,0 +1,403 @@
+import hashlib
+import importlib
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+from time import time, sleep
+
+__all__ = ['TTLCache', 'RateLimiter', 'FlowController', 'TimeoutPolicy', 'TransferProgress', 'FileSlice', 'HashReader', 'LazyModule', 'load_json', 'dump_json', 'file_hash']
+
+
+class TTLCache(object):
+    """带过期时间的 LRU 缓存(线程安全)，可选保存到本地文件"""
+
+    def __init__(self, max_size=1024, ttl=600, path=None):
+        self._max_size = max_size  # 最多缓存的条目数，超出时淘汰最久未使用的条目
+        self._ttl = ttl  # 条目的有效期 s
+        self._path = path  # 持久化文件路径，None 表示只缓存在内存中
+        self._data = OrderedDict()  # key: (expire_time, value)
+        self._lock = threading.Lock()
+        if path is not None:
+            self._load()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """获取缓存，不存在或已过期时返回 default"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[0] < time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value):
+        """添加或更新缓存"""
+        with self._lock:
+            self._data[key] = (time() + self._ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._max_size:
+                self._data.popitem(last=False)
+            self._dump()
+
+    def replace(self, key, value):
+        """修改未过期的缓存内容，不改变过期时间，返回是否修改成功"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time():
+                return False
+            self._data[key] = (item[0], value)
+            self._dump()
+            return True
+
+    def keys(self):
+        """获取所有未过期缓存的 key"""
+        now = time()
+        with self._lock:
+            return [key for key, (expire, _) in self._data.items() if expire >= now]
+
+    def pop(self, key):
+        """删除缓存"""
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._dump()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._data.clear()
+            self._dump()
+
+    def _load(self):
+        """从文件恢复未过期的缓存"""
+        items = load_json(self._path, [])
+        now = time()
+        for key, expire, value in items[-self._max_size:]:
+            if expire > now:
+                self._data[tuple(key)] = (expire, value)  # json 不支持元组，保存时被转成了列表
+
+    def _dump(self):
+        """把缓存写入文件"""
+        if self._path is None:
+            return
+        dump_json(self._path, [[key, expire, value] for key, (expire, value) in self._data.items()])
+
+
+class RateLimiter(object):
+    """限制请求速率(线程安全)，多个线程共用时请求被均匀地错开"""
+
+    def __init__(self, rate=10):
+        self._interval = 1 / rate if rate > 0 else 0  # 两次请求的最小间隔 s，rate <= 0 表示不限速
+        self._next_time = 0  # 下一个请求允许发出的时间
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """等待到允许发出下一个请求"""
+        with self._lock:
+            now = time()
+            wait_time = self._next_time - now
+            self._next_time = max(now, self._next_time) + self._interval
+        if wait_time > 0:
+            sleep(wait_time)
+
+
+class FlowController(object):
+    """自适应的请求流量控制(线程安全): 令牌桶限制速率，AIMD 调整并发数
+    服务器正常响应时并发数和速率线性增加，被限流(429/5xx/超时/要求重试)时减半"""
+
+    def __init__(self, max_rate=0, max_concurrency=32, min_rate=1, increase=2, cooldown=1):
+        self._max_rate = max_rate  # 速率上限 次/s，0 表示不限
+        self._max_concurrency = max_concurrency  # 并发数上限
+        self._min_rate = min_rate  # 减速时的速率下限 次/s
+        self._increase = increase  # 没有被限流时速率每秒增加多少 次/s
+        self._cooldown = cooldown  # 两次减速的最小间隔 s，同一波限流中并发的请求只减速一次
+        self._rate = max_rate  # 当前速率，0 表示不限
+        self._recover_rate = 0  # 原本不限速时，速率恢复到该值就取消限速
+        self._tokens = max(max_rate, 1)
+        self._limit = float(max_concurrency)  # 当前并发数上限
+        self._inflight = 0
+        self._recent = deque()  # 最近 1s 内发出请求的时间，用于估算不限速时的实际速率
+        self._last_refill = time()
+        self._last_increase = time()
+        self._last_decrease = 0
+        self.throttled = 0  # 减速的次数
+        self._cond = threading.Condition()
+
+    def stats(self):
+        """当前的速率(0 表示不限)、并发数上限、正在进行的请求数和减速的次数"""
+        with self._cond:
+            return {'rate': self._rate, 'concurrency': int(self._limit), 'inflight': self._inflight,
+                    'throttled': self.throttled}
+
+    def acquire(self):
+        """等待并发名额和令牌，请求结束后必须调用 release"""
+        with self._cond:
+            while self._inflight >= int(self._limit):
+                self._cond.wait()
+            wait_time = self._admit()
+        if wait_time > 0:
+            sleep(wait_time)
+
+    def try_acquire(self):
+        """不等待并发名额: 有名额时占用名额并返回还需等待令牌的时间 s，没有名额时返回 None(供协程轮询)"""
+        with self._cond:
+            if self._inflight >= int(self._limit):
+                return None
+            return self._admit()
+
+    def _admit(self):
+        """占用一个名额并预支一个令牌，返回令牌不足时需要等待的时间"""
+        self._inflight += 1
+        now = time()
+        self._recent.append(now)
+        while self._recent[0] < now - 1:
+            self._recent.popleft()
+        if not self._rate:
+            return 0
+        self._tokens = min(self._tokens + (now - self._last_refill) * self._rate, max(self._rate, 1))
+        self._last_refill = now
+        self._tokens -= 1
+        return -self._tokens / self._rate if self._tokens < 0 else 0
+
+    def release(self, congested=False):
+        """请求结束，congested 表示服务器过载或要求降速"""
+        with self._cond:
+            self._inflight -= 1
+            if congested:
+                self._decrease()
+            else:
+                self._grow()
+            self._cond.notify_all()
+
+    def throttle(self):
+        """服务器要求降速(如接口返回 "请刷新，重试")"""
+        with self._cond:
+            self._decrease()
+
+    def _grow(self):
+        now = time()
+        self._limit = min(self._limit + 1 / self._limit, self._max_concurrency)  # 每个并发窗口加 1
+        if self._rate:
+            self._rate += self._increase * min(now - self._last_increase, 1)
+            if self._max_rate and self._rate >= self._max_rate:
+                self._rate = self._max_rate
+            elif not self._max_rate and self._rate >= self._recover_rate:
+                self._rate = 0
+        self._last_increase = now
+
+    def _decrease(self):
+        now = time()
+        if now - self._last_decrease < self._cooldown:
+            return
+        self._last_decrease = now
+        self.throttled += 1
+        self._limit = max(self._limit / 2, 1)
+        rate = self._rate or max(len(self._recent), self._min_rate)  # 不限速时以最近 1s 的实际速率为基准
+        if not self._max_rate and not self._rate:
+            self._recover_rate = rate * 2
+        self._rate = max(rate / 2, self._min_rate)
+        self._tokens = min(self._tokens, 0)  # 丢弃积攒的令牌，立即按新的速率发送
+        self._last_refill = now  # 否则下次取令牌时会按减速前的空闲时间补满令牌桶
+
+
+class TimeoutPolicy(object):
+    """网络请求的超时设置 s，None 表示不限制"""
+
+    def __init__(self, connect=5, read=30, total=None, stall=60):
+        self.connect = connect  # 建立连接的超时
+        self.read = read  # 发出请求后等待服务器响应的超时
+        self.total = total  # 单个文件上传/下载(包括重试)的总用时上限
+        self.stall = stall  # 上传/下载过程中连续没有数据传输的最长时间
+
+    def __repr__(self):
+        return f'TimeoutPolicy(connect={self.connect}, read={self.read}, total={self.total}, stall={self.stall})'
+
+    def replace(self, **kwargs):
+        """返回修改了部分设置的新对象"""
+        return TimeoutPolicy(**{**self.__dict__, **kwargs})
+
+    @property
+    def request(self):
+        """普通请求的 requests timeout 参数"""
+        return self.connect, self.read
+
+    @property
+    def stream(self):
+        """上传/下载文件时的 requests timeout 参数，每次读写 socket 都以 stall 为限"""
+        return self.connect, self.stall
+
+    def deadline(self):
+        """从现在开始计算的操作截止时间"""
+        return None if self.total is None else time() + self.total
+
+
+class TransferProgress(object):
+    """单个文件上传/下载的进度(线程安全)，计算传输速度和剩余时间，并限制通知的频率"""
+
+    def __init__(self, min_bytes=1048576, interval=0.5):
+        self._min_bytes = min_bytes  # 每传输 min_bytes 字节或每隔 interval 秒通知一次，传输完成时一定通知
+        self._interval = interval
+        self.total_size = 0
+        self.now_size = 0
+        self.rate = 0  # 平滑后的传输速度 bytes/s
+        self._last_size = None
+        self._last_time = time()
+        self._lock = threading.Lock()
+
+    @property
+    def eta(self):
+        """预计剩余时间 s，还不知道速度时为 None"""
+        if not self.rate:
+            return None
+        return max(self.total_size - self.now_size, 0) / self.rate
+
+    def update(self, total_size, now_size):
+        """更新进度，需要通知时返回 True"""
+        now = time()
+        with self._lock:
+            self.total_size = total_size
+            self.now_size = now_size
+            if self._last_size is None:  # 第一次更新(断点续传时从 now_size 开始)
+                self._last_size = now_size
+                self._last_time = now
+                return True
+            elapsed = now - self._last_time
+            if now_size < total_size and now_size - self._last_size < self._min_bytes and elapsed < self._interval:
+                return False
+            if elapsed > 0 and now_size >= self._last_size:
+                rate = (now_size - self._last_size) / elapsed
+                self.rate = rate if not self.rate else 0.7 * self.rate + 0.3 * rate
+            self._last_size = now_size
+            self._last_time = now
+            return True
+
+
+class FileSlice(object):
+    """文件中 [offset, offset + size) 范围内的只读视图，上传分卷时不需要在本地生成分卷文件"""
+
+    def __init__(self, path, offset, size):
+        self._f = open(path, 'rb')
+        self._f.seek(offset)
+        self._offset = offset
+        self._size = max(min(size, os.path.getsize(path) - offset), 0)
+        self._pos = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def len(self):
+        """剩余未读取的字节数(requests_toolbelt 通过该属性计算上传数据的长度)"""
+        return self._size - self._pos
+
+    def read(self, size=-1):
+        remain = self._size - self._pos
+        if size is None or size < 0 or size > remain:
+            size = remain
+        data = self._f.read(size)
+        self._pos += len(data)
+        return data
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos):
+        """移动到片段中的 pos 处(重新上传时回到开头)"""
+        self._pos = max(min(pos, self._size), 0)
+        self._f.seek(self._offset + self._pos)
+
+    def close(self):
+        self._f.close()
+
+
+class HashReader(object):
+    """边读取边计算 md5 的只读文件包装，上传时顺便得到文件内容的摘要，不需要再读一遍文件"""
+
+    def __init__(self, f, size):
+        self._f = f
+        self._size = size
+        self._pos = 0
+        self._md5 = hashlib.md5()
+
+    @property
+    def len(self):
+        """剩余未读取的字节数(requests_toolbelt 通过该属性计算上传数据的长度)"""
+        return self._size - self._pos
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self._pos += len(data)
+        self._md5.update(data)
+        return data
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos):
+        """回到开头重新读取(重新上传时)，md5 也重新计算，只支持 pos=0"""
+        if pos != 0:
+            raise ValueError('HashReader can only seek to 0')
+        self._f.seek(self._f.tell() - self._pos)
+        self._pos = 0
+        self._md5 = hashlib.md5()
+
+    def hexdigest(self):
+        """已读取内容的 md5，读完整个文件后就是文件的 md5"""
+        return self._md5.hexdigest()
+
+
+class LazyModule(object):
+    """第一次访问属性时才导入的模块，用于导入较慢且不一定用到的依赖"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)  # import 本身有锁，多线程同时访问也只导入一次
+        return getattr(self._module, attr)
+
+
+def load_json(path, default=None):
+    """读取 json 文件，文件不存在或已损坏时返回 default"""
+    try:
+        with open(path, 'r', encoding='utf8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def dump_json(path, obj, mode=None):
+    """写入 json 文件(先写临时文件再替换，避免中途退出导致文件损坏)，mode 为新文件的权限，如 0o600"""
+    tmp_path = path + '.tmp'
+    try:
+        if mode is None:
+            f = open(tmp_path, 'w', encoding='utf8')
+        else:  # 创建时就设置权限，写入内容前其他用户不能读取
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            f = os.fdopen(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode), 'w', encoding='utf8')
+        with f:
+            json.dump(obj, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return True
+    except OSError:
+        return False
+
+
+def file_hash(path, chunk_size=1048576):
+    """计算文件内容的 md5"""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
@@ -17,6 +17,9 @@ setuptools.setup(
         "requests",
         "requests_toolbelt"
     ],
+    extras_require={
+        "async": ["aiohttp"]
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",